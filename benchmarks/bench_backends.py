@@ -0,0 +1,100 @@
+"""推論バックエンドのベンチマーク
+
+同じクリップ群を各バックエンドで文字起こしし、モデルロード時間・文字起こし時間・
+RTF・ピークメモリを比較します。バックエンドごとに別プロセスで実行するため、
+ロード済みモデルやメモリ使用量が互いに影響しません。キャッシュは使用しません。
+
+    python benchmarks/bench_backends.py clip1.mp4 clip2.mp4 --backends whisper whisper-int8 --threads 8
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.backends import BACKENDS
+from utils.instrumentation import peak_rss_bytes
+
+def run_backend(backend, clips, model_name, device, num_threads):
+    """1バックエンド分の計測（子プロセスで実行）"""
+    from whisper_integration import WhisperTranscriber
+
+    transcriber = WhisperTranscriber(model_name=model_name, use_gpu=device != 'cpu',
+                                     backend=backend, num_threads=num_threads)
+    started = time.perf_counter()
+    transcriber.wait_for_model()
+    load_seconds = time.perf_counter() - started
+
+    files = []
+    for clip in clips:
+        audio = transcriber.load_audio(clip)
+        started = time.perf_counter()
+        result = transcriber.transcribe(clip, audio=audio)
+        elapsed = time.perf_counter() - started
+        files.append({
+            'file': clip,
+            'audio_seconds': round(result['duration'], 3),
+            'transcribe_seconds': round(elapsed, 3),
+            'segments': len(result['segments']),
+            'text': result['text']
+        })
+
+    audio_total = sum(f['audio_seconds'] for f in files)
+    transcribe_total = sum(f['transcribe_seconds'] for f in files)
+    return {
+        'backend': backend,
+        'device': transcriber.device,
+        'precision': transcriber.precision,
+        'load_seconds': round(load_seconds, 3),
+        'transcribe_seconds': round(transcribe_total, 3),
+        'rtf': round(transcribe_total / audio_total, 4) if audio_total else None,
+        'peak_rss_mb': round(peak_rss_bytes() / 1024**2, 1),
+        'files': files
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('clips', nargs='+', help='計測に使う動画/音声ファイル')
+    parser.add_argument('--backends', nargs='+', choices=tuple(BACKENDS), default=list(BACKENDS))
+    parser.add_argument('--model', default='small')
+    parser.add_argument('--device', choices=('auto', 'cpu', 'cuda'), default='cpu')
+    parser.add_argument('--threads', type=int, default=None, help='CPU推論のスレッド数')
+    parser.add_argument('--output', default=None, help='結果のJSONを保存するパス')
+    parser.add_argument('--worker', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        # 子プロセス：結果のJSONだけを標準出力の最終行に書く
+        result = run_backend(args.worker, args.clips, args.model, args.device, args.threads)
+        print(json.dumps(result, ensure_ascii=False))
+        return
+
+    results = []
+    for backend in args.backends:
+        command = [sys.executable, os.path.abspath(__file__), *args.clips, '--worker', backend,
+                   '--model', args.model, '--device', args.device]
+        if args.threads:
+            command += ['--threads', str(args.threads)]
+        completed = subprocess.run(command, stdout=subprocess.PIPE, text=True, check=True)
+        results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    print(f"{'バックエンド':<16} {'精度':<6} {'ロード':>8} {'文字起こし':>10} {'RTF':>8} {'ピークRSS':>10}")
+    for result in results:
+        rtf = f"{result['rtf']:.3f}" if result['rtf'] is not None else '-'
+        print(f"{result['backend']:<16} {result['precision']:<6} {result['load_seconds']:>7.2f}秒 "
+              f"{result['transcribe_seconds']:>9.2f}秒 {rtf:>8} {result['peak_rss_mb']:>8.1f}MB")
+
+    # 基準（先頭のバックエンド）とのテキスト一致率
+    base = results[0]
+    for result in results[1:]:
+        same = sum(1 for a, b in zip(base['files'], result['files']) if a['text'] == b['text'])
+        print(f"{result['backend']}: {base['backend']}とテキストが一致したファイル {same}/{len(base['files'])}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""utils.formattersのマイクロベンチマーク
+
+旧実装（文字列の += 連結と timedelta による変換）と、現在のバッチ変換・
+ストリーミング書き込みを同じセグメント列で比較します。
+
+    python benchmarks/bench_formatters.py --entries 1000000
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.formatters import EDLFormatter, SRTFormatter
+
+def legacy_srt_timestamp(seconds):
+    time_ = timedelta(seconds=seconds)
+    hours = int(time_.total_seconds() // 3600)
+    minutes = int((time_.total_seconds() % 3600) // 60)
+    seconds = time_.total_seconds() % 60
+    return f"{hours:02d}:{minutes:02d}:{int(seconds):02d},{int((seconds % 1) * 1000):03d}"
+
+def legacy_srt_generate(segments, include_filename=False):
+    content = ""
+    for i, segment in enumerate(segments, 1):
+        if not SRTFormatter.is_valid_segment(segment):
+            continue
+        text = segment["text"].strip()
+        if include_filename and "file_name" in segment:
+            text = f"[{segment['file_name']}] {text}"
+        content += SRTFormatter.ENTRY_TEMPLATE.format(
+            number=i,
+            start_time=legacy_srt_timestamp(segment["start"]),
+            end_time=legacy_srt_timestamp(segment["end"]),
+            text=text
+        )
+    return content
+
+def legacy_edl_timecode(seconds):
+    hours = int(seconds // 3600)
+    minutes = int((seconds % 3600) // 60)
+    secs = int(seconds % 60)
+    frames = min(int((seconds % 1) * 24), 23)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}:{frames:02d}"
+
+def legacy_edl_generate(segments, title="Audio Transcription"):
+    content = EDLFormatter.HEADER_TEMPLATE.format(title=title)
+    for i, segment in enumerate(segments, 1):
+        if not EDLFormatter.is_valid_segment(segment):
+            continue
+        content += EDLFormatter.ENTRY_TEMPLATE.format(
+            number=i,
+            start_tc=legacy_edl_timecode(segment["start"]),
+            end_tc=legacy_edl_timecode(segment["end"]),
+            clip_name=segment.get("file_name", "")
+        )
+    return content
+
+def make_segments(count, seed=0):
+    """単語レベル相当の短いセグメントを生成"""
+    rng = random.Random(seed)
+    segments = []
+    t = 0.0
+    for _ in range(count):
+        duration = rng.uniform(0.1, 0.6)
+        segments.append({"start": t, "end": t + duration, "text": " word", "file_name": "clip.mp4"})
+        t += duration + rng.uniform(0.0, 0.2)
+    return segments
+
+def measure(label, func):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<36} {elapsed:8.3f}秒")
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--entries', type=int, default=1_000_000, help='セグメント数')
+    args = parser.parse_args()
+
+    segments = make_segments(args.entries)
+    print(f"エントリ数: {args.entries:,}")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        def write_legacy_srt():
+            with open(os.path.join(temp_dir, 'legacy.srt'), 'w', encoding='utf-8') as f:
+                f.write(legacy_srt_generate(segments, include_filename=True))
+
+        def write_streaming_srt():
+            with open(os.path.join(temp_dir, 'stream.srt'), 'w', encoding='utf-8') as f:
+                SRTFormatter.write(segments, f, include_filename=True)
+
+        def write_legacy_edl():
+            with open(os.path.join(temp_dir, 'legacy.edl'), 'w', encoding='utf-8') as f:
+                f.write(legacy_edl_generate(segments))
+
+        def write_streaming_edl():
+            with open(os.path.join(temp_dir, 'stream.edl'), 'w', encoding='utf-8') as f:
+                EDLFormatter.write(segments, f)
+
+        legacy_srt = measure('SRT 旧実装 (+= / timedelta)', write_legacy_srt)
+        stream_srt = measure('SRT ストリーミング (バッチ変換)', write_streaming_srt)
+        legacy_edl = measure('EDL 旧実装 (+=)', write_legacy_edl)
+        stream_edl = measure('EDL ストリーミング (バッチ変換)', write_streaming_edl)
+
+    print(f"\n高速化: SRT {legacy_srt / stream_srt:.2f}倍, EDL {legacy_edl / stream_edl:.2f}倍")
+
+if __name__ == '__main__':
+    main()
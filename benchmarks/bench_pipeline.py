@@ -0,0 +1,276 @@
+"""パイプライン全体のベンチマーク
+
+ffmpegのlavfiで疑似音声（2秒発話・1秒無音の周期で、抑揚のある倍音にピンクノイズを
+重ねた音）付きの動画をオフラインで生成し、probe・音声抽出・VAD・文字起こし・
+各フォーマッタ・結合の各ステージを個別に計測します。ステージごとに所要時間・RTF・
+RSSの最大増加量を記録し、保存済みのベースラインと比較して遅くなったステージを報告します。
+
+    python benchmarks/bench_pipeline.py --durations 10s 60s 10m 2h --save-baseline baseline.json
+    python benchmarks/bench_pipeline.py --durations 10s 60s 10m 2h --baseline baseline.json
+
+文字起こしは既定でモデルを使わないスタブ（VADの発話区間から決定的にセグメントを生成）です。
+--model tiny などを指定すると実際のWhisperモデルで計測します。
+回帰があれば終了コード1を返します。
+
+所要時間はマシンに依存するため、ベースラインはリポジトリに含めません。比較に使うマシンで
+変更前のコードから --save-baseline で作成し、同じ --durations で比較してください。
+レポートのenvironment（Python・numpy・OS・CPU数・ffmpeg）がベースラインと異なる場合は警告します。
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import threading
+import subprocess
+import numpy as np
+import psutil
+import ffmpeg
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.audio import AudioLoader, SAMPLE_RATE
+from utils.vad import EnergyVAD, pack_windows
+from utils.formatters import EDLFormatter, SRTFormatter, MLTFormatter
+from utils.timeline import CombinedTimelineBuilder
+from utils.word_store import WordStore
+from utils.instrumentation import peak_rss_bytes
+
+DEFAULT_DURATIONS = ['10s', '60s', '10m', '2h']
+DEFAULT_FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.fixtures')
+STUB_SEGMENT_SECONDS = 2.5
+
+# 2秒発話・1秒無音。基本周波数を揺らした倍音で音声のスペクトルに近づける
+SPEECH_EXPR = ("(0.3*sin(2*PI*(140+30*sin(2*PI*0.7*t))*t)+0.15*sin(2*PI*(420+60*sin(2*PI*1.3*t))*t)"
+               "+0.05*sin(2*PI*1800*t))*lt(mod(t,3),2)")
+
+def parse_duration(text):
+    """'10s' / '10m' / '2h' / '90' を秒数に変換"""
+    units = {'s': 1, 'm': 60, 'h': 3600}
+    if text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(float(text))
+
+def make_fixture(path, seconds):
+    """疑似音声付きの動画をlavfiで生成（320x240・24fpsの黒画面 + AAC 48kHz）"""
+    speech = ffmpeg.input(f"aevalsrc=exprs='{SPEECH_EXPR}':s=48000:d={seconds}", f='lavfi')
+    noise = ffmpeg.input(f"anoisesrc=color=pink:amplitude=0.02:sample_rate=48000:duration={seconds}", f='lavfi')
+    audio = ffmpeg.filter([speech, noise], 'amix', inputs=2, duration='shortest')
+    video = ffmpeg.input(f"color=c=black:s=320x240:r=24:d={seconds}", f='lavfi')
+    temp_path = f"{path}.tmp.mp4"
+    (
+        ffmpeg
+        .output(video, audio, temp_path, vcodec='libx264', preset='ultrafast', acodec='aac',
+                audio_bitrate='96k', loglevel='error')
+        .overwrite_output()
+        .run()
+    )
+    os.replace(temp_path, path)
+
+def ensure_fixtures(durations, fixtures_dir):
+    """フィクスチャを生成（生成済みなら再利用）して [(名前, パス, 秒数)] を返す"""
+    os.makedirs(fixtures_dir, exist_ok=True)
+    fixtures = []
+    for text in durations:
+        seconds = parse_duration(text)
+        name = f"speech_{seconds}s"
+        path = os.path.join(fixtures_dir, f"{name}.mp4")
+        if not os.path.exists(path):
+            print(f"フィクスチャを生成中: {name}", file=sys.stderr)
+            make_fixture(path, seconds)
+        fixtures.append((name, path, seconds))
+    return fixtures
+
+class RSSSampler:
+    """with区間中のRSSを別スレッドで定期取得し、開始時からの最大増加量を記録"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.process = psutil.Process()
+        self.peak_delta = 0
+
+    def _run(self, baseline):
+        while not self._stop.is_set():
+            self.peak_delta = max(self.peak_delta, self.process.memory_info().rss - baseline)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._stop = threading.Event()
+        baseline = self.process.memory_info().rss
+        self._thread = threading.Thread(target=self._run, args=(baseline,), daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+def measure(stages, name, audio_seconds, func):
+    """funcを1回実行し、所要時間・RTF・RSS増加量をstagesに記録して戻り値を返す"""
+    with RSSSampler() as sampler:
+        started = time.perf_counter()
+        value = func()
+        elapsed = time.perf_counter() - started
+    stages[name] = {
+        'seconds': round(elapsed, 4),
+        'rtf': round(elapsed / audio_seconds, 6) if audio_seconds else None,
+        'peak_rss_delta_mb': round(sampler.peak_delta / 1024**2, 1)
+    }
+    print(f"  {name:<28} {elapsed:9.3f}秒  RSS +{sampler.peak_delta / 1024**2:8.1f}MB", file=sys.stderr)
+    return value
+
+def blocks(audio, block_seconds=30.0):
+    """AudioLoader.streamと同じ大きさのブロックに分けたビュー"""
+    size = int(block_seconds * SAMPLE_RATE)
+    return (audio[i:i + size] for i in range(0, len(audio), size))
+
+def stub_transcribe(audio, file_name):
+    """モデルを使わない文字起こしのスタブ（VADの発話区間をSTUB_SEGMENT_SECONDSごとのセグメントにする）"""
+    segments = []
+    for window in pack_windows(EnergyVAD().regions(blocks(audio))):
+        t = 0.0
+        while t < window.duration:
+            end = min(t + STUB_SEGMENT_SECONDS, window.duration)
+            words = []
+            step = (end - t) / 4
+            for k in range(4):
+                words.append({'word': f"単語{k}", 'start': t + step * k, 'end': t + step * (k + 1),
+                              'probability': 0.9})
+            segment = window.remap_segment({'start': t, 'end': end, 'text': f"テスト発話{len(segments)}",
+                                            'words': words})
+            segment['file_name'] = file_name
+            segments.append(segment)
+            t = end
+    return {'segments': segments, 'text': ''.join(segment['text'] for segment in segments)}
+
+def run_fixture(name, path, seconds, transcriber, output_dir):
+    print(f"{name}（{seconds}秒）", file=sys.stderr)
+    stages = {}
+    file_name = os.path.basename(path)
+    probe = measure(stages, 'probe', seconds, lambda: AudioLoader.probe(path)[0])
+    audio = measure(stages, 'extract', seconds,
+                    lambda: AudioLoader.load(path, expected_duration=AudioLoader.get_duration(probe)))
+    measure(stages, 'vad', seconds, lambda: sum(1 for _ in pack_windows(EnergyVAD().regions(blocks(audio)))))
+    if transcriber is None:
+        result = measure(stages, 'transcribe', seconds, lambda: stub_transcribe(audio, file_name))
+    else:
+        result = measure(stages, 'transcribe', seconds, lambda: transcriber.transcribe(path, audio=audio))
+        for segment in result['segments']:
+            segment['file_name'] = file_name
+    segments = result['segments']
+    del audio
+
+    def write(extension, writer):
+        with open(os.path.join(output_dir, f"{name}.{extension}"), 'w', encoding='utf-8') as f:
+            writer(f)
+
+    measure(stages, 'format.srt', seconds, lambda: write('srt', lambda f: SRTFormatter.write(segments, f, True)))
+    measure(stages, 'format.edl', seconds, lambda: write('edl', lambda f: EDLFormatter.write(segments, f, name)))
+    measure(stages, 'format.mlt', seconds, lambda: write('mlt', lambda f: MLTFormatter.write({path: segments}, f)))
+    measure(stages, 'format.words', seconds,
+            lambda: WordStore.from_segments(segments).save(os.path.join(output_dir, f"{name}.words.npz")))
+    return {'duration': seconds, 'segments': len(segments), 'stages': stages}, segments
+
+def run_combine(clips, output_dir):
+    """全フィクスチャを結合（初回の全書き出しと、最後のクリップだけ変えた差分書き出し）"""
+    print("結合", file=sys.stderr)
+    stages = {}
+    total = sum(clip['duration'] for clip in clips)
+    for extension in CombinedTimelineBuilder.FORMATS:
+        output_path = os.path.join(output_dir, f"combined.{extension}")
+        for stale in (output_path, f"{output_path}.manifest.json"):
+            if os.path.exists(stale):
+                os.remove(stale)
+        builder = CombinedTimelineBuilder(output_path, extension)
+        measure(stages, f'combine.{extension}', total, lambda: builder.build(clips))
+        changed = clips[:-1] + [dict(clips[-1], segments=clips[-1]['segments'][:-1])]
+        measure(stages, f'combine.{extension}.incremental', total, lambda: builder.build(changed))
+    return {'duration': total, 'stages': stages}
+
+def environment():
+    try:
+        ffmpeg_version = subprocess.run(['ffmpeg', '-version'], stdout=subprocess.PIPE,
+                                        text=True).stdout.splitlines()[0]
+    except (OSError, IndexError):
+        ffmpeg_version = None
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'ffmpeg': ffmpeg_version
+    }
+
+def compare(report, baseline, tolerance, min_delta):
+    """ベースラインと比較し、遅くなったステージのリストを返す"""
+    regressions = []
+    differs = [key for key, value in report['environment'].items()
+               if baseline.get('environment', {}).get(key) != value]
+    if differs:
+        print(f"警告: ベースラインと実行環境が異なります（{', '.join(differs)}）。比較は参考値です")
+    print(f"\n{'フィクスチャ':<18} {'ステージ':<26} {'基準':>9} {'今回':>9} {'比':>7}")
+    for name, fixture in report['fixtures'].items():
+        base_fixture = baseline.get('fixtures', {}).get(name)
+        if base_fixture is None:
+            continue
+        for stage, current in fixture['stages'].items():
+            base = base_fixture['stages'].get(stage)
+            if base is None:
+                continue
+            ratio = current['seconds'] / base['seconds'] if base['seconds'] else float('inf')
+            regressed = ratio > 1 + tolerance and current['seconds'] - base['seconds'] > min_delta
+            mark = '  ← 回帰' if regressed else ''
+            print(f"{name:<18} {stage:<26} {base['seconds']:>8.3f}秒 {current['seconds']:>8.3f}秒 {ratio:>6.2f}倍{mark}")
+            if regressed:
+                regressions.append({'fixture': name, 'stage': stage, 'baseline': base['seconds'],
+                                    'current': current['seconds'], 'ratio': round(ratio, 3)})
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--durations', nargs='+', default=DEFAULT_DURATIONS, help='フィクスチャの長さ（10s / 10m / 2h）')
+    parser.add_argument('--fixtures-dir', default=DEFAULT_FIXTURES_DIR, help='フィクスチャの保存先（再利用される）')
+    parser.add_argument('--model', default=None, help='Whisperモデル名（省略時はスタブで計測）')
+    parser.add_argument('--output', default=None, help='レポートのJSONを保存するパス')
+    parser.add_argument('--baseline', default=None, help='比較するベースラインのJSON')
+    parser.add_argument('--save-baseline', default=None, help='今回の結果をベースラインとして保存するパス')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='回帰とみなす遅延の割合（既定: 10%%）')
+    parser.add_argument('--min-delta', type=float, default=0.05, help='回帰とみなす最小の差（秒）')
+    args = parser.parse_args()
+
+    fixtures = ensure_fixtures(args.durations, args.fixtures_dir)
+    transcriber = None
+    if args.model:
+        from whisper_integration import WhisperTranscriber
+        transcriber = WhisperTranscriber(model_name=args.model, use_gpu=False)
+        transcriber.wait_for_model()
+
+    report = {'environment': environment(), 'model': args.model or 'stub', 'fixtures': {}}
+    clips = []
+    with tempfile.TemporaryDirectory() as output_dir:
+        for name, path, seconds in fixtures:
+            report['fixtures'][name], segments = run_fixture(name, path, seconds, transcriber, output_dir)
+            clips.append({'path': path, 'duration': float(seconds), 'segments': segments})
+        if clips:
+            report['fixtures']['combined'] = run_combine(clips, output_dir)
+    report['peak_rss_mb'] = round(peak_rss_bytes() / 1024**2, 1)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare(report, json.load(f), args.tolerance, args.min_delta)
+        report['regressions'] = regressions
+        print(f"\n回帰: {len(regressions)}件" if regressions else "\n回帰はありません")
+
+    content = json.dumps(report, ensure_ascii=False, indent=2)
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(content)
+    if not args.output:
+        print(content)
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,338 @@
+"""Whisper 文字起こしツール（コマンドライン版）
+
+GUIなしでVideoProcessor.process_filesを実行し、最後にJSON形式の実行レポートを出力します。
+
+    python cli.py /path/to/folder --formats srt edl --model small --device cpu --report report.json
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import contextlib
+from whisper_integration import WhisperTranscriber, DECODE_PRESETS
+from utils.cache import TranscriptionCache
+from utils.audio import AudioExtractor
+from utils.postprocess import SegmentPostProcessor
+from utils.instrumentation import Instrumentation, peak_rss_bytes
+from utils.backends import BACKENDS, DEFAULT_BACKEND
+from utils.media_index import MediaIndex, DEFAULT_EXTENSIONS
+from utils.word_store import PhraseIndex, PHRASE_INDEX_NAME
+from utils.devices import DeviceManager, SimulatedDevice
+from gui.processor import VideoProcessor
+from gui.watcher import FolderWatcher
+from utils.remote import RemoteCoordinator, RemoteWorker
+
+FORMATS = ('srt', 'edl', 'mlt')
+
+def create_logger():
+    logger = logging.getLogger('WhisperCLI')
+    logger.setLevel(logging.INFO)
+    if not logger.handlers:
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+        logger.addHandler(handler)
+    return logger
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description='動画ファイル/フォルダを文字起こしし、JSONの実行レポートを出力します')
+    parser.add_argument('path', nargs='?', help='動画ファイルまたはフォルダ（--workerでは不要）')
+    parser.add_argument('--formats', nargs='+', choices=FORMATS, default=['srt', 'edl'],
+                        help='出力フォーマット（既定: srt edl）')
+    parser.add_argument('--recursive', '-r', action='store_true', help='サブフォルダも含めて処理')
+    parser.add_argument('--extensions', nargs='+', default=list(DEFAULT_EXTENSIONS),
+                        help='対象の拡張子（大文字小文字は区別しない。既定: .mp4 .mov .avi）')
+    parser.add_argument('--probe-workers', type=int, default=None, help='probeの並列数')
+    parser.add_argument('--force', action='store_true', help='キャッシュや既存SRTを無視して再文字起こし')
+    parser.add_argument('--model', default='small', help='Whisperモデル名（既定: small）')
+    parser.add_argument('--device', choices=('auto', 'cpu', 'cuda'), default='auto',
+                        help='推論デバイス（既定: auto）')
+    parser.add_argument('--simulate-gpu-mb', type=float, default=None,
+                        help='指定した空きメモリ（MB）のGPUを模擬して実行（計算はCPU。メモリ不足時の動作確認用）')
+    parser.add_argument('--allow-model-downgrade', action='store_true',
+                        help='GPUメモリに収まらない場合に小さいモデルへ切り替える（既定はCPUで実行）')
+    parser.add_argument('--backend', choices=tuple(BACKENDS), default=DEFAULT_BACKEND,
+                        help=f'推論バックエンド（既定: {DEFAULT_BACKEND}。whisper-int8はCPU専用）')
+    parser.add_argument('--language', default=None,
+                        help='言語コード（ja, enなど。省略時はファイルごとに事前判定）')
+    parser.add_argument('--preset', choices=('auto',) + tuple(DECODE_PRESETS), default='auto',
+                        help='デコード設定（auto: 言語判定の確からしさで選択、fast: 貪欲法、accurate: ビームサーチ）')
+    parser.add_argument('--threads', type=int, default=None,
+                        help='CPU推論のスレッド数（ワーカープロセスごと。省略時は自動）')
+    parser.add_argument('--batch-size', type=int, default=1,
+                        help='1回のデコードにまとめる30秒ウィンドウ数（2以上で短いクリップをまとめて処理）')
+    parser.add_argument('--extract-workers', type=int, default=None, help='音声抽出ワーカー数')
+    parser.add_argument('--transcribe-workers', type=int, default=1,
+                        help='文字起こしワーカー数（CPUのみ。2以上でモデルを複製したプロセスを使用）')
+    parser.add_argument('--dedupe', action='store_true',
+                        help='同じ音声を含むファイル（プロキシ・別形式の書き出し・マルチカム）を1回だけ文字起こし')
+    parser.add_argument('--demux-dir', default=None,
+                        help='音声ストリームだけをこのフォルダにストリームコピーしてから変換（共有ストレージ上の大きな素材向け）')
+    parser.add_argument('--reads-per-volume', type=int, default=None,
+                        help='同じストレージボリュームから同時に読み込むファイル数の上限')
+    parser.add_argument('--buffer-dir', default=None,
+                        help='抽出した音声を共有する一時ファイルの場所（既定: 一時フォルダ。/dev/shmでメモリ上に置く）')
+    parser.add_argument('--incremental', action='store_true',
+                        help='再書き出しされたファイルは前回の版から変わった区間だけを文字起こし（キャッシュが必要）')
+    parser.add_argument('--chunked', action='store_true', help='無音をスキップして分割認識（長時間収録向け）')
+    parser.add_argument('--save-audio', action='store_true', help='抽出した音声をWAVとして保存')
+    parser.add_argument('--no-cache', action='store_true', help='文字起こしキャッシュを使用しない')
+    parser.add_argument('--cache-dir', default=None, help='キャッシュの保存先')
+    parser.add_argument('--report', default=None, help='レポートの出力先（省略時は標準出力）')
+    parser.add_argument('--metrics', default=None, help='計測スパンをJSON Linesで出力するパス')
+    parser.add_argument('--profile', action='store_true', help='文字起こしスパンをcProfileで計測')
+    parser.add_argument('--profile-dir', default=None, help='cProfileの出力先（既定: ./profiles）')
+    parser.add_argument('--search', default=None, metavar='PHRASE',
+                        help='文字起こし済みの単語からフレーズを検索して結果をJSONで出力（文字起こしはしない）')
+    parser.add_argument('--resegment', action='store_true',
+                        help='保存済みの単語タイムスタンプから字幕を区切り直す（モデルは使用しない）')
+    parser.add_argument('--max-chars', type=int, default=None,
+                        help='1キューの最大文字数（超えるキューは単語の時刻で分割。--resegmentでも使用）')
+    parser.add_argument('--max-duration', type=float, default=None,
+                        help='1キューの最大秒数（超えるキューは単語の時刻で分割。--resegmentでも使用）')
+    parser.add_argument('--max-cps', type=float, default=None,
+                        help='1秒あたりの最大文字数（超えるキューは次のキューまで表示を延ばす）')
+    parser.add_argument('--max-compression-ratio', type=float, default=None,
+                        help='テキストの圧縮率がこれを超える（同じ語の繰り返しになった）キューを除く（例: 2.4、既定: 除かない）')
+    parser.add_argument('--no-postprocess', action='store_true',
+                        help='繰り返しの除去・短いキューの結合などの後処理を行わない（空のセグメントの除外と重なりの切り詰めのみ）')
+    parser.add_argument('--watch', action='store_true',
+                        help='フォルダ以下を監視し、新規・変更された動画を処理し続ける（Ctrl+Cで終了）')
+    parser.add_argument('--interval', type=float, default=10.0, help='監視モードの走査間隔（秒）')
+    parser.add_argument('--stable-seconds', type=float, default=10.0,
+                        help='監視モードでサイズと更新時刻が変わらなくなってから処理するまでの秒数')
+    parser.add_argument('--max-attempts', type=int, default=3, help='監視モードで失敗したジョブの試行回数の上限')
+    parser.add_argument('--remote-port', type=int, default=None,
+                        help='コーディネーターとしてこのポートで待ち受け、文字起こしをリモートワーカーに分配')
+    parser.add_argument('--remote-host', default='127.0.0.1',
+                        help='コーディネーターの待ち受けアドレス（他のマシンのワーカーには0.0.0.0などを明示、既定: 127.0.0.1）')
+    parser.add_argument('--remote-slots', type=int, default=4, help='リモートワーカーに同時に投入するジョブ数')
+    parser.add_argument('--worker', default=None, metavar='URL',
+                        help='リモートワーカーとして起動し、コーディネーター（http://host:port）のジョブを処理')
+    parser.add_argument('--token', default=os.environ.get('WHISPER_REMOTE_TOKEN'),
+                        help='コーディネーターとワーカーの共有トークン（既定: 環境変数 WHISPER_REMOTE_TOKEN、'
+                             '無ければコーディネーターが生成してログに出力）')
+    parser.add_argument('--journal', default=None, help='ジョブ記録のパス（既定: <フォルダ>/.whisper_jobs.sqlite3）')
+    return parser.parse_args(argv)
+
+def build_report(args, processor, device, wall_seconds):
+    instrumentation = processor.transcriber.instrumentation
+    files = []
+    for entry in processor.results:
+        summary = instrumentation.file_summary(entry['file_path'])
+        files.append({
+            'file': entry['file_path'],
+            'success': entry['success'],
+            'error': entry['error'],
+            'cached': entry.get('cached', False),
+            'duplicate_of': entry.get('duplicate_of'),
+            'language': (entry['result'] or {}).get('language'),
+            'preset': (entry['result'] or {}).get('preset'),
+            'no_speech': (entry['result'] or {}).get('no_speech', False),
+            'incremental': (entry['result'] or {}).get('incremental'),
+            'audio_seconds': round(summary['counters'].get('audio_seconds', 0.0), 3),
+            'segments': int(summary['counters'].get('segments', 0)),
+            'timings': {stage: round(seconds, 4) for stage, seconds in summary['timings'].items()},
+            'total_seconds': round(summary['total_seconds'], 4),
+            'rtf': round(summary['rtf'], 4) if summary['rtf'] is not None else None
+        })
+
+    audio_total = sum(f['audio_seconds'] for f in files)
+    return {
+        'path': os.path.abspath(args.path),
+        'model': processor.transcriber.model_name,
+        'backend': processor.transcriber.backend.name,
+        'precision': processor.transcriber.precision,
+        'threads': processor.transcriber.num_threads,
+        'batch_size': processor.transcriber.batch_size,
+        'language': processor.transcriber.language or 'auto',
+        'preset': processor.transcriber.preset,
+        'device': device,
+        'formats': args.formats,
+        'force_transcribe': args.force,
+        'workers': {'extract': processor.scheduler.extract_workers if processor.scheduler else 0,
+                    'transcribe': processor.scheduler.transcribe_workers if processor.scheduler else 0},
+        'files': files,
+        'stages': {name: {k: round(v, 4) for k, v in stage.items()}
+                   for name, stage in instrumentation.stage_summary().items()},
+        'totals': {
+            'files': len(files),
+            'succeeded': sum(1 for f in files if f['success']),
+            'failed': sum(1 for f in files if not f['success']),
+            'cached': sum(1 for f in files if f['cached']),
+            'no_speech': sum(1 for f in files if f['no_speech']),
+            'audio_seconds': round(audio_total, 3),
+            'wall_seconds': round(wall_seconds, 3),
+            # 並列処理を含めた実時間ベースのRTF
+            'rtf': round(wall_seconds / audio_total, 4) if audio_total else None
+        },
+        'peak_rss_mb': round(peak_rss_bytes() / 1024**2, 1)
+    }
+
+def search(args):
+    """フォルダの転置インデックスからフレーズを検索してJSONで出力"""
+    directory = args.path if os.path.isdir(args.path) else os.path.dirname(args.path)
+    index_path = os.path.join(directory, PHRASE_INDEX_NAME)
+    if not os.path.exists(index_path):
+        print(f"エラー: 検索インデックスがありません（先に文字起こしを実行してください）: {index_path}",
+              file=sys.stderr)
+        return 2
+    hits = PhraseIndex(index_path).search(args.search)
+    print(json.dumps({'phrase': args.search, 'hits': hits}, ensure_ascii=False, indent=2))
+    return 0
+
+def watch(args, processor, options, logger):
+    """監視モード：Ctrl+Cまで新規・変更された動画を処理し続ける"""
+    if not os.path.isdir(args.path):
+        print(f"エラー: 監視モードにはフォルダを指定してください: {args.path}", file=sys.stderr)
+        return 2
+    if processor.transcriber.cache is None:
+        logger.warning("キャッシュが無効なため、中断後の再開時は文字起こしからやり直します")
+    watcher = FolderWatcher(processor, args.path, journal_path=args.journal, interval=args.interval,
+                            stable_seconds=args.stable_seconds, max_attempts=args.max_attempts,
+                            extensions=tuple(args.extensions))
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            watcher.run(options, progress_callback=lambda progress: None, log_callback=logger.info)
+        except KeyboardInterrupt:
+            watcher.stop()
+            logger.info("監視を終了しました")
+    return 130
+
+def create_postprocessor(args, logger=None):
+    if args.no_postprocess:
+        return SegmentPostProcessor(max_repeats=None, min_duration=None, close_gap=None, logger=logger)
+    return SegmentPostProcessor(max_chars=args.max_chars, max_duration=args.max_duration, max_cps=args.max_cps,
+                                max_compression_ratio=args.max_compression_ratio, logger=logger)
+
+def worker(args, logger):
+    """リモートワーカーモード：Ctrl+Cまでコーディネーターのジョブを処理し続ける"""
+    device_manager = None
+    if args.simulate_gpu_mb:
+        device_manager = DeviceManager(SimulatedDevice(args.simulate_gpu_mb))
+    # 分割モードのジョブはワーカーが動画を直接読む
+    extractor = AudioExtractor(args.demux_dir, args.reads_per_volume)
+
+    def create_transcriber(model, backend, language, preset):
+        # キャッシュはコーディネーター側で管理する
+        return WhisperTranscriber(model_name=model or args.model, use_gpu=args.device != 'cpu', logger=logger,
+                                  backend=backend or args.backend, num_threads=args.threads,
+                                  batch_size=args.batch_size, device_manager=device_manager,
+                                  allow_model_downgrade=args.allow_model_downgrade,
+                                  language=language or args.language, preset=preset or args.preset,
+                                  extractor=extractor)
+
+    remote_worker = RemoteWorker(args.worker, create_transcriber, token=args.token, logger=logger)
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            remote_worker.run()
+        except KeyboardInterrupt:
+            remote_worker.stop()
+            logger.info("ワーカーを終了しました")
+    return 130
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.worker:
+        return worker(args, create_logger())
+    if args.path is None:
+        print("エラー: 動画ファイルまたはフォルダを指定してください", file=sys.stderr)
+        return 2
+    if not os.path.exists(args.path):
+        print(f"エラー: パスが見つかりません: {args.path}", file=sys.stderr)
+        return 2
+
+    if args.search is not None:
+        return search(args)
+    if args.incremental and args.no_cache:
+        print("エラー: --incremental は --no-cache と併用できません（前回の結果をキャッシュから使います）",
+              file=sys.stderr)
+        return 2
+
+    logger = create_logger()
+    cache = None if args.no_cache else TranscriptionCache(args.cache_dir)
+    media_index = MediaIndex(os.path.join(args.cache_dir, 'media_index.sqlite3') if args.cache_dir else None)
+    instrumentation = Instrumentation(profile=args.profile, profile_dir=args.profile_dir)
+    device_manager = None
+    if args.simulate_gpu_mb:
+        device_manager = DeviceManager(SimulatedDevice(args.simulate_gpu_mb))
+    transcriber = WhisperTranscriber(model_name=args.model, use_gpu=args.device != 'cpu', logger=logger,
+                                     cache=cache, instrumentation=instrumentation,
+                                     backend=args.backend, num_threads=args.threads,
+                                     batch_size=args.batch_size, media_index=media_index,
+                                     device_manager=device_manager,
+                                     allow_model_downgrade=args.allow_model_downgrade,
+                                     language=args.language, preset=args.preset,
+                                     extractor=AudioExtractor(args.demux_dir, args.reads_per_volume),
+                                     postprocessor=create_postprocessor(args, logger))
+    if args.device == 'cuda' and transcriber.device != 'cuda':
+        logger.warning("CUDAが利用できないためCPUで実行します")
+    processor = VideoProcessor(transcriber)
+    if args.remote_port is not None:
+        processor.remote = RemoteCoordinator(host=args.remote_host, port=args.remote_port, slots=args.remote_slots,
+                                             token=args.token, logger=logger).start()
+
+    options = {
+        'generate_edl': 'edl' in args.formats,
+        'generate_srt': 'srt' in args.formats,
+        'generate_mlt': 'mlt' in args.formats,
+        'force_transcribe': args.force,
+        'chunked': args.chunked,
+        'dedupe': args.dedupe,
+        'incremental': args.incremental,
+        'save_audio': args.save_audio,
+        'transcribe_workers': args.transcribe_workers,
+        'metrics_path': args.metrics,
+        'recursive': args.recursive,
+        'extensions': tuple(args.extensions)
+    }
+    if args.probe_workers:
+        options['probe_workers'] = args.probe_workers
+    if args.extract_workers:
+        options['extract_workers'] = args.extract_workers
+    if args.buffer_dir:
+        options['buffer_dir'] = args.buffer_dir
+
+    if args.watch:
+        return watch(args, processor, options, logger)
+    if args.resegment:
+        processor.resegment_files(args.path, options, logger.info,
+                                  max_chars=args.max_chars, max_duration=args.max_duration)
+        return 0
+
+    started = time.perf_counter()
+    interrupted = False
+    # Whisperの進捗表示などが標準出力のレポートに混ざらないようにする
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            processor.process_files(
+                args.path,
+                options,
+                progress_callback=lambda progress: None,
+                log_callback=logger.info
+            )
+        except KeyboardInterrupt:
+            processor.cancel()
+            interrupted = True
+            logger.warning("中断されました")
+        finally:
+            if processor.remote is not None:
+                processor.remote.stop()
+    report = build_report(args, processor, transcriber.device_manager.name, time.perf_counter() - started)
+
+    content = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            f.write(content)
+        logger.info(f"レポートを出力: {args.report}")
+    else:
+        print(content)
+
+    if interrupted:
+        return 130
+    return 0 if report['totals']['failed'] == 0 else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
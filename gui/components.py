@@ -1,9 +1,49 @@
 import tkinter as tk
 from tkinter import ttk, scrolledtext
 import time
+import queue
 import logging
 
+class UIEventQueue:
+    """ワーカースレッドからTkへログ・進捗を受け渡すスレッドセーフなキュー
+
+    ワーカー側はlog/progress/callを呼ぶだけでTkウィジェットには触れません。
+    メインループ側がdrainで定期的に取り出し、まとめて画面に反映します。
+    """
+
+    def __init__(self):
+        self._queue = queue.SimpleQueue()
+
+    def log(self, message, level=logging.INFO):
+        self._queue.put(('log', (message, time.strftime('%Y-%m-%d %H:%M:%S'))))
+
+    def progress(self, value):
+        self._queue.put(('progress', value))
+
+    def call(self, func, *args):
+        """メインスレッドで実行する処理を登録"""
+        self._queue.put(('call', (func, args)))
+
+    def drain(self, max_items=5000):
+        """溜まったイベントを取り出す：(ログのリスト, 最新の進捗またはNone, 呼び出しのリスト)"""
+        logs, calls = [], []
+        progress = None
+        for _ in range(max_items):
+            try:
+                kind, payload = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if kind == 'log':
+                logs.append(payload)
+            elif kind == 'progress':
+                progress = payload  # 途中の進捗は最新値にまとめる
+            else:
+                calls.append(payload)
+        return logs, progress, calls
+
 class LogFrame(ttk.LabelFrame):
+    MAX_LINES = 5000  # 各ログ欄に保持する最大行数
+
     def __init__(self, parent):
         super().__init__(parent, text='処理ログ', padding="5")
         self.create_widgets()
@@ -22,15 +62,26 @@ class LogFrame(ttk.LabelFrame):
         self.console_area.grid(row=0, column=0, padx=5, pady=5)
         
     def log(self, message, level=logging.INFO):
+        """メインスレッドから1件追加（ワーカースレッドからはUIEventQueue経由で渡す）"""
+        self.append_batch([(message, time.strftime('%Y-%m-%d %H:%M:%S'))])
+
+    def append_batch(self, entries):
+        """(メッセージ, 時刻) のリストをまとめて1回の挿入で追加"""
+        if not entries:
+            return
         # GUIログ
-        self.log_area.insert(tk.END, message + '\n')
-        self.log_area.see(tk.END)
-        
+        self._append(self.log_area, ''.join(f'{message}\n' for message, _ in entries))
+
         # コンソールログ
-        timestamp = time.strftime('%Y-%m-%d %H:%M:%S')
-        console_message = f'{timestamp} - {message}'
-        self.console_area.insert(tk.END, console_message + '\n')
-        self.console_area.see(tk.END)
+        self._append(self.console_area, ''.join(f'{timestamp} - {message}\n' for message, timestamp in entries))
+
+    def _append(self, area, text):
+        area.insert(tk.END, text)
+        # 古い行を削除してスクロールバックを制限
+        lines = int(area.index('end-1c').split('.')[0])
+        if lines > self.MAX_LINES:
+            area.delete('1.0', f'{lines - self.MAX_LINES + 1}.0')
+        area.see(tk.END)
 
 class ProgressFrame(ttk.LabelFrame):
     def __init__(self, parent):
@@ -45,7 +96,16 @@ class ProgressFrame(ttk.LabelFrame):
         
     def update_progress(self, progress):
         self.progress_var.set(progress)
-        self.update()
+
+    def set_busy(self, busy):
+        """進捗率が分からない処理（モデルロードなど）の間はバーを往復表示"""
+        if busy:
+            self.progress_bar.config(mode='indeterminate')
+            self.progress_bar.start(10)
+        else:
+            self.progress_bar.stop()
+            self.progress_bar.config(mode='determinate')
+            self.progress_var.set(0)
 
 class OptionFrame(ttk.LabelFrame):
     def __init__(self, parent):
@@ -64,10 +124,41 @@ class OptionFrame(ttk.LabelFrame):
         self.mlt_var = tk.BooleanVar(value=True)
         mlt_check = ttk.Checkbutton(self, text='MLTファイルを生成', variable=self.mlt_var)
         mlt_check.grid(row=0, column=2, padx=20)
+
+        self.chunked_var = tk.BooleanVar(value=False)
+        chunked_check = ttk.Checkbutton(self, text='無音をスキップして分割認識（長時間収録向け）', variable=self.chunked_var)
+        chunked_check.grid(row=0, column=3, padx=20)
+
+        self.recursive_var = tk.BooleanVar(value=False)
+        recursive_check = ttk.Checkbutton(self, text='サブフォルダも含める', variable=self.recursive_var)
+        recursive_check.grid(row=1, column=0, padx=20, sticky=tk.W)
+
+        self.dedupe_var = tk.BooleanVar(value=False)
+        dedupe_check = ttk.Checkbutton(self, text='重複した音声は1回だけ文字起こし', variable=self.dedupe_var)
+        dedupe_check.grid(row=1, column=1, padx=20, sticky=tk.W)
+
+        self.remote_var = tk.BooleanVar(value=False)
+        remote_check = ttk.Checkbutton(self, text='リモートワーカーに分配', variable=self.remote_var)
+        remote_check.grid(row=1, column=2, padx=20, sticky=tk.W)
+
+        self.incremental_var = tk.BooleanVar(value=False)
+        incremental_check = ttk.Checkbutton(self, text='変更された部分だけ再文字起こし', variable=self.incremental_var)
+        incremental_check.grid(row=1, column=3, padx=20, sticky=tk.W)
+
+        # 他のマシンのワーカーに公開する場合のみ0.0.0.0などに変更する
+        self.remote_host_var = tk.StringVar(value='127.0.0.1')
+        ttk.Label(self, text='リモートの待ち受けアドレス').grid(row=2, column=2, padx=20, sticky=tk.W)
+        ttk.Entry(self, textvariable=self.remote_host_var, width=16).grid(row=2, column=3, padx=20, sticky=tk.W)
         
     def get_options(self):
         return {
             'generate_edl': self.edl_var.get(),
             'generate_srt': self.srt_var.get(),
-            'generate_mlt': self.mlt_var.get()
+            'generate_mlt': self.mlt_var.get(),
+            'chunked': self.chunked_var.get(),
+            'recursive': self.recursive_var.get(),
+            'dedupe': self.dedupe_var.get(),
+            'remote': self.remote_var.get(),
+            'remote_host': self.remote_host_var.get().strip() or '127.0.0.1',
+            'incremental': self.incremental_var.get()
         } 
\ No newline at end of file
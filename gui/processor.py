@@ -1,10 +1,16 @@
 import os
 from pathlib import Path
 import logging
-import concurrent.futures
 import psutil
-import torch
-from utils.formatters import MLTFormatter
+import concurrent.futures
+from utils.formatters import MLTFormatter, SRTFormatter
+from utils.audio import AudioLoader, SAMPLE_RATE
+from utils.timeline import CombinedTimelineBuilder
+from utils.media_index import DEFAULT_EXTENSIONS, walk_media
+from utils.word_store import WordStore, PhraseIndex, PHRASE_INDEX_NAME
+from utils.fingerprint import AudioFingerprint, find_duplicates, project_segments, shift_segment
+from utils.audio_buffer import AudioBufferStore
+from gui.scheduler import PipelineScheduler
 
 class VideoProcessor:
     def __init__(self, transcriber):
@@ -12,102 +18,70 @@ class VideoProcessor:
         self.processing = False
         self.max_workers = min(psutil.cpu_count(logical=False) or 2, 4)
         self.all_segments = {}  # {video_path: [segments]} の辞書
+        self.durations = {}  # {video_path: 秒数}
+        self.results = []  # ファイルごとの処理結果
+        self.scheduler = None
+        self.phrase_index = None  # 単語ストアの転置インデックス（処理したフォルダ直下）
+        self.remote = None  # RemoteCoordinator（設定されていれば文字起こしをリモートワーカーに分配）
         
-    def process_single_file(self, video_path, options):
-        try:
-            if hasattr(torch.cuda, 'empty_cache'):
-                torch.cuda.empty_cache()
-                
-            result = self.transcriber.process_video(
-                video_path,
-                generate_edl=options['generate_edl'],
-                generate_srt=options['generate_srt'],
-                generate_mlt=False  # 単一ファイルでは個別MLT不要
-            )
-            return {
-                'success': True,
-                'file_path': video_path,
-                'result': result,
-                'error': None
-            }
-        except Exception as e:
-            return {
-                'success': False,
-                'file_path': video_path,
-                'result': None,
-                'error': str(e)
-            }
-            
     def process_files(self, path, options, progress_callback, log_callback):
         try:
             self.processing = True
             self.cancel_flag = False
+            self.all_segments = {}
+            self.durations = {}
+            self.results = []
+            instrumentation = self.transcriber.instrumentation
+            instrumentation.reset()
             directory = path if os.path.isdir(path) else os.path.dirname(path)
+            self.phrase_index = PhraseIndex(os.path.join(directory, PHRASE_INDEX_NAME))
             
-            # 結合ファイルのパスを設定
-            combined_edl = os.path.join(directory, 'combined.edl')
-            combined_srt = os.path.join(directory, 'combined.srt')
-            
-            # 既存のSRTファイルがない動画のみ文字起こしを実行
+            extensions = options.get('extensions', DEFAULT_EXTENSIONS)
+            recursive = options.get('recursive', False)
             video_files = []
             # 単一ファイルか確認
             if os.path.isfile(path):
                 video_files = [Path(path)]
                 log_callback(f"単一ファイルモード: {path}")
             else:
-                video_files = list(Path(directory).glob('*.mp4')) + list(Path(directory).glob('*.mov')) + list(Path(directory).glob('*.avi'))
-                log_callback(f"フォルダモード: {directory} ({len(video_files)}ファイル)")
+                video_files = self.find_videos(directory, extensions, recursive)
+                log_callback(f"フォルダモード: {directory} ({len(video_files)}ファイル"
+                             f"{'、サブフォルダを含む' if recursive else ''})")
+            video_files = self.discover(video_files, options, log_callback)
             
-            videos_needing_transcription = [
-                video for video in video_files 
-                if not video.with_suffix('.srt').exists() or options.get('force_transcribe', False)
-            ]
+            if self.transcriber.cache is not None:
+                # 再認識が必要かはキャッシュ（音声内容・モデル・設定）で判定
+                videos_needing_transcription = video_files
+            else:
+                # キャッシュ無効時は既存のSRTファイルがない動画のみ文字起こしを実行
+                videos_needing_transcription = [
+                    video for video in video_files 
+                    if not video.with_suffix('.srt').exists() or options.get('force_transcribe', False)
+                ]
             
             if videos_needing_transcription:
-                total_files = len(videos_needing_transcription)
-                for i, video_file in enumerate(videos_needing_transcription):
-                    if self.cancel_flag:
-                        log_callback("処理がキャンセルされました")
-                        break
-                    
-                    progress = (i / total_files) * 50
-                    progress_callback(progress)
-                    
-                    log_callback(f"文字起こし中 ({i+1}/{total_files}): {video_file.name}")
-                    
-                    try:
-                        result = self.transcriber.process_video(
-                            str(video_file),
-                            generate_edl=options['generate_edl'],
-                            generate_srt=options['generate_srt'],
-                            generate_mlt=False
-                        )
-                    except Exception as e:
-                        log_callback(f"エラー: {video_file.name} - {str(e)}")
-                        continue
+                self.transcribe_files(videos_needing_transcription, options, progress_callback, log_callback)
             else:
                 log_callback("全ての動画にSRTファイルが存在します。文字起こしをスキップします。")
                 progress_callback(50)
             
             if not self.cancel_flag:
-                # EDLファイルの結合
-                log_callback("EDLファイルを結合中...")
-                progress_callback(75)
-                if self.combine_files_by_extension(directory, 'edl', combined_edl):
-                    log_callback(f"EDLファイルを結合: {combined_edl}")
-                else:
-                    log_callback("警告: 結合可能なEDLファイルが見つかりませんでした")
-                
-                # SRTファイルの結合
-                log_callback("SRTファイルを結合中...")
-                progress_callback(90)
-                if self.combine_files_by_extension(directory, 'srt', combined_srt):
-                    log_callback(f"SRTファイルを結合: {combined_srt}")
+                if recursive and os.path.isdir(path):
+                    # 動画のあるフォルダごとに結合
+                    directories = sorted({str(video.parent) for video in self.find_videos(directory, extensions, True)})
                 else:
-                    log_callback("警告: 結合可能なSRTファイルが見つかりませんでした")
-                
+                    directories = [directory]
+                for combine_directory in directories:
+                    self.combine_outputs(combine_directory, options, progress_callback, log_callback)
                 progress_callback(100)
                 log_callback("すべての処理が完了しました")
+
+            # 計測結果のサマリー（ffmpeg・モデル・I/Oのどこで時間がかかったかの確認用）
+            for line in instrumentation.format_summary():
+                log_callback(line)
+            if options.get('metrics_path'):
+                instrumentation.export_jsonl(options['metrics_path'])
+                log_callback(f"計測結果を出力: {options['metrics_path']}")
             
             self.processing = False
             
@@ -116,23 +90,359 @@ class VideoProcessor:
             self.processing = False
             raise
             
-    def combine_files_by_extension(self, directory, extension, output_path):
-        """指定された拡張子のファイルを結合"""
-        import os
-        
-        files = list(Path(directory).glob(f'*.{extension}'))
-        if not files:
+    def discover(self, video_files, options, log_callback):
+        """MediaIndexで並列にprobeし、音声のあるファイルを長い順に並べて返す
+
+        変更の無いファイルはインデックスの記録を使い、probeし直しません。
+        長いファイルから投入することで、最後に長いファイルだけが残るのを防ぎます。
+        """
+        media_index = self.transcriber.media_index
+        if media_index is None or not video_files:
+            return video_files
+        with self.transcriber.instrumentation.span('discover', files=len(video_files)):
+            entries = media_index.get_all(video_files, workers=options.get('probe_workers', self.max_workers * 2))
+
+        playable = []
+        for video in video_files:
+            entry = entries.get(str(video))
+            if entry is None:
+                continue
+            if entry['error']:
+                log_callback(f"スキップ（probe失敗）: {video.name} - {entry['error']}")
+            elif not entry['has_audio']:
+                log_callback(f"スキップ（音声ストリームなし）: {video.name}")
+            else:
+                playable.append((entry['duration'], video))
+        playable.sort(key=lambda item: -item[0])
+        return [video for _, video in playable]
+
+    def transcribe_files(self, video_files, options, progress_callback, log_callback, on_result=None, buffers=None):
+        """動画ファイル群をスケジューラで文字起こしし、ファイルごとの結果を返す
+
+        options['dedupe']がTrueなら同じ音声を含むファイルは代表の1本だけを文字起こしし、
+        残りは代表の結果を時間のずれ分ずらして出力します。buffersは {動画パス: AudioBuffer} で、
+        デコード済みの音声があるファイルは抽出せずにそれを使います（使い終わったら解放します）。
+        """
+        def store(entry):
+            self._store_result(entry)
+            if on_result:
+                on_result(entry)
+
+        duplicates = {}
+        buffers = dict(buffers or {})
+        buffer_store = None
+        try:
+            if options.get('dedupe', False) and len(video_files) > 1:
+                buffer_store = AudioBufferStore(options.get('buffer_dir'))
+                video_files, duplicates = self.deduplicate(video_files, options, log_callback,
+                                                           buffer_store, buffers)
+
+            self.scheduler = PipelineScheduler(
+                self.transcriber,
+                extract_workers=options.get('extract_workers', self.max_workers),
+                transcribe_workers=options.get('transcribe_workers', 1),
+                remote=self.remote,
+                preloaded={str(video): buffers.pop(str(video)) for video in video_files if str(video) in buffers},
+                buffer_dir=options.get('buffer_dir')
+            )
+            results = self.scheduler.run(
+                video_files,
+                options,
+                progress_callback,
+                log_callback,
+                cancel_check=lambda: self.cancel_flag,
+                on_result=store
+            )
+            self.results.extend(results)
+            if duplicates and not self.cancel_flag:
+                results = results + self.project_duplicates(duplicates, results, options, progress_callback,
+                                                            log_callback, on_result)
+            return results
+        finally:
+            for buffer in buffers.values():
+                buffer.release()
+            for match in duplicates.values():
+                self.release_parts(match)
+            if buffer_store is not None:
+                buffer_store.close()
+
+    def deduplicate(self, video_files, options, log_callback, buffer_store=None, buffers=None):
+        """音声の指紋で重複を探し、(文字起こしするファイル, {重複ファイルのパス: 対応}) を返す
+
+        指紋はMediaIndexに記録され、変更の無いファイルは再計算しません。
+        指紋を作れなかったファイルは通常どおり文字起こしします。buffer_storeを渡すと、
+        指紋のためにデコードした音声をbuffers（{動画パス: AudioBuffer}）に残し、文字起こしで再デコードしません。
+        重複ファイルの音声は代表と重ならない範囲だけをmatch['parts']に残し、全体のバッファはすぐに解放します。
+        """
+        media_index = self.transcriber.media_index
+        instrumentation = self.transcriber.instrumentation
+
+        def compute(video_path):
+            source = None
+            if buffer_store is not None:
+                def source():
+                    # 文字起こしでも使うため、デコードした音声は共有バッファに残す
+                    audio = self.transcriber.load_audio(video_path)
+                    buffers[video_path] = buffer = buffer_store.put(audio)
+                    return buffer.blocks()
+            if media_index is not None:
+                return media_index.fingerprint(video_path, source=source)
+            return AudioFingerprint.compute(source()) if source else AudioFingerprint.from_file(video_path)
+
+        fingerprints = {}
+        log_callback(f"音声の指紋を作成中: {len(video_files)}ファイル")
+        with instrumentation.span('fingerprint', files=len(video_files)), \
+                concurrent.futures.ThreadPoolExecutor(max_workers=options.get('extract_workers', self.max_workers),
+                                                      thread_name_prefix='fingerprint') as pool:
+            futures = {pool.submit(compute, str(video)): video for video in video_files}
+            for future in concurrent.futures.as_completed(futures):
+                video = futures[future]
+                try:
+                    fingerprints[str(video)] = future.result()
+                except Exception as e:
+                    log_callback(f"指紋の作成に失敗しました（重複判定から除外）: "
+                                 f"{os.path.basename(str(video))} - {str(e)}")
+        with instrumentation.span('dedupe', files=len(fingerprints)):
+            duplicates = find_duplicates(fingerprints)
+
+        for path, match in duplicates.items():
+            log_callback(f"重複音声: {os.path.basename(path)} → {os.path.basename(match['primary'])}"
+                         f"（オフセット {match['offset']:+.2f}秒、重なり {match['start']:.1f}〜{match['end']:.1f}秒）")
+        if duplicates:
+            log_callback(f"重複を除いて文字起こし: {len(video_files) - len(duplicates)}/{len(video_files)}ファイル")
+        for path, match in duplicates.items():
+            match['duration'] = fingerprints[path].duration
+            buffer = buffers.pop(path, None) if buffers is not None else None
+            if buffer is not None:
+                # 重複ファイルで文字起こしするのは代表と重ならない先頭・末尾だけなので、その範囲だけを残す
+                try:
+                    audio = buffer.open()
+                    match['parts'] = [(start, end, buffer_store.put(audio[int(start * SAMPLE_RATE):
+                                                                          int(end * SAMPLE_RATE)]))
+                                      for start, end in self.uncovered_ranges(match)]
+                finally:
+                    buffer.release()
+        return [video for video in video_files if str(video) not in duplicates], duplicates
+
+    def project_duplicates(self, duplicates, results, options, progress_callback, log_callback, on_result=None):
+        """代表ファイルの結果を重複ファイルに写して出力し、ファイルごとの結果を返す
+
+        代表と重なっていない先頭・末尾の部分だけを文字起こしします。代表が失敗した
+        ファイルは通常どおり文字起こしします。重複判定で残した範囲の音声（match['parts']）があれば使い、
+        ファイルごとに出力し終えた時点で解放します。
+        """
+        outputs = {entry['file_path']: entry for entry in results}
+        entries = []
+        retry = []
+        for path, match in duplicates.items():
+            primary = outputs.get(match['primary'])
+            if primary is None or not primary['success']:
+                # 全体を文字起こしするため、残した範囲の音声は使わない
+                self.release_parts(match)
+                retry.append(path)
+                continue
+            try:
+                result = self.project_result(path, primary['result']['segments'], match)
+                output = self.transcriber.write_outputs(
+                    path, result,
+                    generate_edl=options.get('generate_edl', True),
+                    generate_srt=options.get('generate_srt', True)
+                )
+                entry = {'success': True, 'file_path': path, 'result': output, 'error': None}
+            except Exception as e:
+                entry = {'success': False, 'file_path': path, 'result': None, 'error': str(e)}
+                log_callback(f"エラー: {os.path.basename(path)} - {str(e)}")
+            finally:
+                self.release_parts(match)
+            entry.update(timings=self.transcriber.instrumentation.file_timings(path), cached=False,
+                         duplicate_of=match['primary'])
+            entries.append(entry)
+            self._store_result(entry)
+            if on_result:
+                on_result(entry)
+        self.results.extend(entries)
+
+        if retry and not self.cancel_flag:
+            log_callback(f"代表ファイルが失敗したため個別に文字起こし: {len(retry)}ファイル")
+            entries += self.transcribe_files(retry, dict(options, dedupe=False), progress_callback, log_callback,
+                                             on_result=on_result)
+        return entries
+
+    @staticmethod
+    def uncovered_ranges(match, min_seconds=1.0):
+        """重複ファイルのうち代表と重ならない (開始, 終了) 秒の範囲（min_seconds未満は除く）"""
+        ranges = [(0.0, match['start']), (match['end'], match['duration'])]
+        return [(start, end) for start, end in ranges if end - start >= min_seconds]
+
+    @staticmethod
+    def release_parts(match):
+        for _, _, buffer in match.pop('parts', []):
+            buffer.release()
+
+    def project_result(self, video_path, segments, match, min_seconds=1.0):
+        """重複ファイルの認識結果を作る（重なり部分は代表から写し、残りだけ文字起こし）"""
+        with self.transcriber.instrumentation.span('project', file=video_path):
+            projected = project_segments(segments, match)
+        uncovered = self.uncovered_ranges(match, min_seconds)
+        if uncovered:
+            stop_event = self.scheduler.stop_event if self.scheduler else None
+            parts = {(start, end): buffer for start, end, buffer in match.get('parts', [])}
+            for start, end in uncovered:
+                if (start, end) in parts:
+                    part = parts[(start, end)].open()
+                else:
+                    # デコード済みの音声が無ければ、その範囲だけをシークして読む
+                    part = self.transcriber.load_audio(video_path, stop_event=stop_event,
+                                                       start=start, duration=end - start)
+                if len(part) < SAMPLE_RATE * min_seconds:
+                    continue
+                result = self.transcriber.transcribe(video_path, audio=part, stop_event=stop_event)
+                projected += [shift_segment(segment, start) for segment in result['segments']]
+        projected.sort(key=lambda segment: segment['start'])
+        for index, segment in enumerate(projected):
+            segment['id'] = index
+        return {'segments': projected, 'text': ''.join(segment['text'] for segment in projected),
+                'duration': match['duration']}
+
+    def combine_outputs(self, directory, options, progress_callback, log_callback):
+        """フォルダ内の全動画を1本のタイムラインに結合したEDL/SRT（とMLT）を出力"""
+        instrumentation = self.transcriber.instrumentation
+        combined_edl = os.path.join(directory, 'combined.edl')
+        combined_srt = os.path.join(directory, 'combined.srt')
+        combined_mlt = os.path.join(directory, 'combined.mlt')
+
+        # 単一ファイルモードでもフォルダ内の全動画（対象の拡張子のみ）を1本のタイムラインに結合
+        clips = self.collect_clips(self.find_videos(directory, options.get('extensions', DEFAULT_EXTENSIONS)))
+
+        # EDLファイルの結合
+        log_callback("EDLファイルを結合中...")
+        progress_callback(75)
+        with instrumentation.span('combine.edl'):
+            combined = self.combine_timeline(clips, 'edl', combined_edl)
+        if combined:
+            log_callback(f"EDLファイルを結合: {combined_edl}")
+        else:
+            log_callback("警告: 結合可能なEDLファイルが見つかりませんでした")
+
+        # SRTファイルの結合
+        log_callback("SRTファイルを結合中...")
+        progress_callback(90)
+        with instrumentation.span('combine.srt'):
+            combined = self.combine_timeline(clips, 'srt', combined_srt)
+        if combined:
+            log_callback(f"SRTファイルを結合: {combined_srt}")
+        else:
+            log_callback("警告: 結合可能なSRTファイルが見つかりませんでした")
+
+        # フォルダ全体のMLTプロジェクトを生成
+        if options.get('generate_mlt', False):
+            progress_callback(95)
+            with instrumentation.span('combine.mlt'):
+                combined = self.write_combined_mlt(clips, combined_mlt)
+            if combined:
+                log_callback(f"MLTファイルを生成: {combined_mlt}")
+            else:
+                log_callback("警告: MLTに出力できるセグメントがありませんでした")
+
+    def _store_result(self, entry):
+        if entry['success']:
+            self.all_segments[entry['file_path']] = entry['result']['segments']
+            if entry['result'].get('duration') is not None:
+                self.durations[entry['file_path']] = entry['result']['duration']
+            words_path = entry['result'].get('words_path')
+            if words_path and self.phrase_index is not None:
+                self.phrase_index.add(entry['file_path'], words_path, WordStore.load(words_path))
+
+    def resegment_files(self, path, options, log_callback, max_chars=None, max_duration=None):
+        """保存済みの単語ストアから字幕を区切り直し、EDL/SRT（と結合ファイル）を再出力
+
+        モデルは使用しません。単語ストアの無い動画はスキップします。
+        """
+        self.all_segments = {}
+        self.durations = {}
+        directory = path if os.path.isdir(path) else os.path.dirname(path)
+        recursive = options.get('recursive', False)
+        if os.path.isfile(path):
+            video_files = [Path(path)]
+        else:
+            video_files = self.find_videos(directory, options.get('extensions', DEFAULT_EXTENSIONS), recursive)
+
+        count = 0
+        for video in video_files:
+            words_path = WordStore.path_for(str(video))
+            if not os.path.exists(words_path):
+                log_callback(f"スキップ（単語ストアなし）: {video.name}")
+                continue
+            segments = WordStore.load(words_path).resegment(max_chars=max_chars, max_duration=max_duration)
+            output = self.transcriber.write_outputs(
+                str(video),
+                {'segments': segments, 'text': ''.join(segment['text'] for segment in segments)},
+                generate_edl=options.get('generate_edl', True),
+                generate_srt=options.get('generate_srt', True)
+            )
+            self.all_segments[str(video)] = output['segments']
+            count += 1
+        log_callback(f"字幕を区切り直しました: {count}ファイル")
+
+        for combine_directory in sorted({str(video.parent) for video in video_files}):
+            self.combine_outputs(combine_directory, options, lambda progress: None, log_callback)
+        return count
+
+    def write_combined_mlt(self, clips, output_path):
+        """結合するクリップ（collect_clipsの結果）のセグメントから1つのMLTプロジェクトを生成
+
+        EDL/SRTの結合と同じクリップを使うため、フォルダ内の今回処理していない動画も含み、
+        他のフォルダの動画は含みません。
+        """
+        segments_by_file = {clip['path']: clip['segments'] for clip in clips if clip['segments']}
+        if not segments_by_file:
             return False
-            
-        with open(output_path, 'w', encoding='utf-8') as outfile:
-            for file in files:
-                if file.name != os.path.basename(output_path):  # 結合先ファイルを除外
-                    with open(file, 'r', encoding='utf-8') as infile:
-                        outfile.write(f"# {file.name}\n")
-                        outfile.write(infile.read())
-                        outfile.write("\n\n")
+        with open(output_path, 'w', encoding='utf-8') as f:
+            MLTFormatter.write(segments_by_file, f, title=os.path.basename(os.path.dirname(output_path)))
+        return True
+
+    @staticmethod
+    def find_videos(directory, extensions=DEFAULT_EXTENSIONS, recursive=False):
+        """フォルダ内の動画ファイル（拡張子は大文字小文字を区別しない）"""
+        return [Path(path) for path, _ in walk_media(directory, extensions, recursive)]
+
+    def collect_clips(self, video_files):
+        """結合用に各動画のセグメントと長さを集める
+
+        今回処理した動画はメモリ上の結果を使い、処理していない動画は既存のSRTから読み込みます。
+        """
+        clips = []
+        for video in sorted(video_files, key=lambda v: v.name):
+            path = str(video)
+            segments = self.all_segments.get(path)
+            if segments is None:
+                srt_path = video.with_suffix('.srt')
+                if not srt_path.exists():
+                    continue
+                with open(srt_path, 'r', encoding='utf-8') as f:
+                    segments = SRTFormatter.parse(f.read(), file_name=video.name)
+
+            duration = self.durations.get(path)
+            if duration is None:
+                try:
+                    duration = AudioLoader.get_duration(self.transcriber.probe(path)[0])
+                except Exception:
+                    duration = 0.0
+                # 長さが取れない場合は最後のセグメントの終了時刻で代用
+                duration = duration or max((segment['end'] for segment in segments), default=0.0)
+            clips.append({'path': path, 'duration': duration, 'segments': segments})
+        return clips
+
+    def combine_timeline(self, clips, extension, output_path):
+        """クリップを長さ分ずらして1本のタイムラインに結合（変化したクリップ以降のみ書き直す）"""
+        if not clips:
+            return False
+        builder = CombinedTimelineBuilder(output_path, extension)
+        builder.build(clips)
         return True
             
     def cancel(self):
         self.cancel_flag = True
-        self.processing = False 
\ No newline at end of file
+        self.processing = False
+        if self.scheduler:
+            self.scheduler.cancel() 
\ No newline at end of file
@@ -0,0 +1,341 @@
+import os
+import time
+import threading
+import multiprocessing
+import concurrent.futures
+from collections import deque
+from whisper_integration import WhisperTranscriber
+from utils.audio_buffer import AudioBuffer, AudioBufferStore
+
+# CPUレプリカ用：ワーカープロセスごとに1つだけ持つトランスクライバ
+_worker_transcriber = None
+
+def _init_cpu_worker(model_name, num_threads, backend, batch_size, language, preset, extractor):
+    global _worker_transcriber
+    _worker_transcriber = WhisperTranscriber(model_name=model_name, use_gpu=False, backend=backend,
+                                             num_threads=num_threads, batch_size=batch_size,
+                                             language=language, preset=preset, extractor=extractor)
+
+def _transcribe_in_worker(video_path, audio, chunked, plan=None):
+    started = time.perf_counter()
+    if isinstance(audio, AudioBuffer):
+        audio = audio.open()
+    if plan is not None:
+        result = _worker_transcriber.transcribe_incremental(video_path, audio, plan)
+    else:
+        result = _worker_transcriber.transcribe(video_path, audio=audio, chunked=chunked)
+    return result, time.perf_counter() - started
+
+class PipelineScheduler:
+    """音声抽出と文字起こしをパイプライン化して並列実行するスケジューラ
+
+    ffmpegによる音声抽出をスレッドプールで先行させ、デコード済み音声を
+    最大queue_size件まで保持します。文字起こしはGPUまたはワーカー数1なら
+    共有モデルを使う1スレッド、CPUで複数ワーカーならモデルを複製した
+    プロセスプールで並列に実行します。共有モデルでtranscriberのbatch_sizeが
+    2以上の場合は、抽出済みのファイルをまとめて1回のバッチデコードに渡します。
+    remote（RemoteCoordinator）を渡すと、文字起こしはリモートワーカーに分配します。
+
+    プロセスプールには音声をpickleせず、共有バッファ（AudioBufferStore）に置いた
+    AudioBufferを渡します。preloadedに {動画パス: AudioBuffer} を渡すと（重複判定で
+    デコード済みの音声など）、そのファイルは抽出せずにバッファを使い、文字起こし後に解放します。
+
+    options['incremental']がTrueなら、前回文字起こしした版と音声を比べて変わった区間だけを
+    文字起こしします（リモートワーカーでは全体を文字起こし）。
+    """
+
+    def __init__(self, transcriber, extract_workers=2, transcribe_workers=1, queue_size=None, remote=None,
+                 preloaded=None, buffer_dir=None):
+        self.transcriber = transcriber
+        self.remote = remote
+        self.preloaded = dict(preloaded or {})
+        self.buffer_dir = buffer_dir
+        self.buffers = None  # プロセスプール用の共有バッファ（run中のみ）
+        self._held = {}      # 動画パス -> 文字起こし完了まで保持するAudioBuffer
+        self._plans = {}     # 動画パス -> 差分の再文字起こしの計画
+        self._versions = {}  # 動画パス -> 文字起こし後に記録する音声の指紋
+        self.extract_workers = max(int(extract_workers), 1)
+        if remote is not None:
+            # ワーカー数分のジョブを常にキューに入れておく
+            transcribe_workers = remote.slots
+        elif transcriber.device_manager.is_gpu:
+            # GPUはモデル1つを1ワーカーで回す
+            transcribe_workers = 1
+        self.transcribe_workers = max(int(transcribe_workers), 1)
+        self.queue_size = queue_size or (self.extract_workers + self.transcribe_workers)
+        # ファイルをまとめる場合は1バッチ分を保持できるようにする
+        if self.batches_files:
+            self.queue_size = max(self.queue_size, transcriber.batch_size + self.extract_workers)
+        self.stop_event = threading.Event()
+
+    @property
+    def batches_files(self):
+        return self.remote is None and self.transcribe_workers == 1 and self.transcriber.batch_size > 1
+
+    @property
+    def uses_processes(self):
+        return self.remote is None and self.transcribe_workers > 1
+
+    def _create_transcribe_pool(self):
+        if self.remote is not None:
+            return self.remote
+        if self.transcribe_workers == 1:
+            return concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='transcribe')
+
+        num_threads = self.transcriber.num_threads or max((os.cpu_count() or 1) // self.transcribe_workers, 1)
+        return concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.transcribe_workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_cpu_worker,
+            initargs=(self.transcriber.model_name, num_threads, self.transcriber.backend.name,
+                      self.transcriber.batch_size, self.transcriber.language, self.transcriber.preset,
+                      self.transcriber.extractor)
+        )
+
+    def _extract(self, video_path, options):
+        """抽出ステージ：(音声, キャッシュキー, キャッシュ済み結果) を返す
+
+        キャッシュに結果があれば抽出は行いません。分割モードは文字起こし側で
+        ストリーミングするため音声はNoneを返します（プロセスプールでは共有バッファに
+        ストリーミングで書き出したAudioBufferを返します）。
+        """
+        chunked = options.get('chunked', False)
+        with self.transcriber.instrumentation.span('cache_lookup', file=video_path):
+            key = self.transcriber.cache_key(video_path, chunked)
+            cached = None
+            if not options.get('force_transcribe', False):
+                cached = self.transcriber.load_cached(key)
+        buffer = self.preloaded.pop(video_path, None)
+        if cached is not None or buffer is not None or self.remote is not None:
+            # ハッシュ時に取り出したコピーはこのプロセスの抽出で使わない
+            self.transcriber.extractor.discard(video_path)
+        if chunked and cached is None and self.uses_processes:
+            # ワーカープロセスには元ファイルを読ませない（ボリュームごとの読み込み制限はこのプロセスで守る）
+            if buffer is None:
+                _, audio_stream = self.transcriber.probe(video_path)
+                buffer = self.buffers.put_blocks(
+                    self.transcriber.extractor.stream(video_path, audio_stream, stop_event=self.stop_event))
+            self._held[video_path] = buffer
+            return buffer, key, None
+        if cached is not None or chunked:
+            if buffer is not None:
+                buffer.release()
+            return None, key, cached
+
+        if buffer is not None:
+            audio = buffer.open()
+        else:
+            audio = self.transcriber.load_audio(video_path, stop_event=self.stop_event)
+        if options.get('save_audio', False):
+            self.transcriber.extract_audio(video_path, audio=audio)
+        if options.get('incremental', False) and key is not None:
+            self._versions[video_path], plan = self.transcriber.incremental_plan(video_path, key, audio)
+            if plan is not None:
+                self._plans[video_path] = plan
+        if self.uses_processes:
+            # ワーカープロセスへはバッファの参照だけを渡す
+            if buffer is None:
+                buffer = self.buffers.put(audio)
+            audio = buffer
+        if buffer is not None:
+            self._held[video_path] = buffer
+        return audio, key, None
+
+    def _release(self, video_path):
+        buffer = self._held.pop(video_path, None)
+        if buffer is not None:
+            buffer.release()
+
+    def _transcribe(self, video_path, audio, chunked, plan=None):
+        """共有モデルでの文字起こし（スパンはtranscriber側で記録される）"""
+        if plan is not None:
+            return self.transcriber.transcribe_incremental(video_path, audio, plan, self.stop_event), None
+        return self.transcriber.transcribe(video_path, audio, chunked, self.stop_event), None
+
+    def _write(self, video_path, result, options):
+        return self.transcriber.write_outputs(
+            video_path,
+            result,
+            generate_edl=options['generate_edl'],
+            generate_srt=options['generate_srt'],
+            generate_mlt=False
+        )
+
+    def _transcribe_batch(self, items):
+        """複数ファイルをまとめてデコード（ファイルごとに (結果, None) または例外）"""
+        outcomes = self.transcriber.transcribe_batch(items, self.stop_event)
+        return [outcome if isinstance(outcome, Exception) else (outcome, None) for outcome in outcomes]
+
+    def _submit_transcribe(self, pool, video_path, audio, options):
+        chunked = options.get('chunked', False)
+        plan = self._plans.pop(video_path, None)
+        if pool is self.remote:
+            # リモートワーカーは差分の計画を受け取らないため全体を文字起こしする（版の記録は行う）
+            return pool.submit(video_path, audio, chunked, model=self.transcriber.model_name,
+                               backend=self.transcriber.backend.name, language=self.transcriber.language,
+                               preset=self.transcriber.preset)
+        if isinstance(pool, concurrent.futures.ProcessPoolExecutor):
+            return pool.submit(_transcribe_in_worker, video_path, audio, chunked, plan)
+        return pool.submit(self._transcribe, video_path, audio, chunked, plan)
+
+    def run(self, video_files, options, progress_callback, log_callback, cancel_check, on_result=None):
+        """ファイル群を処理し、ファイルごとの結果のリストを返す
+
+        進捗は0〜50%の範囲で報告します（残りは結合処理用）。
+        """
+        queue = deque(str(video) for video in video_files)
+        total = len(queue)
+        extracting = {}    # future -> 動画パス
+        transcribing = {}  # future -> [(動画パス, キャッシュキー)]（バッチ以外は1件）
+        pending = []       # バッチ待ちの (動画パス, 音声, キャッシュキー)
+        buffered = 0       # 抽出中〜文字起こし完了前の件数（音声を保持している件数）
+        extracted = 0
+        finished = 0
+        cache_hits = 0
+        results = []
+        self.stop_event.clear()
+        if self.uses_processes:
+            self.buffers = AudioBufferStore(self.buffer_dir)
+
+        def record(video_path, result=None, error=None, cached=False):
+            nonlocal finished
+            finished += 1
+            entry = {
+                'success': error is None,
+                'file_path': video_path,
+                'result': result,
+                'error': None if error is None else str(error),
+                'timings': self.transcriber.instrumentation.file_timings(video_path),
+                'cached': cached
+            }
+            results.append(entry)
+            name = os.path.basename(video_path)
+            if error is None:
+                log_callback(f"完了 ({finished}/{total}): {name}")
+            else:
+                log_callback(f"エラー: {name} - {str(error)}")
+            if on_result:
+                on_result(entry)
+
+        extract_pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.extract_workers, thread_name_prefix='extract')
+        transcribe_pool = self._create_transcribe_pool()
+        if self.remote is not None:
+            log_callback(f"リモート処理: {self.remote.url} に最大{self.transcribe_workers}件ずつ投入"
+                         f"（抽出 {self.extract_workers}ワーカー）")
+        else:
+            log_callback(f"並列処理: 抽出 {self.extract_workers}ワーカー / 文字起こし {self.transcribe_workers}ワーカー"
+                         f"（先読み {self.queue_size}件）")
+        try:
+            while queue or extracting or transcribing or pending:
+                if cancel_check():
+                    self.stop_event.set()
+                    for future in list(extracting) + list(transcribing):
+                        future.cancel()
+                    log_callback(f"処理がキャンセルされました（未完了 {total - finished}件を中止）")
+                    break
+
+                # 保持できる件数まで抽出を先行させる
+                while queue and buffered < self.queue_size:
+                    video_path = queue.popleft()
+                    log_callback(f"音声抽出中: {os.path.basename(video_path)}")
+                    extracting[extract_pool.submit(self._extract, video_path, options)] = video_path
+                    buffered += 1
+
+                # 1バッチ分揃うか、これ以上抽出待ちが無ければまとめて投入
+                if pending and (len(pending) >= self.transcriber.batch_size or not extracting):
+                    batch, pending = pending[:self.transcriber.batch_size], pending[self.transcriber.batch_size:]
+                    log_callback(f"文字起こし中（バッチ {len(batch)}件）: "
+                                 + ", ".join(os.path.basename(video_path) for video_path, _, _ in batch))
+                    batch_future = transcribe_pool.submit(
+                        self._transcribe_batch, [(video_path, audio) for video_path, audio, _ in batch])
+                    transcribing[batch_future] = [(video_path, key) for video_path, _, key in batch]
+                    continue
+
+                done, _ = concurrent.futures.wait(
+                    list(extracting) + list(transcribing),
+                    timeout=0.5,
+                    return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                for future in done:
+                    if future in extracting:
+                        video_path = extracting.pop(future)
+                        try:
+                            audio, key, cached = future.result()
+                        except Exception as e:
+                            buffered -= 1
+                            self._release(video_path)
+                            record(video_path, error=e)
+                            continue
+                        extracted += 1
+                        if cached is not None:
+                            # キャッシュヒット：文字起こしせずに出力のみ再生成
+                            buffered -= 1
+                            cache_hits += 1
+                            try:
+                                output = self._write(video_path, cached, options)
+                            except Exception as e:
+                                record(video_path, error=e, cached=True)
+                                continue
+                            record(video_path, result=output, cached=True)
+                            continue
+                        if self.batches_files and not options.get('chunked', False) and video_path not in self._plans:
+                            pending.append((video_path, audio, key))
+                            continue
+                        log_callback(f"文字起こし中: {os.path.basename(video_path)}")
+                        transcribe_future = self._submit_transcribe(transcribe_pool, video_path, audio, options)
+                        transcribing[transcribe_future] = [(video_path, key)]
+                    else:
+                        files = transcribing.pop(future)
+                        buffered -= len(files)
+                        try:
+                            outcomes = future.result()
+                        except Exception as e:
+                            outcomes = [e] * len(files)
+                        if len(files) == 1 and not isinstance(outcomes, list):
+                            outcomes = [outcomes]
+                        for (video_path, key), outcome in zip(files, outcomes):
+                            self._release(video_path)
+                            try:
+                                if isinstance(outcome, Exception):
+                                    raise outcome
+                                result, elapsed = outcome
+                                if elapsed is not None:
+                                    # ワーカー（プロセス・リモート）で計測した時間を記録
+                                    self.transcriber.instrumentation.record('transcribe', elapsed, file=video_path)
+                                self.transcriber.store_cached(key, result)
+                                if video_path in self._versions:
+                                    self.transcriber.store_version(video_path, key, self._versions.pop(video_path))
+                                output = self._write(video_path, result, options)
+                            except Exception as e:
+                                record(video_path, error=e)
+                                continue
+                            record(video_path, result=output)
+
+                if total:
+                    progress_callback((extracted * 0.2 + finished * 0.8) / total * 50)
+        except Exception as e:
+            self.stop_event.set()
+            log_callback(f"スケジューラエラー: {str(e)}")
+            raise
+        finally:
+            extract_pool.shutdown(wait=False, cancel_futures=True)
+            transcribe_pool.shutdown(wait=False, cancel_futures=True)
+            for video_path in list(self._held):
+                self._release(video_path)
+            for buffer in self.preloaded.values():
+                buffer.release()
+            self.preloaded.clear()
+            self._plans.clear()
+            self._versions.clear()
+            self.transcriber.extractor.discard()
+            if self.buffers is not None:
+                self.buffers.close()
+                self.buffers = None
+
+        if cache_hits:
+            log_callback(f"キャッシュから再利用: {cache_hits}/{total}件")
+        return results
+
+    def cancel(self):
+        self.stop_event.set()
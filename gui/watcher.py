@@ -0,0 +1,125 @@
+import os
+import threading
+from pathlib import Path
+from utils.journal import JobJournal, WRITTEN
+from utils.media_index import DEFAULT_EXTENSIONS, walk_media
+from utils.word_store import PhraseIndex, PHRASE_INDEX_NAME
+
+JOURNAL_NAME = '.whisper_jobs.sqlite3'
+
+class FolderWatcher:
+    """フォルダ以下を定期的に走査し、新規・変更された動画だけを文字起こしする監視モード
+
+    ジョブの状態はフォルダ直下のJobJournal（.whisper_jobs.sqlite3）に記録します。
+    書き込み中のファイルはサイズと更新時刻が安定するまで待ち、処理したファイルの
+    フォルダごとに結合EDL/SRTを更新します（変化したクリップ以降のみ書き直し）。
+    """
+
+    def __init__(self, processor, root, journal_path=None, interval=10.0, stable_seconds=10.0,
+                 max_attempts=3, batch_limit=None, extensions=DEFAULT_EXTENSIONS):
+        self.processor = processor
+        self.root = os.path.abspath(root)
+        self.extensions = extensions
+        self.interval = interval
+        self.batch_limit = batch_limit
+        self.journal = JobJournal(journal_path or os.path.join(self.root, JOURNAL_NAME),
+                                  stable_seconds=stable_seconds, max_attempts=max_attempts)
+        self.stop_event = threading.Event()
+        processor.phrase_index = PhraseIndex(os.path.join(self.root, PHRASE_INDEX_NAME))
+
+    def scan(self):
+        """フォルダ以下の動画を [(パス, サイズ, 更新時刻ns)] で返す（隠しフォルダは除く）"""
+        return [(path, stat.st_size, stat.st_mtime_ns)
+                for path, stat in walk_media(self.root, self.extensions, recursive=True)]
+
+    def run_once(self, options, progress_callback, log_callback):
+        """1回分の走査と処理。処理したジョブ数を返す"""
+        changed = self.journal.observe(self.scan())
+        if changed:
+            log_callback(f"新規・変更されたファイル: {changed}件（安定待ち {self.journal.stable_seconds:.0f}秒）")
+        paths = self.journal.claim(self.batch_limit)
+        if not paths:
+            return 0
+        # 音声の無いファイルなどは処理せずに失敗として記録し、長い順に処理
+        playable = [str(video) for video in self.processor.discover([Path(path) for path in paths], options, log_callback)]
+        for path in paths:
+            if path not in playable:
+                self.journal.fail(path, "音声ストリームが無いかprobeに失敗しました", retry=False)
+        paths = playable
+        if not paths:
+            return 0
+
+        # 結合も監視対象と同じ拡張子の動画だけで行う
+        options = dict(options, extensions=self.extensions)
+        processor = self.processor
+        # 結合はフォルダ内の既存のSRTも読むため、メモリ上に持つのは今回のバッチの結果だけでよい
+        processor.all_segments = {}
+        processor.durations = {}
+        processor.results = []
+        processor.transcriber.instrumentation.reset()
+        log_callback(f"処理開始: {len(paths)}件")
+
+        reported = set()
+        written = []
+
+        def on_result(entry):
+            path = entry['file_path']
+            reported.add(path)
+            if entry['success']:
+                # 結合まで終わったらcompleteにする
+                self.journal.set_stage(path, WRITTEN)
+                written.append(path)
+            elif self.journal.fail(path, entry['error']):
+                log_callback(f"再試行予定: {os.path.basename(path)}")
+            else:
+                log_callback(f"再試行の上限に達しました: {path}")
+
+        try:
+            processor.transcribe_files(paths, options, progress_callback, log_callback, on_result=on_result)
+            self.combine(written, options, progress_callback, log_callback)
+        finally:
+            # キャンセル等で結果の出なかったジョブは次回に回す
+            self.journal.release([path for path in paths if path not in reported])
+        return len(paths)
+
+    def combine(self, written, options, progress_callback, log_callback):
+        """出力を書き終えたジョブのフォルダごとに結合し、ジョブを完了にする"""
+        options = dict(options, extensions=self.extensions)
+        for directory in sorted({os.path.dirname(path) for path in written}):
+            finished = [path for path in written if os.path.dirname(path) == directory]
+            try:
+                self.processor.combine_outputs(directory, options, progress_callback, log_callback)
+            except Exception as e:
+                log_callback(f"結合エラー: {directory} - {str(e)}")
+                for path in finished:
+                    self.journal.fail(path, e)
+                continue
+            for path in finished:
+                self.journal.complete(path)
+
+    def run(self, options, progress_callback, log_callback):
+        """stopされるまで監視を続ける"""
+        self.processor.cancel_flag = False
+        recovered, written = self.journal.recover()
+        if recovered:
+            log_callback(f"前回中断したジョブを再開します: {recovered}件")
+        if written:
+            # 出力まで終わっていたジョブは文字起こしせず、結合だけをやり直す
+            log_callback(f"出力済みのジョブを結合します: {len(written)}件")
+            self.combine(written, options, progress_callback, log_callback)
+        log_callback(f"フォルダ監視を開始: {self.root}（間隔 {self.interval:.0f}秒）")
+        while not self.stop_event.is_set() and not self.processor.cancel_flag:
+            try:
+                processed = self.run_once(options, progress_callback, log_callback)
+            except Exception as e:
+                processed = 0
+                log_callback(f"監視処理エラー: {str(e)}")
+            if processed:
+                counts = self.journal.counts()
+                log_callback("ジョブ: " + ", ".join(f"{state} {count}" for state, count in sorted(counts.items())))
+            self.stop_event.wait(self.interval)
+        log_callback("フォルダ監視を終了しました")
+
+    def stop(self):
+        self.stop_event.set()
+        self.processor.cancel()
@@ -2,22 +2,31 @@ import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
 import os
 from whisper_integration import WhisperTranscriber
+from utils.cache import TranscriptionCache
+from utils.media_index import MediaIndex
 import threading
 from pathlib import Path
 import logging
-from gui.components import LogFrame, ProgressFrame, OptionFrame
+from gui.components import LogFrame, ProgressFrame, OptionFrame, UIEventQueue
 from gui.processor import VideoProcessor
+from utils.remote import RemoteCoordinator, DEFAULT_PORT
 
 class WhisperGUI:
+    UI_POLL_INTERVAL_MS = 100  # ワーカーからのイベントを画面に反映する間隔
+
     def __init__(self):
         self.root = tk.Tk()
         self.root.title('Whisper 文字起こしツール')
         self.root.geometry('1200x800')
         
-        self.transcriber = WhisperTranscriber()
+        self.transcriber = WhisperTranscriber(cache=TranscriptionCache(), media_index=MediaIndex())
         self.processor = VideoProcessor(self.transcriber)
+        self.coordinator = None  # リモート処理を初めて選んだときに起動
+        self.ui_queue = UIEventQueue()
         self.setup_logger()
         self.create_widgets()
+        self.root.after(self.UI_POLL_INTERVAL_MS, self.poll_ui_queue)
+        self.start_model_warm_up()
         
     def setup_logger(self):
         self.logger = logging.getLogger('WhisperGUI')
@@ -69,6 +78,31 @@ class WhisperGUI:
         
         ttk.Button(button_frame, text='終了', command=self.root.quit).grid(row=0, column=2, padx=10)
         
+    def start_model_warm_up(self):
+        """ウィンドウ表示後にバックグラウンドでモデルをロード"""
+        self.log_frame.log('モデルを事前ロード中...')
+        self.progress_frame.set_busy(True)
+        self.transcriber.warm_up(
+            callback=lambda ok, error: self.ui_queue.call(self.on_model_warm_up_done, ok, error)
+        )
+
+    def on_model_warm_up_done(self, ok, error):
+        self.progress_frame.set_busy(False)
+        if ok:
+            self.log_frame.log('モデルの事前ロードが完了しました')
+        else:
+            self.log_frame.log(f'モデルの事前ロードに失敗しました（処理開始時に再試行します）: {error}')
+
+    def poll_ui_queue(self):
+        """ワーカースレッドからのログ・進捗をまとめて反映（メインスレッドのタイマー）"""
+        logs, progress, calls = self.ui_queue.drain()
+        self.log_frame.append_batch(logs)
+        if progress is not None:
+            self.progress_frame.update_progress(progress)
+        for func, args in calls:
+            func(*args)
+        self.root.after(self.UI_POLL_INTERVAL_MS, self.poll_ui_queue)
+
     def select_folder(self):
         folder_path = filedialog.askdirectory()
         if folder_path:
@@ -89,15 +123,31 @@ class WhisperGUI:
         self.cancel_button.config(state='normal')
         
         thread = threading.Thread(
-            target=self.processor.process_files,
-            args=(
-                path,
-                self.option_frame.get_options(),
-                self.progress_frame.update_progress,
-                self.log_frame.log
-            )
+            target=self.run_processing,
+            args=(path, self.option_frame.get_options()),
+            daemon=True
         )
         thread.start()
+
+    def run_processing(self, path, options):
+        """ワーカースレッド本体（Tkには触れず、UIEventQueue経由で通知）"""
+        try:
+            if options.get('remote') and self.coordinator is None:
+                self.coordinator = RemoteCoordinator(host=options.get('remote_host', '127.0.0.1'), port=DEFAULT_PORT,
+                                                     token=os.environ.get('WHISPER_REMOTE_TOKEN'),
+                                                     logger=self.logger).start()
+                self.ui_queue.log(f'リモートワーカーの接続先: {self.coordinator.url}'
+                                  f'（トークン: {self.coordinator.token}）')
+            self.processor.remote = self.coordinator if options.get('remote') else None
+            self.processor.process_files(path, options, self.ui_queue.progress, self.ui_queue.log)
+        except Exception as e:
+            self.ui_queue.log(f'処理が異常終了しました: {e}', logging.ERROR)
+        finally:
+            self.ui_queue.call(self.on_processing_done)
+
+    def on_processing_done(self):
+        self.start_button.config(state='normal')
+        self.cancel_button.config(state='disabled')
         
     def cancel_processing(self):
         self.processor.cancel()
@@ -0,0 +1,67 @@
+import itertools
+import os
+import pytest
+
+pytest.importorskip('ffmpeg')
+
+from conftest import voice
+from utils import cache as cache_module
+from utils.cache import TranscriptionCache
+from utils.fingerprint import AudioFingerprint
+
+def result(text):
+    return {'text': text, 'language': 'ja', 'segments': [
+        {'start': 0.0, 'end': 1.0, 'text': text, 'tokens': [1, 2, 3], 'file_name': 'clip.mp4'}]}
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    # 最終アクセス時刻の順序を決定的にする
+    clock = itertools.count(1)
+    monkeypatch.setattr(cache_module.time, 'time', lambda: float(next(clock)))
+    return TranscriptionCache(str(tmp_path / 'cache'))
+
+def test_results_round_trip_without_tokens(cache):
+    key = TranscriptionCache.make_key('hash', 'small', {'beam_size': 5})
+    assert cache.get(key) is None
+    cache.put(key, result('こんにちは'))
+    segment = cache.get(key)['segments'][0]
+    assert segment == {'start': 0.0, 'end': 1.0, 'text': 'こんにちは'}
+    assert TranscriptionCache.make_key('hash', 'small', {'beam_size': 1}) != key
+
+def test_least_recently_used_entries_are_evicted(cache):
+    keys = [TranscriptionCache.make_key(f'hash{i}', 'small', {}) for i in range(3)]
+    for key in keys:
+        cache.put(key, result('あ' * 50))
+    size = os.path.getsize(cache._blob_path(keys[0]))
+    cache.get(keys[0])  # 1本目を最近使ったことにする
+    cache.max_bytes = 2 * size
+    cache.evict()
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) is not None and cache.get(keys[2]) is not None
+
+def test_audio_hash_is_remembered_until_the_file_changes(cache, tmp_path):
+    video = tmp_path / 'clip.mp4'
+    video.write_bytes(b'original')
+    calls = []
+
+    class Extractor:
+        def hash(self, path):
+            calls.append(path)
+            return f'hash{len(calls)}'
+
+    assert cache.audio_hash(str(video), Extractor()) == 'hash1'
+    assert cache.audio_hash(str(video), Extractor()) == 'hash1'
+    assert len(calls) == 1
+    video.write_bytes(b're-exported')
+    assert cache.audio_hash(str(video), Extractor()) == 'hash2'
+
+def test_versions_are_kept_per_path_and_settings(cache):
+    fingerprint = AudioFingerprint.compute([voice(20)])
+    cache.put_version('clip.mp4', 'settings-a', 'key-a', fingerprint)
+    key, stored = cache.get_version('clip.mp4', 'settings-a')
+    assert key == 'key-a'
+    assert stored.duration == pytest.approx(fingerprint.duration)
+    assert (stored.codes == fingerprint.codes).all()
+    assert cache.get_version('clip.mp4', 'settings-b') is None
+    cache.put_version('clip.mp4', 'settings-a', 'key-b', fingerprint)
+    assert cache.get_version('clip.mp4', 'settings-a')[0] == 'key-b'
@@ -0,0 +1,65 @@
+import tracemalloc
+import numpy as np
+import pytest
+
+pytest.importorskip('ffmpeg')
+
+from conftest import SAMPLE_RATE, voice
+from test_devices import FakeBackend, transcriber_on
+
+class ToneBackend(FakeBackend):
+    """一定の音（音楽の代わり）だけのウィンドウを無音と判定するバックエンド"""
+    decoded = []
+
+    @classmethod
+    def detect(cls, model, audios, options):
+        return [({'ja': 1.0}, 1.0 if np.ptp(audio) < 0.25 else 0.0) for audio in audios]
+
+    @classmethod
+    def transcribe(cls, model, audio, verbose=None, **options):
+        cls.decoded.append(len(audio) / SAMPLE_RATE)
+        return super().transcribe(model, audio, verbose, **options)
+
+@pytest.fixture
+def backend(monkeypatch):
+    from utils.backends import BACKENDS
+    monkeypatch.setitem(BACKENDS, FakeBackend.name, ToneBackend)
+    ToneBackend.decoded = []
+    return ToneBackend
+
+def tone(seconds, level=0.1):
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    return (level * np.sin(2 * np.pi * 440 * t)).astype(np.float32)
+
+def test_speech_after_a_long_music_intro_is_transcribed(backend):
+    audio = np.concatenate([tone(120), voice(60)])
+    result = transcriber_on(5000).transcribe_chunked('clip.mp4', audio=audio)
+    assert not result.get('no_speech')
+    assert result['segments'] and result['segments'][0]['start'] >= 90.0
+    # 無音と判定した冒頭のウィンドウは認識しない
+    assert sum(backend.decoded) < 120
+
+def test_music_only_file_is_skipped(backend):
+    result = transcriber_on(5000).transcribe_chunked('clip.mp4', audio=tone(200))
+    assert result['no_speech'] and result['segments'] == []
+    assert backend.decoded == []
+
+def test_memory_stays_bounded_without_speech(backend, monkeypatch):
+    # VADで区切れない小さな音が20分続くファイル（全体を保持すると約77MB）
+    def quiet_blocks():
+        rng = np.random.default_rng(0)
+        for _ in range(40):
+            yield (0.003 * rng.standard_normal(30 * SAMPLE_RATE)).astype(np.float32)
+
+    transcriber = transcriber_on(5000)
+    monkeypatch.setattr(transcriber, 'probe', lambda path: ({'format': {'duration': '1200'}, 'streams': []}, {}))
+    monkeypatch.setattr(transcriber.extractor, 'stream', lambda path, stream, stop_event=None: quiet_blocks())
+    tracemalloc.start()
+    try:
+        result = transcriber.transcribe_chunked('clip.mp4')
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert result['no_speech']
+    # 保持するのは判定中の数ウィンドウとブロックのみ
+    assert peak < 32 * 1024 * 1024
@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+
+# torch・whisperが無ければconftestの代役を使う（モデルを使わないバックエンドで確認する）
+pytest.importorskip('ffmpeg')
+
+from conftest import SAMPLE_RATE
+from utils.backends import BACKENDS
+from utils.devices import DeviceManager, SimulatedDevice
+from whisper_integration import WhisperTranscriber
+
+class FakeBackend:
+    """モデルを使わないバックエンド（デコードしたバッチの大きさとデバイスを記録）"""
+    name = 'fake'
+    batches = []
+
+    @staticmethod
+    def precision(device):
+        return 'fp32'
+
+    @classmethod
+    def supports(cls, device):
+        return True
+
+    @classmethod
+    def load(cls, model_name, device):
+        return {'device': device}
+
+    @staticmethod
+    def transcribe(model, audio, verbose=None, **options):
+        return {'text': 'テスト', 'language': 'ja', 'device': model['device'],
+                'segments': [{'start': 0.0, 'end': 1.0, 'text': 'テスト'}]}
+
+    @classmethod
+    def detect(cls, model, audios, options):
+        return [({'ja': 1.0}, 0.0) for _ in audios]
+
+    @classmethod
+    def decode_batch(cls, model, audios, options):
+        cls.batches.append(len(audios))
+        return [{'language': 'ja', 'segments': [{'start': 0.0, 'end': 1.0, 'text': 'テスト'}]} for _ in audios]
+
+@pytest.fixture
+def backend(monkeypatch):
+    monkeypatch.setitem(BACKENDS, FakeBackend.name, FakeBackend)
+    FakeBackend.batches = []
+    return FakeBackend
+
+def transcriber_on(free_mb, batch_size=1):
+    return WhisperTranscriber(model_name='tiny', backend=FakeBackend.name, batch_size=batch_size, preset='fast',
+                              device_manager=DeviceManager(SimulatedDevice(free_mb)))
+
+def noise(seconds):
+    # 一定の大きさの音（VADは全体を30秒ずつのウィンドウとして渡す）
+    return (0.1 * np.random.default_rng(0).standard_normal(int(seconds * SAMPLE_RATE))).astype(np.float32)
+
+def test_plan_fits_batch_size_to_free_memory():
+    manager = DeviceManager(SimulatedDevice(1500))
+    assert manager.plan('tiny', 16) == ('tiny', 5, True)
+    assert manager.plan('small', 4) == ('small', 4, False)
+    assert manager.plan('small', 4, allow_downgrade=True) == ('base', 3, True)
+
+def test_model_that_does_not_fit_runs_on_cpu(backend):
+    transcriber = transcriber_on(500)
+    assert not transcriber.device_manager.is_gpu
+
+def test_oom_halves_the_batch(backend):
+    transcriber = transcriber_on(5000, batch_size=8)
+    assert transcriber.batch_size == 8
+    # 他のプロセスがメモリを使い、2ウィンドウ分しか空いていない状態
+    transcriber.device_manager.device.free_mb = 1130
+    result = transcriber.transcribe('clip.mp4', audio=noise(240))
+    assert backend.batches == [2, 2, 2, 2]
+    assert transcriber.batch_size == 2
+    assert len(result['segments']) == 8
+    assert transcriber._cpu_transcriber is None
+
+def test_oom_with_single_window_falls_back_to_cpu(backend):
+    transcriber = transcriber_on(2000)
+    transcriber.device_manager.device.free_mb = 1010
+    result = transcriber.transcribe('clip.mp4', audio=noise(20))
+    assert result['segments'][0]['text'] == 'テスト'
+    assert transcriber._cpu_transcriber is not None
+    assert not transcriber._cpu_transcriber.device_manager.is_gpu
+    # GPU側のトランスクライバはそのまま（次のファイルは再びGPUで試す）
+    assert transcriber.device_manager.is_gpu
+
+def test_oom_in_batch_decode_falls_back_to_cpu(backend):
+    transcriber = transcriber_on(5000, batch_size=4)
+    transcriber.device_manager.device.free_mb = 1010
+    result = transcriber.transcribe('clip.mp4', audio=noise(120))
+    assert backend.batches == [1, 1, 1, 1]
+    assert transcriber.batch_size == 1
+    assert len(result['segments']) == 4
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('ffmpeg')
+
+from conftest import SAMPLE_RATE, voice
+from utils.fingerprint import AudioFingerprint, HOP_SECONDS, diff_regions, plan_retranscription
+
+SEGMENTS = [{'start': float(start), 'end': float(start + 3), 'text': f'{start}'} for start in range(0, 200, 4)]
+
+def fingerprint(audio):
+    return AudioFingerprint.compute([audio])
+
+def test_unchanged_audio_reuses_everything(recording):
+    previous = fingerprint(recording)
+    plan = plan_retranscription(previous, previous, SEGMENTS)
+    assert plan['regions'] == []
+    assert len(plan['segments']) == len(SEGMENTS)
+
+@pytest.mark.parametrize('inserted', [1.0, 2.5, 3.0, 5.0])
+def test_insertion_retranscribes_only_the_insert(recording, inserted):
+    # 挿入の長さがホップの倍数でなくても、後ろの区間は1つのずれとして扱う
+    current = np.concatenate([recording[:100 * SAMPLE_RATE], voice(inserted, 999),
+                              recording[100 * SAMPLE_RATE:]])
+    previous, current = fingerprint(recording), fingerprint(current)
+    plan = plan_retranscription(previous, current, SEGMENTS)
+    assert len(plan['regions']) == 1
+    start, end = plan['regions'][0]
+    assert 97.0 <= start <= 100.0 and 100.0 + inserted <= end <= 104.0 + inserted
+    assert plan['transcribe_seconds'] < inserted + 6.0
+
+    regions = diff_regions(previous, current)
+    assert [region['offset'] is None for region in regions] == [False, True, False]
+    assert regions[-1]['offset'] == pytest.approx(-inserted, abs=2 * HOP_SECONDS)
+
+def test_shifted_segments_follow_the_offset(recording):
+    current = np.concatenate([recording[:50 * SAMPLE_RATE], recording[52 * SAMPLE_RATE:]])
+    plan = plan_retranscription(fingerprint(recording), fingerprint(current), SEGMENTS)
+    kept = {segment['text']: segment for segment in plan['segments']}
+    assert kept['100']['start'] == pytest.approx(98.0, abs=2 * HOP_SECONDS)
+    assert kept['20']['start'] == pytest.approx(20.0)
+    assert '48' not in kept and '52' not in kept
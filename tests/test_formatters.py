@@ -0,0 +1,37 @@
+import io
+import pytest
+
+from utils.formatters import SRTFormatter
+
+SEGMENTS = [
+    {'start': 0.0, 'end': 1.5, 'text': ' こんにちは', 'file_name': 'clip.mp4'},
+    {'start': 1.5, 'end': 1.5, 'text': '長さ0は出力しない', 'file_name': 'clip.mp4'},
+    {'start': 3661.25, 'end': 3663.0, 'text': '1行目\n2行目', 'file_name': 'clip.mp4'},
+]
+
+def times_and_texts(segments):
+    return [(segment['start'], segment['end'], segment['text'].strip()) for segment in segments]
+
+@pytest.mark.parametrize('include_filename', [False, True])
+def test_parse_round_trips_written_srt(include_filename):
+    buffer = io.StringIO()
+    SRTFormatter.write(SEGMENTS, buffer, include_filename=include_filename)
+    content = buffer.getvalue()
+    assert ('[clip.mp4] こんにちは' in content) == include_filename
+
+    parsed = SRTFormatter.parse(content, file_name='clip.mp4')
+    valid = [segment for segment in SEGMENTS if SRTFormatter.is_valid_segment(segment)]
+    # ミリ秒単位の時刻はそのまま戻る
+    assert times_and_texts(parsed) == times_and_texts(valid)
+    assert all(segment['file_name'] == 'clip.mp4' for segment in parsed)
+
+def test_parse_matches_iter_entries_with_offset():
+    content = ''.join(SRTFormatter.iter_entries(SEGMENTS, first_number=5, offset=10.0))
+    assert content.startswith('5\n00:00:10,000 --> 00:00:11,500\nこんにちは\n')
+    parsed = SRTFormatter.parse(content.replace('\n', '\r\n'))
+    assert [segment['start'] for segment in parsed] == [10.0, 3671.25]
+    assert 'file_name' not in parsed[0]
+
+def test_prefix_of_another_file_is_kept():
+    content = SRTFormatter.generate(SEGMENTS[:1], include_filename=True)
+    assert SRTFormatter.parse(content, file_name='other.mp4')[0]['text'] == '[clip.mp4] こんにちは'
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('ffmpeg')
+
+from conftest import SAMPLE_RATE, voice
+from test_devices import FakeBackend
+from utils.backends import BACKENDS
+from utils.cache import TranscriptionCache
+from utils.devices import DeviceManager, SimulatedDevice
+from whisper_integration import WhisperTranscriber
+
+class RecordingBackend(FakeBackend):
+    """文字起こしした音声の長さを記録するバックエンド"""
+    decoded = []
+
+    @classmethod
+    def transcribe(cls, model, audio, verbose=None, **options):
+        cls.decoded.append(len(audio) / SAMPLE_RATE)
+        return super().transcribe(model, audio, verbose, **options)
+
+def test_process_video_retranscribes_only_the_change(recording, tmp_path, monkeypatch):
+    monkeypatch.setitem(BACKENDS, FakeBackend.name, RecordingBackend)
+    RecordingBackend.decoded = []
+    video = tmp_path / 'clip.mp4'
+    video.write_bytes(b'')
+    transcriber = WhisperTranscriber(model_name='tiny', backend=FakeBackend.name, preset='fast',
+                                     cache=TranscriptionCache(str(tmp_path / 'cache')),
+                                     device_manager=DeviceManager(SimulatedDevice(5000)))
+    version = {}
+    monkeypatch.setattr(transcriber.cache, 'audio_hash', lambda path, extractor=None: version['hash'])
+    monkeypatch.setattr(transcriber, 'load_audio', lambda path, stop_event=None: version['audio'])
+
+    version.update(hash='v1', audio=recording)
+    transcriber.process_video(str(video), incremental=True)
+    assert RecordingBackend.decoded == [pytest.approx(200.0)]
+
+    # 途中に3秒挿入して書き出し直した版
+    RecordingBackend.decoded = []
+    version.update(hash='v2', audio=np.concatenate([recording[:100 * SAMPLE_RATE], voice(3, 999),
+                                                    recording[100 * SAMPLE_RATE:]]))
+    result = transcriber.process_video(str(video), incremental=True)
+    assert len(RecordingBackend.decoded) == 1 and RecordingBackend.decoded[0] < 10.0
+    assert result['segments']
@@ -0,0 +1,38 @@
+import types
+
+from gui.watcher import FolderWatcher
+from utils.journal import JobJournal, DONE, PENDING, RUNNING, WRITTEN
+
+def journal_with(tmp_path, paths):
+    journal = JobJournal(str(tmp_path / 'jobs.sqlite3'), stable_seconds=0)
+    journal.observe([(path, 1, 1) for path in paths], now=0.0)
+    journal.observe([(path, 1, 1) for path in paths], now=1.0)
+    assert journal.claim(now=1.0) == list(paths)
+    return journal
+
+def test_recover_requeues_only_unwritten_jobs(tmp_path):
+    journal = journal_with(tmp_path, ['/a/1.mp4', '/a/2.mp4'])
+    journal.set_stage('/a/2.mp4', WRITTEN)
+    # 異常終了後の再開
+    assert journal.recover() == (1, ['/a/2.mp4'])
+    assert journal.counts() == {PENDING: 1, RUNNING: 1}
+
+def test_claim_clears_the_previous_stage(tmp_path):
+    journal = journal_with(tmp_path, ['/a/1.mp4'])
+    journal.set_stage('/a/1.mp4', WRITTEN)
+    assert journal.fail('/a/1.mp4', '結合エラー')
+    journal.retry_delay = 0
+    assert journal.claim(now=10.0 ** 10) == ['/a/1.mp4']
+    assert journal.recover() == (1, [])
+
+def test_watcher_combines_written_jobs_on_restart(tmp_path):
+    combined = []
+    processor = types.SimpleNamespace(
+        combine_outputs=lambda directory, options, progress, log: combined.append(directory))
+    watcher = FolderWatcher(processor, str(tmp_path), journal_path=str(tmp_path / 'jobs.sqlite3'))
+    watcher.journal = journal_with(tmp_path, ['/a/1.mp4', '/b/2.mp4'])
+    watcher.journal.set_stage('/b/2.mp4', WRITTEN)
+    watcher.stop_event.set()  # 再開の処理だけを行う
+    watcher.run({}, lambda progress: None, lambda message: None)
+    assert combined == ['/b']
+    assert watcher.journal.counts() == {DONE: 1, PENDING: 1}
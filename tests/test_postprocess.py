@@ -0,0 +1,58 @@
+import logging
+import pytest
+
+from utils.postprocess import SegmentPostProcessor
+
+def cue(start, end, text, **extra):
+    return dict(start=float(start), end=float(end), text=text, **extra)
+
+def texts(segments):
+    return [segment['text'] for segment in segments]
+
+def test_close_repeats_are_dropped_but_distant_ones_kept():
+    segments = [cue(0, 2, 'ありがとうございます'), cue(2.2, 4, 'ありがとうございます'),
+                cue(3.5, 5, 'ありがとうございます'), cue(20, 22, 'ありがとうございます')]
+    output = SegmentPostProcessor().process(segments)
+    assert [(segment['start'], segment['text']) for segment in output] == [
+        (0.0, 'ありがとうございます'), (20.0, 'ありがとうございます')]
+
+def test_compression_ratio_is_off_by_default():
+    # Whisperの結果に含まれるcompression_ratioはウィンドウ全体の値なので使わない
+    segments = [cue(0, 2, 'はい', compression_ratio=3.0), cue(3, 5, 'そうですね' * 10)]
+    assert texts(SegmentPostProcessor().process(segments)) == ['はい', 'そうですね' * 10]
+
+def test_compression_ratio_is_computed_per_segment(caplog):
+    segments = [cue(0, 2, 'はい', compression_ratio=3.0), cue(3, 5, 'そうですね' * 10),
+                cue(6, 8, '今日は撮影の段取りを確認します')]
+    processor = SegmentPostProcessor(max_compression_ratio=2.4, logger=logging.getLogger('test'))
+    with caplog.at_level(logging.WARNING):
+        output = processor.process(segments, file_name='clip.mp4')
+    assert texts(output) == ['はい', '今日は撮影の段取りを確認します']
+    assert '1件' in caplog.text and 'clip.mp4' in caplog.text
+
+def test_cue_starting_with_the_next_one_is_merged():
+    segments = [cue(1, 1.5, 'えー、'), cue(1, 3, 'それでは始めます'), cue(4, 6, 'よろしくお願いします')]
+    output = SegmentPostProcessor(min_duration=None).process(segments)
+    assert [(segment['start'], segment['end'], segment['text']) for segment in output] == [
+        (1.0, 3.0, 'えー、それでは始めます'), (4.0, 6.0, 'よろしくお願いします')]
+
+def test_short_cue_is_merged_with_its_neighbour():
+    output = SegmentPostProcessor().process([cue(0, 2, 'まず'), cue(2.1, 2.2, 'は'), cue(5, 7, '次に')])
+    assert [(segment['start'], segment['end'], segment['text']) for segment in output] == [
+        (0.0, 2.2, 'まずは'), (5.0, 7.0, '次に')]
+
+def test_fast_cue_is_extended_up_to_the_next_one():
+    segments = [cue(0, 1, 'とても長い説明の字幕です'), cue(2, 3, 'はい'), cue(3.05, 4, 'では')]
+    output = SegmentPostProcessor(max_cps=5).process(segments)
+    # 12文字を5文字/秒で読むには2.4秒必要だが、次のキューの開始で止める
+    assert output[0]['end'] == pytest.approx(2.0)
+    # 0.1秒未満の隙間は詰める
+    assert output[1]['end'] == pytest.approx(3.05)
+
+def test_long_cue_is_split_by_words():
+    words = [dict(word=word, start=float(i), end=i + 0.8, probability=1.0)
+             for i, word in enumerate(['今日は', '天気が', '良いので', '外で', '撮影します'])]
+    output = SegmentPostProcessor(max_chars=8).process([cue(0, 4.8, ''.join(w['word'] for w in words), words=words)])
+    assert ''.join(texts(output)) == '今日は天気が良いので外で撮影します'
+    assert all(len(text) <= 8 for text in texts(output))
+    assert [segment['id'] for segment in output] == list(range(len(output)))
@@ -0,0 +1,63 @@
+import types
+from pathlib import Path
+import numpy as np
+import pytest
+
+pytest.importorskip('ffmpeg')
+pytest.importorskip('psutil')
+
+from conftest import voice
+from gui.processor import VideoProcessor
+from utils.audio_buffer import AudioBufferStore
+from utils.instrumentation import Instrumentation
+
+def unprobeable(path):
+    raise OSError(path)
+
+@pytest.fixture
+def folders(tmp_path):
+    """サブフォルダa・bに、SRTのある動画を2本ずつ置く"""
+    for folder in ('a', 'b'):
+        (tmp_path / folder).mkdir()
+        for name in ('1', '2'):
+            (tmp_path / folder / f'{name}.mp4').write_bytes(b'')
+            (tmp_path / folder / f'{name}.srt').write_text(
+                f'1\n00:00:00,000 --> 00:00:01,000\n{folder}{name}\n\n', encoding='utf-8')
+    return tmp_path
+
+def test_combined_mlt_contains_only_the_folder_clips(folders):
+    processor = VideoProcessor(types.SimpleNamespace(instrumentation=Instrumentation(), probe=unprobeable))
+    # 今回処理したのはbの1本だけ（aの動画は既存のSRTから読む）
+    processor.all_segments = {str(folders / 'b' / '1.mp4'): [{'start': 0.0, 'end': 1.0, 'text': '今回'}]}
+    for folder in ('a', 'b'):
+        processor.combine_outputs(str(folders / folder), {'generate_mlt': True}, lambda progress: None,
+                                  lambda message: None)
+
+    mlt_a = (folders / 'a' / 'combined.mlt').read_text(encoding='utf-8')
+    assert 'a1' in mlt_a and 'a2' in mlt_a
+    assert str(folders / 'b') not in mlt_a and '今回' not in mlt_a
+    mlt_b = (folders / 'b' / 'combined.mlt').read_text(encoding='utf-8')
+    assert '今回' in mlt_b and 'b2' in mlt_b and 'b1' not in mlt_b
+
+def test_duplicate_keeps_only_the_uncovered_audio(recording):
+    extra = {'a.mp4': voice(5, seed=50), 'b.mp4': voice(10, seed=60)}
+    audios = {'a.mp4': np.concatenate([recording, extra['a.mp4']]),
+              'b.mp4': np.concatenate([extra['b.mp4'], recording])}
+    transcriber = types.SimpleNamespace(instrumentation=Instrumentation(), media_index=None,
+                                        load_audio=lambda path: audios[path])
+    processor = VideoProcessor(transcriber)
+    store = AudioBufferStore()
+    buffers = {}
+    try:
+        videos, duplicates = processor.deduplicate([Path('a.mp4'), Path('b.mp4')], {}, lambda message: None,
+                                                   store, buffers)
+        assert videos == [Path('b.mp4')] and list(duplicates) == ['a.mp4']
+        # 代表の音声は文字起こしで使うため残し、重複ファイルは代表と重ならない末尾だけを残す
+        assert list(buffers) == ['b.mp4']
+        (start, end, part), = duplicates['a.mp4']['parts']
+        assert start == pytest.approx(200.0, abs=0.5) and end == pytest.approx(205.0, abs=0.01)
+        assert len(store) == 2 and part.duration == pytest.approx(end - start, abs=0.01)
+        processor.release_parts(duplicates['a.mp4'])
+        assert len(store) == 1
+    finally:
+        store.close()
@@ -0,0 +1,72 @@
+import json
+import urllib.error
+import urllib.request
+import numpy as np
+import pytest
+
+pytest.importorskip('ffmpeg')
+
+from conftest import voice
+from utils.remote import RemoteCoordinator, TOKEN_HEADER, decode_audio, encode_audio
+
+def post(coordinator, path, token=None):
+    request = urllib.request.Request(coordinator.url + path, data=b'{}', method='POST',
+                                     headers={'X-Worker': 'node1', **({TOKEN_HEADER: token} if token else {})})
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+@pytest.fixture
+def server():
+    coordinator = RemoteCoordinator(port=0, token='secret').start()
+    yield coordinator
+    coordinator.stop()
+
+def test_requests_without_the_token_are_rejected(server):
+    assert post(server, '/claim')[0] == 403
+    assert post(server, '/claim', token='wrong')[0] == 403
+    assert post(server, '/claim', token='secret')[0] == 204
+
+    server.submit('clip.mp4', voice(2))
+    status, body = post(server, '/claim', token='secret')
+    assert status == 200 and json.loads(body)['path'].endswith('clip.mp4')
+
+def test_generated_token_when_none_is_given():
+    coordinator = RemoteCoordinator()
+    assert coordinator.token_generated and len(coordinator.token) >= 16
+    assert coordinator.host == '127.0.0.1'
+
+def test_expired_lease_is_reassigned():
+    coordinator = RemoteCoordinator(lease_seconds=-1.0, max_attempts=2)
+    future = coordinator.submit('clip.mp4', voice(2))
+    first = coordinator.claim('node1')
+    second = coordinator.claim('node2')
+    assert first['id'] == second['id']
+    # 割り当てを失ったワーカーの結果は受け付けない
+    assert not coordinator.complete(first['id'], 'node1', {'segments': []}, 1.0)
+    assert coordinator.complete(second['id'], 'node2', {'segments': ['ok']}, 2.0)
+    assert future.result(timeout=1) == ({'segments': ['ok']}, 2.0)
+
+def test_job_fails_after_max_attempts():
+    coordinator = RemoteCoordinator(lease_seconds=-1.0, max_attempts=2)
+    future = coordinator.submit('clip.mp4', voice(2))
+    assert coordinator.claim('node1') and coordinator.claim('node2')
+    assert coordinator.claim('node3') is None
+    with pytest.raises(RuntimeError):
+        future.result(timeout=1)
+
+def test_cancelled_job_is_not_claimed():
+    coordinator = RemoteCoordinator()
+    cancelled = coordinator.submit('a.mp4', voice(2))
+    queued = coordinator.submit('b.mp4', voice(2))
+    assert cancelled.cancel()
+    job = coordinator.claim('node1')
+    assert job['path'].endswith('b.mp4') and queued.running()
+    assert coordinator.claim('node1') is None
+    assert coordinator.status()['queued'] == 0
+
+def test_audio_survives_the_transfer_encoding():
+    audio = voice(3)
+    assert np.abs(decode_audio(encode_audio(audio)) - audio).max() < 1e-4
@@ -0,0 +1,47 @@
+import json
+
+from utils.timeline import CombinedTimelineBuilder
+
+def clip(name, duration, texts):
+    segments = [{'start': float(i), 'end': i + 0.8, 'text': text, 'file_name': f'{name}.mp4'}
+                for i, text in enumerate(texts)]
+    return {'path': f'/footage/{name}.mp4', 'duration': duration, 'segments': segments}
+
+CLIPS = [clip('a', 10.0, ['一', '二']), clip('b', 5.0, ['三']), clip('c', 8.0, ['四', '五', '六'])]
+
+def build(path, clips, fmt='srt'):
+    builder = CombinedTimelineBuilder(str(path), fmt)
+    return builder.build(clips), path.read_bytes(), json.loads(open(builder.manifest_path, encoding='utf-8').read())
+
+def test_manifest_records_where_each_clip_starts(tmp_path):
+    changed, data, manifest = build(tmp_path / 'combined.srt', CLIPS)
+    assert changed == 3
+    assert manifest['end_bytes'] == len(data)
+    assert [entry['timeline_start'] for entry in manifest['clips']] == [0.0, 10.0, 15.0]
+    assert [entry['first_number'] for entry in manifest['clips']] == [1, 3, 4]
+    for entry, first_text in zip(manifest['clips'], ['[a.mp4] 一', '[b.mp4] 三', '[c.mp4] 四']):
+        tail = data[entry['offset_bytes']:].decode('utf-8')
+        assert tail.split('\n')[2] == first_text
+    # 2本目は1本目の長さだけずれる
+    assert '00:00:10,000 --> 00:00:10,800\n[b.mp4] 三' in data.decode('utf-8')
+
+def test_rebuild_rewrites_only_from_the_first_changed_clip(tmp_path):
+    output = tmp_path / 'combined.srt'
+    _, before, manifest = build(output, CLIPS)
+    assert build(output, CLIPS)[0] == 0
+
+    edited = [CLIPS[0], clip('b', 5.0, ['三', '三の続き']), CLIPS[2]]
+    changed, after, _ = build(output, edited)
+    assert changed == 2
+    offset = manifest['clips'][1]['offset_bytes']
+    assert after[:offset] == before[:offset]
+    # 途中から書き直した結果は最初から書き出した場合と同じ
+    assert after == build(tmp_path / 'fresh.srt', edited)[1]
+
+def test_removed_clips_are_truncated(tmp_path):
+    output = tmp_path / 'combined.edl'
+    build(output, CLIPS, fmt='edl')
+    changed, data, manifest = build(output, CLIPS[:2], fmt='edl')
+    assert changed == 1
+    assert data == build(tmp_path / 'fresh.edl', CLIPS[:2], fmt='edl')[1]
+    assert len(manifest['clips']) == 2
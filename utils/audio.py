@@ -0,0 +1,311 @@
+import os
+import wave
+import tempfile
+import threading
+import subprocess
+from contextlib import contextmanager
+import numpy as np
+import ffmpeg
+
+SAMPLE_RATE = 16000  # Whisperの入力サンプルレート
+BYTES_PER_SAMPLE = 2  # s16le
+
+class AudioLoader:
+    """ffmpegから16kHzモノラルPCMをパイプで直接読み込むローダー
+
+    中間WAVファイルを作らず、s16leの出力をそのままfloat32配列に変換します。
+    """
+
+    @staticmethod
+    def probe(video_path):
+        """入力ファイルを1回だけprobeし、(probe結果, 先頭の音声ストリーム) を返す"""
+        if not os.path.exists(video_path):
+            raise FileNotFoundError(f"動画ファイルが見つかりません: {video_path}")
+
+        probe = ffmpeg.probe(video_path)
+        audio_streams = [stream for stream in probe['streams'] if stream['codec_type'] == 'audio']
+        if not audio_streams:
+            raise ValueError(f"動画に音声ストリームが含まれていません: {video_path}")
+        return probe, audio_streams[0]
+
+    @staticmethod
+    def get_duration(probe):
+        """probe結果から長さ（秒）を取得（不明なら0）"""
+        try:
+            return float(probe['format'].get('duration', 0) or 0)
+        except (TypeError, ValueError):
+            return 0.0
+
+    @staticmethod
+    def pcm_to_float(data):
+        """s16leのバイト列を[-1, 1)のfloat32配列に変換"""
+        audio = np.frombuffer(data, dtype=np.int16).astype(np.float32)
+        audio *= 1.0 / 32768.0
+        return audio
+
+    @staticmethod
+    def hash_packets(video_path, stream='a:0'):
+        """音声ストリームのパケットをデコードせずにハッシュ化（ffmpegのhashマクサー）"""
+        out, _ = (
+            ffmpeg
+            .input(video_path)[stream]
+            .output('pipe:', c='copy', f='hash', hash='sha256', loglevel='error')
+            .run(capture_stdout=True, capture_stderr=True)
+        )
+        return out.decode().strip().split('=', 1)[-1]
+
+    @staticmethod
+    def _open_pipe(video_path, stream='a:0', start=None, duration=None):
+        # 音声ストリームを明示的にmapし、映像などのパケットはデコードせず読み捨てる
+        input_options = {}
+        if start:
+            input_options['ss'] = start  # 入力側のシークで先頭から読まない
+        if duration is not None:
+            input_options['t'] = duration
+        return (
+            ffmpeg
+            .input(video_path, **input_options)[stream]
+            .output('pipe:',
+                    format='s16le',
+                    acodec='pcm_s16le',  # 16ビットPCM
+                    ac=1,                # モノラル
+                    ar=SAMPLE_RATE,      # 16kHz
+                    loglevel='error')
+            .run_async(pipe_stdout=True, pipe_stderr=True)
+        )
+
+    @classmethod
+    def stream(cls, video_path, block_seconds=30.0, stop_event=None, stream='a:0', start=None, duration=None):
+        """float32のブロックを順に返すジェネレータ（メモリ使用量はブロックサイズで一定）
+
+        stop_event（threading.Event）がセットされると読み込みを打ち切り、ffmpegを終了します。
+        streamはffmpegのストリーム指定（既定は先頭の音声）、start/durationで範囲（秒）を指定できます。
+        """
+        block_bytes = max(int(block_seconds * SAMPLE_RATE), 1) * BYTES_PER_SAMPLE
+        process = cls._open_pipe(video_path, stream, start, duration)
+        try:
+            while True:
+                if stop_event is not None and stop_event.is_set():
+                    return  # 中断（ffmpegはfinallyで終了）
+                data = process.stdout.read(block_bytes)
+                if not data:
+                    break
+                if len(data) % BYTES_PER_SAMPLE:
+                    data = data[:-(len(data) % BYTES_PER_SAMPLE)]
+                yield cls.pcm_to_float(data)
+
+            process.stdout.close()
+            stderr = process.stderr.read()
+            if process.wait() != 0:
+                raise ffmpeg.Error('ffmpeg', None, stderr)
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+
+    @classmethod
+    def load(cls, video_path, expected_duration=None, stop_event=None, blocks=None):
+        """音声全体をfloat32配列として読み込む
+
+        expected_durationが分かっていればバッファを事前確保し、連結時のコピーを避けます。
+        blocksを渡すとffmpegを起動せず、そのブロック列を連結します（AudioExtractor.streamなど）。
+        """
+        capacity = int((expected_duration or 60.0) * SAMPLE_RATE) + SAMPLE_RATE
+        buffer = np.empty(capacity, dtype=np.float32)
+        length = 0
+        if blocks is None:
+            blocks = cls.stream(video_path, stop_event=stop_event)
+        for block in blocks:
+            if length + len(block) > len(buffer):
+                grown = np.empty(max(len(buffer) * 2, length + len(block)), dtype=np.float32)
+                grown[:length] = buffer[:length]
+                buffer = grown
+            buffer[length:length + len(block)] = block
+            length += len(block)
+
+        # 余りが大きい場合のみ詰め直す
+        if length < len(buffer) * 0.9:
+            return buffer[:length].copy()
+        return buffer[:length]
+
+    @staticmethod
+    def write_wav(audio, output_path):
+        """float32配列を16kHzモノラルのWAVとして保存（確認用）"""
+        pcm = np.clip(audio, -1.0, 1.0 - 1.0 / 32768.0) * 32768.0
+        with wave.open(output_path, 'wb') as f:
+            f.setnchannels(1)
+            f.setsampwidth(BYTES_PER_SAMPLE)
+            f.setframerate(SAMPLE_RATE)
+            f.writeframes(pcm.astype('<i2').tobytes())
+        return output_path
+
+class VolumeLimiter:
+    """ストレージのボリュームごとに同時に読み込むファイル数を制限する
+
+    max_readsがNoneなら制限しません。ボリュームはWindowsではドライブ・UNCの共有、
+    それ以外ではファイルのあるデバイス（マウントごとに異なる）で区別します。
+    """
+
+    def __init__(self, max_reads=None):
+        self.max_reads = max_reads
+        self._lock = threading.Lock()
+        self._semaphores = {}
+
+    @staticmethod
+    def volume_of(path):
+        path = os.path.abspath(path)
+        drive, _ = os.path.splitdrive(path)
+        if drive:
+            return drive.lower()
+        for candidate in (path, os.path.dirname(path)):
+            try:
+                return os.stat(candidate).st_dev
+            except OSError:
+                continue
+        return None
+
+    @contextmanager
+    def reading(self, path):
+        if not self.max_reads:
+            yield
+            return
+        volume = self.volume_of(path)
+        with self._lock:
+            semaphore = self._semaphores.setdefault(volume, threading.BoundedSemaphore(self.max_reads))
+        with semaphore:
+            yield
+
+class AudioExtractor:
+    """ネットワーク上の大きな素材から音声を取り出す抽出設定
+
+    音声ストリームを明示的に選んで映像はデコードしません。demux_dirを指定すると、
+    音声ストリームだけをストリームコピー（デコードなし）でローカルの一時ファイルに取り出してから
+    16kHzに変換するため、共有ストレージを読んでいる時間が短くなります。
+    元ファイルの読み込みはボリュームごとにmax_reads_per_volume件までに制限します（制限はプロセスごとのため、
+    元ファイルはコーディネートするプロセスでだけ読みます）。ストリーミングでは枠をブロックを
+    読む間だけ使うため、分割モードの文字起こしの間は他のファイルが読めます。
+
+    hashで取り出したローカルのコピーは、続くstream・loadで元ファイルを読み直さずに使います
+    （使わなかったコピーはdiscardで削除します）。
+    """
+
+    def __init__(self, demux_dir=None, max_reads_per_volume=None):
+        self.demux_dir = demux_dir
+        self.limiter = VolumeLimiter(max_reads_per_volume)
+        self._lock = threading.Lock()
+        self._copies = {}  # 元ファイルの絶対パス -> hashで取り出したローカルのコピー
+
+    def __getstate__(self):
+        # ワーカープロセスには設定だけを渡す（制限はプロセスごと）
+        return {'demux_dir': self.demux_dir, 'max_reads_per_volume': self.limiter.max_reads}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    @staticmethod
+    def _selector(audio_stream):
+        return 'a:0' if audio_stream is None else str(audio_stream['index'])
+
+    def demux(self, video_path, audio_stream=None, stop_event=None):
+        """音声ストリームをストリームコピーでローカルのMatroskaに取り出し、そのパスを返す"""
+        fd, local_path = tempfile.mkstemp(prefix='whisper_demux_', suffix='.mka', dir=self.demux_dir)
+        os.close(fd)
+        try:
+            with self.limiter.reading(video_path):
+                process = (
+                    ffmpeg
+                    .input(video_path)[self._selector(audio_stream)]
+                    .output(local_path, acodec='copy', format='matroska', loglevel='error')
+                    .overwrite_output()
+                    .run_async(pipe_stderr=True)
+                )
+                while True:
+                    try:
+                        process.wait(timeout=0.5)
+                        break
+                    except subprocess.TimeoutExpired:
+                        if stop_event is not None and stop_event.is_set():
+                            process.kill()
+                            process.wait()
+                            raise RuntimeError("処理がキャンセルされました")
+                stderr = process.stderr.read()
+                if process.returncode != 0:
+                    raise ffmpeg.Error('ffmpeg', None, stderr)
+        except BaseException:
+            os.remove(local_path)
+            raise
+        return local_path
+
+    def hash(self, video_path, audio_stream=None, stop_event=None):
+        """音声ストリームのハッシュ（キャッシュキー用）
+
+        demux_dirがあれば取り出したローカルのコピーをハッシュし、コピーは続く抽出に残します。
+        元ファイルを読むのは制限の範囲内の1回だけです。
+        """
+        if self.demux_dir is not None:
+            try:
+                local_path = self.demux(video_path, audio_stream, stop_event)
+            except ffmpeg.Error:
+                local_path = None
+            if local_path is not None:
+                with self._lock:
+                    previous = self._copies.pop(os.path.abspath(video_path), None)
+                    self._copies[os.path.abspath(video_path)] = local_path
+                if previous is not None:
+                    os.remove(previous)
+                return AudioLoader.hash_packets(local_path)
+        with self.limiter.reading(video_path):
+            return AudioLoader.hash_packets(video_path, self._selector(audio_stream))
+
+    def discard(self, video_path=None):
+        """hashで残したコピーを削除（Noneならすべて）"""
+        with self._lock:
+            if video_path is None:
+                paths = list(self._copies.values())
+                self._copies.clear()
+            else:
+                path = self._copies.pop(os.path.abspath(video_path), None)
+                paths = [] if path is None else [path]
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def stream(self, video_path, audio_stream=None, start=None, duration=None, block_seconds=30.0,
+               stop_event=None):
+        """AudioLoader.streamと同じfloat32のブロックを返すジェネレータ（audio_streamはprobeの音声ストリーム）"""
+        with self._lock:
+            local_path = self._copies.pop(os.path.abspath(video_path), None)
+        if local_path is None and self.demux_dir is not None:
+            try:
+                local_path = self.demux(video_path, audio_stream, stop_event)
+            except ffmpeg.Error:
+                local_path = None  # コピーできないコーデックは直接デコード
+        if local_path is None:
+            blocks = AudioLoader.stream(video_path, block_seconds, stop_event,
+                                        self._selector(audio_stream), start, duration)
+            try:
+                while True:
+                    # ブロックを受け取る間だけ枠を使う（その間以外のffmpegの先読みはパイプのバッファ分のみ）
+                    with self.limiter.reading(video_path):
+                        block = next(blocks, None)
+                    if block is None:
+                        return
+                    yield block
+            finally:
+                blocks.close()
+        try:
+            yield from AudioLoader.stream(local_path, block_seconds, stop_event, 'a:0', start, duration)
+        finally:
+            os.remove(local_path)
+
+    def load(self, video_path, audio_stream=None, start=None, duration=None, expected_duration=None,
+             stop_event=None):
+        """音声（またはstartからduration秒）をfloat32配列として読み込む"""
+        if duration is not None:
+            expected_duration = duration
+        elif expected_duration and start:
+            expected_duration = max(expected_duration - start, 0.0)
+        blocks = self.stream(video_path, audio_stream, start, duration, stop_event=stop_event)
+        return AudioLoader.load(video_path, expected_duration=expected_duration, blocks=blocks)
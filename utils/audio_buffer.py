@@ -0,0 +1,128 @@
+import os
+import shutil
+import tempfile
+import threading
+import weakref
+import numpy as np
+from utils.audio import SAMPLE_RATE
+
+class AudioBuffer:
+    """共有音声バッファへの参照
+
+    pickleしてもパスとサンプル数だけなので、プロセス間で受け渡しても音声はコピーされません。
+    openで音声をfloat32のメモリマップとして開きます。
+    """
+
+    def __init__(self, path, samples, store=None):
+        self.path = path
+        self.samples = samples
+        self._store = store
+
+    def __getstate__(self):
+        # ストア（ロックを持つ）は作成したプロセスでのみ使う
+        return {'path': self.path, 'samples': self.samples, '_store': None}
+
+    def __len__(self):
+        return self.samples
+
+    @property
+    def duration(self):
+        return self.samples / SAMPLE_RATE
+
+    def open(self):
+        """音声をゼロコピーで開く（書き込みはプロセス内のコピーになり共有側は変わらない）"""
+        if not self.samples:
+            return np.zeros(0, dtype=np.float32)
+        return np.memmap(self.path, dtype=np.float32, mode='c', shape=(self.samples,))
+
+    def blocks(self, block_seconds=30.0):
+        """AudioLoader.streamと同じ大きさのブロック（ビュー）を返すジェネレータ"""
+        audio = self.open()
+        size = int(block_seconds * SAMPLE_RATE)
+        for start in range(0, len(audio), size):
+            yield audio[start:start + size]
+
+    def acquire(self):
+        if self._store is not None:
+            self._store.acquire(self)
+        return self
+
+    def release(self):
+        if self._store is not None:
+            self._store.release(self)
+
+class AudioBufferStore:
+    """抽出した16kHz PCMを置く共有バッファのストア（参照カウント付き）
+
+    音声はdirectory内のfloat32のファイルとして置き、各プロセスはメモリマップで読みます。
+    ProcessPoolExecutorに音声をpickleして渡す代わりにAudioBufferを渡し、重複判定で
+    デコードした音声を文字起こしでも使うために使います。参照カウントが0になった
+    バッファと、closeまたはストアの破棄時に残っているバッファは削除します。
+    """
+
+    def __init__(self, directory=None):
+        self.directory = tempfile.mkdtemp(prefix='whisper_audio_', dir=directory)
+        self._lock = threading.Lock()
+        self._refs = {}  # パス -> 参照数
+        self._next_id = 0
+        self._finalizer = weakref.finalize(self, shutil.rmtree, self.directory, True)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._refs)
+
+    def _new_path(self):
+        with self._lock:
+            self._next_id += 1
+            path = os.path.join(self.directory, f"{self._next_id}.f32")
+            self._refs[path] = 1
+        return path
+
+    def put(self, audio):
+        """音声をバッファにコピーし、参照数1のAudioBufferを返す"""
+        audio = np.asarray(audio, dtype=np.float32)
+        path = self._new_path()
+        with open(path, 'wb') as f:
+            f.write(memoryview(np.ascontiguousarray(audio)).cast('B'))
+        return AudioBuffer(path, len(audio), self)
+
+    def put_blocks(self, blocks):
+        """ブロック列（AudioExtractor.streamなど）を順に書き込み、参照数1のAudioBufferを返す
+
+        音声全体をメモリに持たないため、分割モードの長時間の素材にも使えます。
+        """
+        buffer = AudioBuffer(self._new_path(), 0, self)
+        try:
+            with open(buffer.path, 'wb') as f:
+                for block in blocks:
+                    block = np.ascontiguousarray(block, dtype=np.float32)
+                    f.write(memoryview(block).cast('B'))
+                    buffer.samples += len(block)
+        except BaseException:
+            buffer.release()
+            raise
+        return buffer
+
+    def acquire(self, buffer):
+        with self._lock:
+            self._refs[buffer.path] += 1
+
+    def release(self, buffer):
+        with self._lock:
+            count = self._refs.get(buffer.path)
+            if count is None:
+                return
+            if count > 1:
+                self._refs[buffer.path] = count - 1
+                return
+            del self._refs[buffer.path]
+        try:
+            # 開いているメモリマップは削除後も有効（Windowsでは閉じるまで削除できないためcloseで消す）
+            os.remove(buffer.path)
+        except OSError:
+            pass
+
+    def close(self):
+        with self._lock:
+            self._refs.clear()
+        self._finalizer()
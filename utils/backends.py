@@ -0,0 +1,177 @@
+import zlib
+import torch
+import whisper
+from whisper.audio import HOP_LENGTH, N_FRAMES, SAMPLE_RATE
+from whisper.timing import add_word_timestamps
+
+TIME_PRECISION = HOP_LENGTH * 2 / SAMPLE_RATE  # タイムスタンプトークン1つ分の秒数（0.02秒）
+NO_SPEECH_THRESHOLD = 0.6     # whisper.transcribeと同じ無音判定
+LOGPROB_THRESHOLD = -1.0
+
+class WhisperBackend:
+    """openai-whisperによる推論（GPUではfp16、CPUではfp32）"""
+    name = "whisper"
+
+    @staticmethod
+    def precision(device):
+        return "fp16" if device == "cuda" else "fp32"
+
+    @classmethod
+    def supports(cls, device):
+        return True
+
+    @classmethod
+    def load(cls, model_name, device):
+        return whisper.load_model(model_name, device=device)
+
+    @staticmethod
+    def transcribe(model, audio, verbose=None, **options):
+        return model.transcribe(audio, verbose=verbose, **options)
+
+    @staticmethod
+    def _tokenizer(model, language, task):
+        kwargs = {'language': language, 'task': task}
+        if hasattr(model, 'num_languages'):
+            kwargs['num_languages'] = model.num_languages
+        return whisper.tokenizer.get_tokenizer(model.is_multilingual, **kwargs)
+
+    @staticmethod
+    def _split_tokens(tokenizer, tokens, duration):
+        """タイムスタンプトークンで区切って (開始, 終了, テキストトークン) のリストにする"""
+        pieces = []
+        start = None
+        last = 0.0  # 直前のタイムスタンプ
+        text_tokens = []
+        for token in tokens:
+            if token >= tokenizer.timestamp_begin:
+                t = last = (token - tokenizer.timestamp_begin) * TIME_PRECISION
+                if start is not None and text_tokens:
+                    pieces.append((start, t, text_tokens))
+                    start, text_tokens = None, []
+                else:
+                    start = t
+            elif token < tokenizer.eot:
+                text_tokens.append(token)
+        if text_tokens:
+            # 終了タイムスタンプが無い末尾はウィンドウの終わりまで
+            pieces.append((last if start is None else start, max(duration, last), text_tokens))
+        return pieces
+
+    @classmethod
+    def detect(cls, model, audios, options):
+        """30秒以下の音声ごとに (言語ごとの確率, 無音の確率) を返す
+
+        エンコーダ1回と、<|startoftranscript|> だけを入れたデコーダ1ステップで判定します
+        （whisper.decodeの言語判定・無音判定と同じ位置のロジット）。英語専用モデルの言語は常に 'en' です。
+        """
+        n_mels = model.dims.n_mels
+        mels = torch.stack([
+            whisper.log_mel_spectrogram(whisper.pad_or_trim(audio), n_mels) for audio in audios
+        ]).to(model.device)
+        if options.get('fp16'):
+            mels = mels.half()
+        tokenizer = cls._tokenizer(model, None, options.get('task', 'transcribe'))
+        with torch.no_grad():
+            features = model.embed_audio(mels)
+            tokens = torch.tensor([[tokenizer.sot]] * len(audios), device=model.device)
+            logits = model.logits(tokens, features)[:, 0].float()
+        no_speech = logits.softmax(dim=-1)[:, tokenizer.no_speech].tolist()
+        if not model.is_multilingual:
+            return [({'en': 1.0}, p) for p in no_speech]
+        language_tokens = list(tokenizer.all_language_tokens)
+        probabilities = logits[:, language_tokens].softmax(dim=-1).cpu().tolist()
+        codes = tokenizer.all_language_codes
+        return [(dict(zip(codes, row)), p) for row, p in zip(probabilities, no_speech)]
+
+    @classmethod
+    def decode_batch(cls, model, audios, options):
+        """30秒以下の音声のリストを1回のエンコーダ/デコーダのバッチでデコード
+
+        音声ごとに {'segments', 'language'} を返します。セグメントの時刻は各音声の
+        先頭からの秒数です。温度は0固定で、whisper.transcribeと同じ基準で無音と
+        判定したウィンドウはセグメントを返しません。
+        """
+        n_mels = model.dims.n_mels
+        mels = torch.stack([
+            whisper.log_mel_spectrogram(whisper.pad_or_trim(audio), n_mels) for audio in audios
+        ]).to(model.device)
+        task = options.get('task', 'transcribe')
+        decoded = whisper.decode(model, mels, whisper.DecodingOptions(
+            task=task,
+            language=options.get('language'),
+            temperature=0.0,
+            prompt=options.get('initial_prompt'),
+            without_timestamps=False,
+            fp16=options.get('fp16', False)
+        ))
+
+        outputs = []
+        for index, (audio, result) in enumerate(zip(audios, decoded)):
+            duration = len(audio) / SAMPLE_RATE
+            if result.no_speech_prob > NO_SPEECH_THRESHOLD and result.avg_logprob < LOGPROB_THRESHOLD:
+                outputs.append({'segments': [], 'language': result.language})
+                continue
+            tokenizer = cls._tokenizer(model, result.language, task)
+            segments = []
+            for start, end, text_tokens in cls._split_tokens(tokenizer, result.tokens, duration):
+                text = tokenizer.decode(text_tokens)
+                segments.append({
+                    'seek': 0,
+                    'start': start,
+                    'end': min(end, duration),
+                    'text': text,
+                    'tokens': text_tokens,
+                    'temperature': 0.0,
+                    'avg_logprob': result.avg_logprob,
+                    'compression_ratio': len(text.encode('utf-8')) / max(len(zlib.compress(text.encode('utf-8'))), 1),
+                    'no_speech_prob': result.no_speech_prob
+                })
+            if segments and options.get('word_timestamps'):
+                add_word_timestamps(
+                    segments=segments,
+                    model=model,
+                    tokenizer=tokenizer,
+                    mel=mels[index],
+                    num_frames=min(len(audio) // HOP_LENGTH, N_FRAMES),
+                    prepend_punctuations=options.get('prepend_punctuations', "\"'“¿([{-"),
+                    append_punctuations=options.get('append_punctuations', "\"'.。,，!！?？:：”)]}、")
+                )
+            outputs.append({'segments': segments, 'language': result.language})
+        return outputs
+
+class QuantizedWhisperBackend(WhisperBackend):
+    """Linear層をint8に動的量子化したopenai-whisper（CPU専用）
+
+    重みはロード時に一度だけint8化し、活性は推論時に量子化します。
+    エンコーダ/デコーダの計算の大半を占めるLinear層がint8 GEMMになるため、
+    GPUの無い環境でのスループットが向上します（認識結果はfp32と僅かに異なります）。
+    """
+    name = "whisper-int8"
+
+    @staticmethod
+    def precision(device):
+        return "int8"
+
+    @classmethod
+    def supports(cls, device):
+        return device == "cpu"
+
+    @classmethod
+    def load(cls, model_name, device):
+        model = whisper.load_model(model_name, device="cpu")
+        # whisperのLinearはdtypeを合わせるだけのサブクラスのため、
+        # quantize_dynamicの対象になるよう素のnn.Linearとして扱う
+        for module in model.modules():
+            if isinstance(module, torch.nn.Linear):
+                module.__class__ = torch.nn.Linear
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+BACKENDS = {backend.name: backend for backend in (WhisperBackend, QuantizedWhisperBackend)}
+DEFAULT_BACKEND = WhisperBackend.name
+
+def get_backend(name=None):
+    """名前からバックエンドを取得"""
+    try:
+        return BACKENDS[name or DEFAULT_BACKEND]
+    except KeyError:
+        raise ValueError(f"未対応のバックエンドです: {name}（{', '.join(BACKENDS)}）")
@@ -0,0 +1,155 @@
+import os
+import gzip
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from contextlib import contextmanager
+from utils.audio import AudioLoader
+from utils.fingerprint import AudioFingerprint
+
+CACHE_VERSION = 1
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'whisper_srt')
+DEFAULT_MAX_BYTES = 2 * 1024**3  # 2GB
+
+class TranscriptionCache:
+    """音声内容のハッシュをキーにした文字起こし結果の永続キャッシュ
+
+    キーは音声ストリームのハッシュ・モデル名・デコード設定から作り、
+    結果（セグメントと単語）はgzip圧縮したJSONとして保存します。
+    インデックスはSQLiteで管理し、合計サイズがmax_bytesを超えると
+    最終アクセスの古いものから削除します（LRU）。
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir or DEFAULT_CACHE_DIR
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._db_path = os.path.join(self.cache_dir, 'index.sqlite3')
+        with self._connect() as db:
+            db.execute('CREATE TABLE IF NOT EXISTS entries ('
+                       'key TEXT PRIMARY KEY, size INTEGER, last_access REAL)')
+            # 同じファイルを毎回ハッシュしないための (パス, サイズ, 更新時刻) -> 音声ハッシュ
+            db.execute('CREATE TABLE IF NOT EXISTS audio_hashes ('
+                       'path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, audio_hash TEXT)')
+            # 差分の再文字起こし用：パス・設定ごとに最後に文字起こしした版（結果のキーと音声の指紋）
+            db.execute('CREATE TABLE IF NOT EXISTS versions ('
+                       'path TEXT, settings TEXT, key TEXT, duration REAL, codes BLOB, '
+                       'PRIMARY KEY (path, settings))')
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self._db_path, timeout=30)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def _blob_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json.gz")
+
+    def audio_hash(self, video_path, extractor=None):
+        """音声ハッシュを取得（ファイルが変わっていなければ記録済みの値を使う）
+
+        extractor（AudioExtractor）を渡すと、ボリュームごとの読み込み制限の範囲で
+        抽出用に取り出したローカルのコピーからハッシュします。
+        """
+        path = os.path.abspath(video_path)
+        stat = os.stat(path)
+        with self._lock, self._connect() as db:
+            row = db.execute('SELECT size, mtime_ns, audio_hash FROM audio_hashes WHERE path = ?',
+                             (path,)).fetchone()
+        if row and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+            return row[2]
+
+        if extractor is not None:
+            audio_hash = extractor.hash(path)
+        else:
+            audio_hash = AudioLoader.hash_packets(path)
+        with self._lock, self._connect() as db:
+            db.execute('INSERT OR REPLACE INTO audio_hashes VALUES (?, ?, ?, ?)',
+                       (path, stat.st_size, stat.st_mtime_ns, audio_hash))
+        return audio_hash
+
+    @staticmethod
+    def make_key(audio_hash, model_name, options):
+        """音声ハッシュ・モデル・デコード設定からキャッシュキーを生成"""
+        payload = json.dumps({
+            'version': CACHE_VERSION,
+            'audio': audio_hash,
+            'model': model_name,
+            'options': options
+        }, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get_version(self, video_path, settings):
+        """前回文字起こしした版の (キャッシュキー, AudioFingerprint) を返す（無ければNone）"""
+        with self._lock, self._connect() as db:
+            row = db.execute('SELECT key, duration, codes FROM versions WHERE path = ? AND settings = ?',
+                             (os.path.abspath(video_path), settings)).fetchone()
+        if row is None:
+            return None
+        return row[0], AudioFingerprint.from_bytes(row[2], row[1])
+
+    def put_version(self, video_path, settings, key, fingerprint):
+        with self._lock, self._connect() as db:
+            db.execute('INSERT OR REPLACE INTO versions VALUES (?, ?, ?, ?, ?)',
+                       (os.path.abspath(video_path), settings, key, fingerprint.duration,
+                        sqlite3.Binary(fingerprint.to_bytes())))
+
+    def get(self, key):
+        """キャッシュされた結果を返す（無ければNone）"""
+        path = self._blob_path(key)
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                result = json.load(f)
+        except (OSError, ValueError):
+            return None
+        with self._lock, self._connect() as db:
+            db.execute('UPDATE entries SET last_access = ? WHERE key = ?', (time.time(), key))
+        return result
+
+    def put(self, key, result):
+        """結果を保存（トークン列など再生成に不要な項目は除く）"""
+        compact = {
+            'text': result.get('text', ''),
+            'language': result.get('language'),
+            'language_probability': result.get('language_probability'),
+            'preset': result.get('preset'),
+            'no_speech': result.get('no_speech', False),
+            'duration': result.get('duration'),
+            'segments': [
+                {k: v for k, v in segment.items() if k not in ('tokens', 'file_name')}
+                for segment in result.get('segments', [])
+            ]
+        }
+        path = self._blob_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with gzip.open(temp_path, 'wt', encoding='utf-8', compresslevel=6) as f:
+            json.dump(compact, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(temp_path, path)
+
+        with self._lock, self._connect() as db:
+            db.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?)',
+                       (key, os.path.getsize(path), time.time()))
+        self.evict()
+
+    def evict(self):
+        """合計サイズが上限を超えていれば古いエントリから削除"""
+        with self._lock, self._connect() as db:
+            total = db.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            for key, size in db.execute('SELECT key, size FROM entries ORDER BY last_access').fetchall():
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(self._blob_path(key))
+                except OSError:
+                    pass
+                db.execute('DELETE FROM entries WHERE key = ?', (key,))
+                total -= size
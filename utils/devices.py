@@ -0,0 +1,181 @@
+import torch
+
+# モデルごとのおおよそのGPUメモリ使用量（MB、fp16推論時の重みと作業領域）
+MODEL_MEMORY_MB = {
+    'tiny': 1000,
+    'base': 1000,
+    'small': 2000,
+    'medium': 5000,
+    'turbo': 6000,
+    'large': 10000
+}
+# バッチに30秒ウィンドウを1つ追加するごとに必要なメモリ（MB、エンコーダの活性とKVキャッシュ）
+WINDOW_MEMORY_MB = {
+    'tiny': 60,
+    'base': 100,
+    'small': 200,
+    'medium': 400,
+    'turbo': 500,
+    'large': 700
+}
+MODEL_LADDER = ('large', 'turbo', 'medium', 'small', 'base', 'tiny')  # 大きい順
+SAFETY_MARGIN = 0.1  # 空きメモリのうち使わずに残す割合
+
+def model_family(model_name):
+    """'large-v3' や 'small.en' を 'large' / 'small' にまとめる"""
+    for family in MODEL_MEMORY_MB:
+        if model_name.startswith(family):
+            return family
+    return 'large'  # 不明なモデルは最大として扱う
+
+class DeviceOutOfMemoryError(RuntimeError):
+    """シミュレーションデバイスでのメモリ不足"""
+
+class CPUDevice:
+    """CPU（メモリ制約の判定は行わない）"""
+    name = "cpu"
+    torch_device = "cpu"
+    is_gpu = False
+
+    def free_bytes(self):
+        return None
+
+    def total_bytes(self):
+        return None
+
+    def allocated_bytes(self):
+        return 0
+
+    def empty_cache(self):
+        pass
+
+    def reserve(self, required_bytes):
+        pass
+
+class CUDADevice(CPUDevice):
+    """CUDA GPU（空きメモリはドライバから取得）"""
+    name = "cuda"
+    torch_device = "cuda"
+    is_gpu = True
+
+    @staticmethod
+    def available():
+        return torch.cuda.is_available()
+
+    def free_bytes(self):
+        return torch.cuda.mem_get_info()[0]
+
+    def total_bytes(self):
+        return torch.cuda.mem_get_info()[1]
+
+    def allocated_bytes(self):
+        return torch.cuda.memory_allocated()
+
+    def empty_cache(self):
+        torch.cuda.empty_cache()
+
+class SimulatedDevice(CPUDevice):
+    """GPUの無い環境で、メモリの少ないGPUを模擬するデバイス
+
+    計算はCPUで行い、空きメモリとしてfree_mbを報告します。reserveで
+    必要量が空きを超えるとDeviceOutOfMemoryErrorを送出するため、
+    バッチ縮小やCPUへのフォールバックをGPU無しで確認できます。
+    """
+    name = "simulated"
+    is_gpu = True
+
+    def __init__(self, free_mb, total_mb=None):
+        self.free_mb = free_mb
+        self.total_mb = total_mb or free_mb
+
+    def free_bytes(self):
+        return int(self.free_mb * 1024**2)
+
+    def total_bytes(self):
+        return int(self.total_mb * 1024**2)
+
+    def reserve(self, required_bytes):
+        if required_bytes > self.free_bytes():
+            raise DeviceOutOfMemoryError(
+                f"CUDA out of memory (simulated): {required_bytes / 1024**2:.0f}MB required, "
+                f"{self.free_mb:.0f}MB free")
+
+class DeviceManager:
+    """推論デバイスの選択とGPUメモリの管理
+
+    ロード前に空きメモリとモデルの使用量を比べてバッチサイズ（必要ならモデル）を
+    決め、収まらなければCPUを使います。推論中のメモリ不足はis_oomで判定し、
+    WhisperTranscriber側でバッチ縮小・CPUでの再実行に使います。
+    """
+
+    def __init__(self, device):
+        self.device = device
+
+    @classmethod
+    def detect(cls, use_gpu=True):
+        if use_gpu and CUDADevice.available():
+            return cls(CUDADevice())
+        return cls(CPUDevice())
+
+    @property
+    def name(self):
+        return self.device.name
+
+    @property
+    def torch_device(self):
+        return self.device.torch_device
+
+    @property
+    def is_gpu(self):
+        return self.device.is_gpu
+
+    @staticmethod
+    def required_bytes(model_name, windows=1):
+        family = model_family(model_name)
+        return int((MODEL_MEMORY_MB[family] + WINDOW_MEMORY_MB[family] * windows) * 1024**2)
+
+    def plan(self, model_name, batch_size, allow_downgrade=False):
+        """空きメモリに収まる (モデル名, バッチサイズ, GPUを使うか) を返す
+
+        バッチサイズを減らしても収まらない場合、allow_downgrade=Trueなら小さいモデルを、
+        そうでなければCPUを選びます。
+        """
+        if not self.is_gpu:
+            return model_name, batch_size, False
+        free = self.device.free_bytes() * (1 - SAFETY_MARGIN)
+        candidates = [model_name]
+        if allow_downgrade:
+            family = model_family(model_name)
+            candidates += list(MODEL_LADDER[MODEL_LADDER.index(family) + 1:])
+        for name in candidates:
+            base = self.required_bytes(name, 0)
+            per_window = self.required_bytes(name, 1) - base
+            if base + per_window <= free:
+                fits = int((free - base) // per_window)
+                return name, max(min(batch_size, fits), 1), True
+        return model_name, batch_size, False
+
+    def reserve(self, model_name, windows=1):
+        """推論前のメモリ確認（シミュレーションデバイスのみ不足時に例外）"""
+        self.device.reserve(self.required_bytes(model_name, windows))
+
+    @staticmethod
+    def is_oom(error):
+        if isinstance(error, DeviceOutOfMemoryError):
+            return True
+        oom_type = getattr(torch.cuda, 'OutOfMemoryError', None)
+        if oom_type is not None and isinstance(error, oom_type):
+            return True
+        return isinstance(error, RuntimeError) and 'out of memory' in str(error).lower()
+
+    def empty_cache(self):
+        self.device.empty_cache()
+
+    def memory_report(self):
+        """ログ用のメモリ使用状況（GPU以外は空文字）"""
+        if not self.is_gpu:
+            return ""
+        free = self.device.free_bytes()
+        total = self.device.total_bytes()
+        return (f"使用中 {self.device.allocated_bytes() / 1024**2:.2f}MB / "
+                f"空き {free / 1024**2:.0f}MB / 合計 {total / 1024**2:.0f}MB")
@@ -0,0 +1,296 @@
+import numpy as np
+from utils.audio import AudioLoader, SAMPLE_RATE
+
+FRAME_SAMPLES = 2048   # 128ms
+HOP_SAMPLES = 256      # 16ms（オフセットの分解能）
+HOP_SECONDS = HOP_SAMPLES / SAMPLE_RATE
+BAND_EDGES_HZ = np.geomspace(300.0, 2000.0, 34)  # 33バンド -> 32ビット
+SILENCE_DB = -60.0     # これより静かなフレームは照合に使わない
+MAX_CODE_REPEATS = 4   # 何度も現れる符号（持続音など）は位置の投票に使わない
+
+_BAND_BINS = np.round(BAND_EDGES_HZ * FRAME_SAMPLES / SAMPLE_RATE).astype(np.int64)
+_WINDOW = np.hanning(FRAME_SAMPLES).astype(np.float32)
+_BIT_WEIGHTS = (1 << np.arange(32, dtype=np.uint64)).astype(np.uint64)
+
+class AudioFingerprint:
+    """16kHz PCMから作る音声の指紋（16msごとの32ビット符号）
+
+    隣り合う周波数バンドのエネルギー差の時間変化の符号をビットにしたもので、
+    音量差や再エンコード（.movと.mp4、プロキシ）の影響を受けにくく、
+    一致する符号の位置の差から時間のずれも求められます。無音のフレームは0です。
+    """
+
+    def __init__(self, codes, duration):
+        self.codes = np.asarray(codes, dtype=np.uint32)
+        self.duration = float(duration)
+
+    def __len__(self):
+        return len(self.codes)
+
+    @classmethod
+    def compute(cls, blocks):
+        """float32のブロック列（AudioLoader.streamなど）から指紋を作成"""
+        parts = []
+        carry = np.zeros(0, dtype=np.float32)
+        previous = None  # 直前のフレームのバンド間エネルギー差
+        total = 0
+        for block in blocks:
+            total += len(block)
+            buffer = np.concatenate([carry, block]) if len(carry) else block
+            if len(buffer) < FRAME_SAMPLES:
+                carry = buffer.copy()
+                continue
+            n_frames = (len(buffer) - FRAME_SAMPLES) // HOP_SAMPLES + 1
+            frames = np.lib.stride_tricks.sliding_window_view(buffer, FRAME_SAMPLES)[::HOP_SAMPLES][:n_frames]
+            carry = buffer[n_frames * HOP_SAMPLES:].copy()
+
+            power = np.abs(np.fft.rfft(frames * _WINDOW, axis=1)) ** 2
+            cumulative = np.cumsum(power, axis=1)
+            energies = cumulative[:, _BAND_BINS[1:]] - cumulative[:, _BAND_BINS[:-1]]
+            differences = energies[:, :-1] - energies[:, 1:]
+            if previous is None:
+                previous = differences[:1]
+            bits = (differences - np.concatenate([previous, differences[:-1]])) > 0
+            previous = differences[-1:]
+
+            codes = (bits.astype(np.uint64) @ _BIT_WEIGHTS).astype(np.uint32)
+            rms = np.sqrt(np.mean(np.square(frames, dtype=np.float32), axis=1) + 1e-10)
+            codes[20.0 * np.log10(rms) < SILENCE_DB] = 0
+            parts.append(codes)
+        codes = np.concatenate(parts) if parts else np.zeros(0, dtype=np.uint32)
+        return cls(codes, total / SAMPLE_RATE)
+
+    @classmethod
+    def from_file(cls, video_path, stop_event=None):
+        return cls.compute(AudioLoader.stream(video_path, stop_event=stop_event))
+
+    def to_bytes(self):
+        return self.codes.astype('<u4').tobytes()
+
+    @classmethod
+    def from_bytes(cls, data, duration):
+        return cls(np.frombuffer(data, dtype='<u4'), duration)
+
+    def _offset_candidates(self, other, count=3):
+        """一致する符号の位置の差で投票し、票の多いフレームオフセットを返す"""
+        valid = np.flatnonzero(self.codes)
+        order = valid[np.argsort(self.codes[valid], kind='stable')]
+        sorted_codes = self.codes[order]
+        other_positions = np.flatnonzero(other.codes)
+        other_codes = other.codes[other_positions]
+        left = np.searchsorted(sorted_codes, other_codes, 'left')
+        right = np.searchsorted(sorted_codes, other_codes, 'right')
+        repeats = right - left
+        usable = (repeats > 0) & (repeats <= MAX_CODE_REPEATS)
+        if not usable.any():
+            return []
+        left, repeats, other_positions = left[usable], repeats[usable], other_positions[usable]
+        # 各一致について (selfの位置 - otherの位置) を展開
+        starts = np.repeat(left - np.cumsum(repeats) + repeats, repeats) + np.arange(repeats.sum())
+        offsets = order[starts] - np.repeat(other_positions, repeats)
+        votes = np.bincount(offsets + len(other))
+        best = np.argsort(votes)[::-1][:count]
+        return [int(index) - len(other) for index in best if votes[index] >= 3]
+
+    def bit_error_rate(self, other, offset):
+        """otherのフレームjとselfのフレームj+offsetを比べた (ビット誤り率, 比較したフレーム数, 重なりの範囲)"""
+        first = max(0, -offset)
+        last = min(len(other), len(self) - offset)
+        if last <= first:
+            return 1.0, 0, (first, first)
+        mine = self.codes[first + offset:last + offset]
+        theirs = other.codes[first:last]
+        both = (mine != 0) & (theirs != 0)
+        compared = int(both.sum())
+        if not compared:
+            return 1.0, 0, (first, last)
+        differing = np.unpackbits((mine[both] ^ theirs[both]).view(np.uint8)).sum()
+        return float(differing) / (compared * 32), compared, (first, last)
+
+    def match(self, other, max_ber=0.3, min_overlap_seconds=10.0):
+        """otherが自分と同じ音声を（時間をずらして）含むかを判定
+
+        一致すれば {'offset', 'start', 'end', 'ber'} を返します（秒）。otherの時刻tが
+        自分の時刻t + offsetに対応し、otherの [start, end) が重なっている範囲です。
+        一致しなければNoneを返します。
+        """
+        best = None
+        for offset in self._offset_candidates(other):
+            ber, compared, (first, last) = self.bit_error_rate(other, offset)
+            if ber > max_ber or compared * HOP_SECONDS < min_overlap_seconds * 0.5:
+                continue
+            if (last - first) * HOP_SECONDS < min_overlap_seconds:
+                continue
+            if best is None or ber < best['ber']:
+                best = {
+                    'offset': offset * HOP_SECONDS,
+                    'start': first * HOP_SECONDS,
+                    'end': min(last * HOP_SECONDS + (FRAME_SAMPLES - HOP_SAMPLES) / SAMPLE_RATE, other.duration),
+                    'ber': round(ber, 4)
+                }
+        return best
+
+def find_duplicates(fingerprints, max_ber=0.3, min_overlap_seconds=10.0):
+    """同じ音声を含むファイルを探し、{重複ファイル: 対応} を返す
+
+    fingerprintsは {パス: AudioFingerprint} です。長いファイルから順に、既に選んだ
+    代表ファイルと照合し、一致すれば重複とします（代表は1回だけ文字起こしします）。
+    対応は AudioFingerprint.match の結果に代表のパス 'primary' を加えたものです。
+    """
+    primaries = []
+    duplicates = {}
+    for path, fingerprint in sorted(fingerprints.items(), key=lambda item: (-item[1].duration, item[0])):
+        for primary in primaries:
+            match = fingerprints[primary].match(fingerprint, max_ber, min_overlap_seconds)
+            if match is not None:
+                duplicates[path] = dict(match, primary=primary)
+                break
+        else:
+            primaries.append(path)
+    return duplicates
+
+def shift_segment(segment, offset):
+    """セグメント（と単語）の時刻をoffset秒ずらしたコピー"""
+    shifted = dict(segment, start=segment['start'] + offset, end=segment['end'] + offset)
+    if segment.get('words'):
+        shifted['words'] = [dict(word, start=word['start'] + offset, end=word['end'] + offset)
+                            for word in segment['words']]
+    return shifted
+
+def project_segments(segments, match):
+    """代表ファイルのセグメントを重複ファイルの時間軸に写す
+
+    重なっている範囲 [start, end) に中央が入るセグメントだけを残し、範囲の端で切り詰めます。
+    """
+    projected = []
+    for segment in segments:
+        shifted = shift_segment(segment, -match['offset'])
+        middle = (shifted['start'] + shifted['end']) / 2
+        if not match['start'] <= middle < match['end']:
+            continue
+        shifted['start'] = max(shifted['start'], match['start'])
+        shifted['end'] = min(shifted['end'], match['end'])
+        if shifted.get('words'):
+            shifted['words'] = [word for word in shifted['words']
+                                if match['start'] <= (word['start'] + word['end']) / 2 < match['end']]
+        projected.append(shifted)
+    return projected
+
+def diff_regions(previous, current, window_seconds=1.0, max_ber=0.3, max_jitter=2):
+    """currentの時間軸を、previousと同じ音声の区間と変わった区間に分ける
+
+    window_seconds秒のウィンドウごとに、一致する符号の投票で得たオフセットの候補から
+    ビット誤り率が最も低いものを選びます。[{'start', 'end', 'offset'}] を返し、
+    offsetは同じ区間ならcurrentの時刻tがpreviousのt + offsetに対応する秒数、変わった区間はNoneです。
+    無音のウィンドウは直前の区間と同じずれでpreviousも無音なら同じとみなします。
+
+    挿入・削除の長さがホップ（16ms）の倍数でないと、隣り合うウィンドウのオフセットが
+    1ホップ違いで入れ替わるため、区間内のオフセットの幅がmax_jitterホップ以内なら
+    同じ区間としてまとめ、オフセットはウィンドウの中央値にします。
+    """
+    n = len(current)
+    if not n:
+        return []
+    width = max(int(round(window_seconds / HOP_SECONDS)), 1)
+    starts = np.arange(0, n, width)
+    positions = np.arange(n)
+    voiced = np.add.reduceat((current.codes != 0).astype(np.int64), starts)
+    silent = voiced < np.minimum(np.diff(np.append(starts, n)), width) * 0.25
+
+    best_ber = np.full(len(starts), np.inf)
+    best_offset = np.zeros(len(starts), dtype=np.int64)
+    candidates = previous._offset_candidates(current, count=8)
+    for offset in candidates:
+        mapped = positions + offset
+        inside = (mapped >= 0) & (mapped < len(previous))
+        theirs = np.zeros(n, dtype=np.uint32)
+        theirs[inside] = previous.codes[mapped[inside]]
+        both = (current.codes != 0) & (theirs != 0)
+        errors = np.unpackbits((current.codes ^ theirs).view(np.uint8)).reshape(n, 32).sum(axis=1) * both
+        compared = np.add.reduceat(both.astype(np.int64), starts)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ber = np.where(compared >= voiced * 0.5, np.add.reduceat(errors, starts) / (compared * 32.0), np.inf)
+        better = ber < best_ber
+        best_ber[better] = ber[better]
+        best_offset[better] = offset
+
+    labels = []  # ウィンドウごとのフレームオフセット（変更ありはNone）
+    for index, start in enumerate(starts):
+        if not silent[index]:
+            labels.append(int(best_offset[index]) if best_ber[index] <= max_ber else None)
+            continue
+        offset = labels[-1] if labels else (candidates[0] if candidates else None)
+        if offset is not None:
+            end = min(start + width, n)
+            first, last = start + offset, end + offset
+            if first < 0 or last > len(previous) or np.count_nonzero(previous.codes[first:last]) > (last - first) * 0.25:
+                offset = None
+        labels.append(offset)
+
+    regions = []
+    for index, offset in enumerate(labels):
+        start = int(starts[index]) * HOP_SECONDS
+        end = min(int(starts[index] + width) * HOP_SECONDS, current.duration)
+        if regions:
+            frames = regions[-1]['frames']
+            if offset is None and not frames:
+                regions[-1]['end'] = end
+                continue
+            if offset is not None and frames and max(max(frames), offset) - min(min(frames), offset) <= max_jitter:
+                frames.append(offset)
+                regions[-1]['end'] = end
+                continue
+        regions.append({'start': start, 'end': end, 'frames': [] if offset is None else [offset]})
+    for region in regions:
+        frames = region.pop('frames')
+        region['offset'] = int(np.median(frames)) * HOP_SECONDS if frames else None
+    return regions
+
+def plan_retranscription(previous, current, segments, margin=1.0, window_seconds=1.0, max_ber=0.3):
+    """前回の認識結果を再利用して、文字起こしし直す区間を決める
+
+    previous/currentは前回と今回の音声の指紋、segmentsは前回のセグメントです。
+    同じ区間のセグメントはずれ分ずらして残し、変わった区間（と区間のずれが変わる境目）の
+    前後margin秒と、そこにかかるセグメントの範囲を文字起こしし直します。
+    {'segments': 残すセグメント, 'regions': [(開始, 終了)], 'reused_seconds', 'transcribe_seconds'} を返します。
+    """
+    regions = diff_regions(previous, current, window_seconds, max_ber)
+    kept = []
+    changed = []
+    for index, region in enumerate(regions):
+        if region['offset'] is None:
+            changed.append((region['start'], region['end']))
+            continue
+        kept += project_segments(segments, region)
+        if index and regions[index - 1]['offset'] is not None:
+            # 削除・入れ替えの切れ目にかかるセグメントは前回のままでは使えない
+            changed.append((region['start'], region['start']))
+
+    duration = current.duration
+    changed = [(max(start - margin, 0.0), min(end + margin, duration)) for start, end in changed]
+    while True:
+        # 変更箇所にかかるセグメントは途中で切れないよう丸ごと作り直す
+        changed = _merge_intervals(changed)
+        overlapping = [segment for segment in kept
+                       if any(segment['start'] < end and segment['end'] > start for start, end in changed)]
+        if not overlapping:
+            break
+        kept = [segment for segment in kept if segment not in overlapping]
+        changed += [(segment['start'], segment['end']) for segment in overlapping]
+
+    transcribe_seconds = sum(end - start for start, end in changed)
+    return {
+        'segments': kept,
+        'regions': changed,
+        'reused_seconds': max(duration - transcribe_seconds, 0.0),
+        'transcribe_seconds': transcribe_seconds
+    }
+
+def _merge_intervals(intervals):
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
@@ -1,45 +1,97 @@
-from datetime import timedelta
+import os
+from xml.sax.saxutils import escape, quoteattr
+import numpy as np
+
+BATCH_SIZE = 10000  # タイムコードをまとめて変換する単位
+
+def _batched(iterable, size=BATCH_SIZE):
+    """iterableをsize件ずつのリストに分けて返す"""
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _split_seconds(seconds, unit):
+    """秒数の配列を (時, 分, 秒, 端数) の整数配列に分解
+
+    timedeltaと同様にマイクロ秒へ丸めてから整数演算で1秒をunit分割した値に切り捨てます。
+    """
+    micros = np.round(np.asarray(seconds, dtype=np.float64) * 1_000_000).astype(np.int64)
+    ticks = np.maximum(micros, 0) * unit // 1_000_000
+    hours, rest = np.divmod(ticks, 3600 * unit)
+    minutes, rest = np.divmod(rest, 60 * unit)
+    secs, fraction = np.divmod(rest, unit)
+    return hours.tolist(), minutes.tolist(), secs.tolist(), fraction.tolist()
 
 class EDLFormatter:
     HEADER_TEMPLATE = """TITLE: {title}
 FCM: NON-DROP FRAME
 
 """
-    
+
     ENTRY_TEMPLATE = """{number:03d}  AX       AA/V  C        {start_tc} {end_tc}
 * FROM CLIP NAME: {clip_name}
 * TEXT: {clip_name}
 
 """
-    
-    @staticmethod
-    def format_timecode(seconds):
+    FPS = 24  # 24fps想定
+
+    @classmethod
+    def format_timecodes(cls, seconds):
+        """秒数の配列をまとめてEDLタイムコード形式（HH:MM:SS:FF）に変換"""
+        hours, minutes, secs, frames = _split_seconds(seconds, cls.FPS)
+        return [f"{h:02d}:{m:02d}:{s:02d}:{f:02d}" for h, m, s, f in zip(hours, minutes, secs, frames)]
+
+    @classmethod
+    def format_timecode(cls, seconds):
         """秒数をEDLタイムコード形式（HH:MM:SS:FF）に変換"""
-        hours = int(seconds // 3600)
-        minutes = int((seconds % 3600) // 60)
-        secs = int(seconds % 60)
-        frames = min(int((seconds % 1) * 24), 23)  # 24fps想定、23フレームまで
-        return f"{hours:02d}:{minutes:02d}:{secs:02d}:{frames:02d}"
-        
+        return cls.format_timecodes([seconds])[0]
+
+    @classmethod
+    def iter_entries(cls, segments, title="Audio Transcription", first_number=1, offset=0.0, header=True):
+        """EDLの内容を先頭から順に文字列で返すジェネレータ（BATCH_SIZE件ごとに連結）
+
+        offset（秒）は全タイムコードに加算し、番号は有効なエントリにfirst_numberから連番で振ります。
+        結合タイムラインの途中から書き出す場合はheader=Falseにします。
+        """
+        if header:
+            yield cls.HEADER_TEMPLATE.format(title=title)
+
+        number = first_number
+        for batch in _batched(segments):
+            valid = [segment for segment in batch if cls.is_valid_segment(segment)]
+            if not valid:
+                continue
+            start_tcs = cls.format_timecodes(np.array([segment["start"] for segment in valid]) + offset)
+            end_tcs = cls.format_timecodes(np.array([segment["end"] for segment in valid]) + offset)
+            # ENTRY_TEMPLATEと同じ書式をバッチ単位で連結（1件ずつのformat呼び出しを避ける）
+            yield "".join([
+                f"{i:03d}  AX       AA/V  C        {start_tc} {end_tc}\n"
+                f"* FROM CLIP NAME: {clip_name}\n"
+                f"* TEXT: {clip_name}\n\n"
+                for i, clip_name, start_tc, end_tc in zip(
+                    range(number, number + len(valid)),
+                    [segment.get("file_name", "") for segment in valid],
+                    start_tcs,
+                    end_tcs
+                )
+            ])
+            number += len(valid)
+
+    @classmethod
+    def write(cls, segments, file, title="Audio Transcription"):
+        """EDLをファイルハンドルに逐次書き込み"""
+        file.writelines(cls.iter_entries(segments, title=title))
+
     @classmethod
     def generate(cls, segments, title="Audio Transcription"):
         """EDLファイルの内容を生成"""
-        content = cls.HEADER_TEMPLATE.format(title=title)
-        
-        for i, segment in enumerate(segments, 1):
-            if not cls.is_valid_segment(segment):
-                continue
-                
-            content += cls.ENTRY_TEMPLATE.format(
-                number=i,
-                start_tc=cls.format_timecode(segment["start"]),
-                end_tc=cls.format_timecode(segment["end"]),
-                clip_name=segment.get("file_name", ""),
-                text=segment["text"].strip()
-            )
-            
-        return content
-        
+        return "".join(cls.iter_entries(segments, title=title))
+
     @staticmethod
     def is_valid_segment(segment):
         """セグメントの妥当性をチェック"""
@@ -55,38 +107,83 @@ class SRTFormatter:
 {text}
 
 """
-    
+
     @staticmethod
-    def format_timestamp(seconds):
+    def format_timestamps(seconds):
+        """秒数の配列をまとめてSRT形式のタイムスタンプ（HH:MM:SS,mmm）に変換"""
+        hours, minutes, secs, millis = _split_seconds(seconds, 1000)
+        return [f"{h:02d}:{m:02d}:{s:02d},{ms:03d}" for h, m, s, ms in zip(hours, minutes, secs, millis)]
+
+    @classmethod
+    def format_timestamp(cls, seconds):
         """秒数をSRT形式のタイムスタンプ（HH:MM:SS,mmm）に変換"""
-        time = timedelta(seconds=seconds)
-        hours = int(time.total_seconds() // 3600)
-        minutes = int((time.total_seconds() % 3600) // 60)
-        seconds = time.total_seconds() % 60
-        return f"{hours:02d}:{minutes:02d}:{int(seconds):02d},{int((seconds % 1) * 1000):03d}"
-        
+        return cls.format_timestamps([seconds])[0]
+
+    @classmethod
+    def iter_entries(cls, segments, include_filename=False, first_number=1, offset=0.0):
+        """SRTの内容をBATCH_SIZE件ごとに連結した文字列で返すジェネレータ
+
+        offset（秒）は全タイムスタンプに加算し、番号は有効なエントリにfirst_numberから連番で振ります。
+        """
+        number = first_number
+        for batch in _batched(segments):
+            valid = [segment for segment in batch if cls.is_valid_segment(segment)]
+            if not valid:
+                continue
+            start_times = cls.format_timestamps(np.array([segment["start"] for segment in valid]) + offset)
+            end_times = cls.format_timestamps(np.array([segment["end"] for segment in valid]) + offset)
+            texts = [
+                f"[{segment['file_name']}] {segment['text'].strip()}"
+                if include_filename and "file_name" in segment else segment["text"].strip()
+                for segment in valid
+            ]
+            # ENTRY_TEMPLATEと同じ書式をバッチ単位で連結（1件ずつのformat呼び出しを避ける）
+            yield "".join([
+                f"{i}\n{start_time} --> {end_time}\n{text}\n\n"
+                for i, start_time, end_time, text in zip(
+                    range(number, number + len(valid)), start_times, end_times, texts)
+            ])
+            number += len(valid)
+
+    @staticmethod
+    def parse_timestamp(timestamp):
+        """SRT形式のタイムスタンプ（HH:MM:SS,mmm）を秒数に変換"""
+        hms, millis = timestamp.strip().replace('.', ',').split(',')
+        hours, minutes, secs = hms.split(':')
+        return int(hours) * 3600 + int(minutes) * 60 + int(secs) + int(millis) / 1000
+
+    @classmethod
+    def parse(cls, content, file_name=None):
+        """SRTの内容をセグメントのリストに変換
+
+        file_nameを指定すると、include_filename=Trueで付けた「[ファイル名] 」を取り除きます。
+        """
+        segments = []
+        prefix = f"[{file_name}] " if file_name else None
+        for block in content.replace('\r\n', '\n').split('\n\n'):
+            lines = block.strip().split('\n')
+            if len(lines) < 3 or ' --> ' not in lines[1]:
+                continue
+            start, end = lines[1].split(' --> ')
+            text = '\n'.join(lines[2:])
+            if prefix and text.startswith(prefix):
+                text = text[len(prefix):]
+            segment = {"start": cls.parse_timestamp(start), "end": cls.parse_timestamp(end), "text": text}
+            if file_name:
+                segment["file_name"] = file_name
+            segments.append(segment)
+        return segments
+
+    @classmethod
+    def write(cls, segments, file, include_filename=False):
+        """SRTをファイルハンドルに逐次書き込み"""
+        file.writelines(cls.iter_entries(segments, include_filename=include_filename))
+
     @classmethod
     def generate(cls, segments, include_filename=False):
         """SRTファイルの内容を生成"""
-        content = ""
-        
-        for i, segment in enumerate(segments, 1):
-            if not cls.is_valid_segment(segment):
-                continue
-                
-            text = segment["text"].strip()
-            if include_filename and "file_name" in segment:
-                text = f"[{segment['file_name']}] {text}"
-                
-            content += cls.ENTRY_TEMPLATE.format(
-                number=i,
-                start_time=cls.format_timestamp(segment["start"]),
-                end_time=cls.format_timestamp(segment["end"]),
-                text=text
-            )
-            
-        return content
-        
+        return "".join(cls.iter_entries(segments, include_filename=include_filename))
+
     @staticmethod
     def is_valid_segment(segment):
         """セグメントの妥当性をチェック"""
@@ -94,4 +191,75 @@ class SRTFormatter:
                 "start" in segment and
                 "end" in segment and
                 segment["end"] > segment["start"] and
-                segment.get("text", "").strip()) 
\ No newline at end of file
+                segment.get("text", "").strip())
+
+class MLTFormatter:
+    """MLT（Shotcut / Kdenlive）プロジェクトの生成
+
+    ソースごとに1つのproducer、セグメントごとに1つのplaylist entryを出力します。
+    DOMを組み立てず、BATCH_SIZE件ごとに文字列を連結して逐次書き出します。
+    """
+    HEADER_TEMPLATE = """<?xml version="1.0" encoding="utf-8"?>
+<mlt LC_NUMERIC="C" version="7.0.0" title={title} producer="{playlist_id}">
+"""
+    PRODUCER_TEMPLATE = """  <producer id="{producer_id}">
+    <property name="resource">{resource}</property>
+    <property name="mlt_service">avformat</property>
+  </producer>
+"""
+    FOOTER_TEMPLATE = """  </playlist>
+  <tractor id="tractor0">
+    <track producer="{playlist_id}"/>
+  </tractor>
+</mlt>
+"""
+    PLAYLIST_ID = "playlist0"
+
+    @staticmethod
+    def format_clocks(seconds):
+        """秒数の配列をまとめてMLTのクロック形式（HH:MM:SS.mmm）に変換"""
+        hours, minutes, secs, millis = _split_seconds(seconds, 1000)
+        return [f"{h:02d}:{m:02d}:{s:02d}.{ms:03d}" for h, m, s, ms in zip(hours, minutes, secs, millis)]
+
+    @classmethod
+    def iter_entries(cls, segments_by_file, title="Transcription"):
+        """MLTの内容を先頭から順に文字列で返すジェネレータ
+
+        segments_by_fileは {動画パス: [segments]} の辞書です。
+        """
+        yield cls.HEADER_TEMPLATE.format(title=quoteattr(title), playlist_id=cls.PLAYLIST_ID)
+
+        producer_ids = {}
+        for index, video_path in enumerate(segments_by_file):
+            producer_ids[video_path] = f"producer{index}"
+            yield cls.PRODUCER_TEMPLATE.format(
+                producer_id=producer_ids[video_path],
+                resource=escape(os.path.abspath(video_path))
+            )
+
+        yield f'  <playlist id="{cls.PLAYLIST_ID}">\n'
+        for video_path, segments in segments_by_file.items():
+            producer_id = producer_ids[video_path]
+            for batch in _batched(segments):
+                valid = [segment for segment in batch if SRTFormatter.is_valid_segment(segment)]
+                if not valid:
+                    continue
+                starts = cls.format_clocks([segment["start"] for segment in valid])
+                ends = cls.format_clocks([segment["end"] for segment in valid])
+                yield "".join([
+                    f'    <entry producer="{producer_id}" in="{start}" out="{end}">\n'
+                    f'      <property name="whisper:text">{escape(segment["text"].strip())}</property>\n'
+                    f'    </entry>\n'
+                    for segment, start, end in zip(valid, starts, ends)
+                ])
+        yield cls.FOOTER_TEMPLATE.format(playlist_id=cls.PLAYLIST_ID)
+
+    @classmethod
+    def write(cls, segments_by_file, file, title="Transcription"):
+        """MLTをファイルハンドルに逐次書き込み"""
+        file.writelines(cls.iter_entries(segments_by_file, title=title))
+
+    @classmethod
+    def generate(cls, segments_by_file, title="Transcription"):
+        """MLTファイルの内容を生成"""
+        return "".join(cls.iter_entries(segments_by_file, title=title))
@@ -0,0 +1,182 @@
+import os
+import sys
+import json
+import time
+import cProfile
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+# ファイル単位の集計で使うステージ（format.* はformatにまとめる）
+FILE_STAGES = ('probe', 'extract', 'transcribe', 'format')
+
+def peak_rss_bytes():
+    """ピークRSS（バイト）。ワーカープロセスとffmpegの子プロセスの分も足す
+
+    RUSAGE_CHILDRENは回収済みの子プロセスのうち最大のものなので、まだ動いている
+    子プロセスはそれぞれのピーク（取得できない環境では現在のRSS）を足します。
+    """
+    import psutil  # レポートを出力する場合だけ使う
+    live = 0
+    for child in psutil.Process().children(recursive=True):
+        try:
+            memory = child.memory_info()
+        except psutil.Error:
+            continue  # 既に終了した
+        live += getattr(memory, 'peak_wset', memory.rss)
+    try:
+        import resource
+        # Linuxはキロバイト、macOSはバイト単位
+        scale = 1 if sys.platform == 'darwin' else 1024
+        own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+        reaped = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+        return own + reaped + live
+    except ImportError:
+        memory = psutil.Process().memory_info()
+        return getattr(memory, 'peak_wset', memory.rss) + live
+
+class Instrumentation:
+    """文字起こしパイプラインの計測（ステージごとのスパンとファイルごとのカウンタ）
+
+    スパンは probe / extract / model_load / transcribe / format.<形式> などの名前で記録し、
+    JSON Lines形式で書き出せます。profile=Trueの場合は、profile_stagesに含まれる
+    スパンをcProfileで計測して <profile_dir>/<スパン名>-<連番>.prof に保存し、
+    py-spyのスレッド表示で区別できるようスパン中はスレッド名にスパン名を付けます。
+    """
+
+    def __init__(self, profile=False, profile_dir=None, profile_stages=('transcribe',)):
+        self.profile = profile
+        self.profile_dir = profile_dir or os.path.join(os.getcwd(), 'profiles')
+        self.profile_stages = tuple(profile_stages)
+        self._lock = threading.Lock()
+        self._profile_count = 0
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.spans = []
+            self.counters = defaultdict(lambda: defaultdict(float))
+
+    def record(self, name, duration, file=None, **attrs):
+        """計測済みの所要時間をスパンとして記録（別プロセスで計測した値など）"""
+        span = {
+            'type': 'span',
+            'name': name,
+            'file': file,
+            'start': time.time() - duration,
+            'duration': duration,
+            'thread': threading.current_thread().name
+        }
+        span.update(attrs)
+        with self._lock:
+            self.spans.append(span)
+        return span
+
+    @contextmanager
+    def span(self, name, file=None, **attrs):
+        """with文の区間をスパンとして記録"""
+        profiler = None
+        thread = threading.current_thread()
+        thread_name = thread.name
+        if self.profile:
+            thread.name = f"{thread_name}:{name}"
+            if name in self.profile_stages:
+                profiler = cProfile.Profile()
+                try:
+                    profiler.enable()
+                except ValueError:
+                    profiler = None  # 他のプロファイラが有効な場合
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - started
+            if profiler is not None:
+                profiler.disable()
+                self._dump_profile(profiler, name)
+            thread.name = thread_name
+            self.record(name, duration, file=file, **attrs)
+
+    def _dump_profile(self, profiler, name):
+        with self._lock:
+            self._profile_count += 1
+            index = self._profile_count
+        os.makedirs(self.profile_dir, exist_ok=True)
+        profiler.dump_stats(os.path.join(self.profile_dir, f"{name}-{index:04d}.prof"))
+
+    def count(self, file, name, value=1):
+        """ファイルごとのカウンタに加算（audio_seconds, segments など）"""
+        with self._lock:
+            self.counters[file][name] += value
+
+    def file_timings(self, file):
+        """ファイル1件のステージ別所要時間（秒）"""
+        timings = {stage: 0.0 for stage in FILE_STAGES}
+        with self._lock:
+            spans = [span for span in self.spans if span['file'] == file]
+        for span in spans:
+            stage = span['name'].split('.', 1)[0]
+            if stage in timings:
+                timings[stage] += span['duration']
+        return timings
+
+    def file_summary(self, file):
+        """ファイル1件の所要時間・カウンタ・RTF"""
+        timings = self.file_timings(file)
+        with self._lock:
+            counters = dict(self.counters.get(file, {}))
+        total = sum(timings.values())
+        audio_seconds = counters.get('audio_seconds', 0.0)
+        return {
+            'file': file,
+            'timings': timings,
+            'counters': counters,
+            'total_seconds': total,
+            'rtf': total / audio_seconds if audio_seconds else None
+        }
+
+    def stage_summary(self):
+        """スパン名ごとの集計 {名前: {count, total, mean, max}}"""
+        stages = {}
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            stage = stages.setdefault(span['name'], {'count': 0, 'total': 0.0, 'max': 0.0})
+            stage['count'] += 1
+            stage['total'] += span['duration']
+            stage['max'] = max(stage['max'], span['duration'])
+        for stage in stages.values():
+            stage['mean'] = stage['total'] / stage['count']
+        return stages
+
+    def format_summary(self):
+        """ログ表示用のサマリー（行のリスト）"""
+        stages = self.stage_summary()
+        if not stages:
+            return []
+        with self._lock:
+            audio_seconds = sum(c.get('audio_seconds', 0.0) for c in self.counters.values())
+            segments = sum(c.get('segments', 0) for c in self.counters.values())
+        lines = ["計測サマリー（ステージ: 回数 / 合計 / 平均 / 最大）"]
+        for name, stage in sorted(stages.items(), key=lambda item: -item[1]['total']):
+            lines.append(f"  {name}: {stage['count']}回 / {stage['total']:.2f}秒 / "
+                         f"{stage['mean']:.2f}秒 / {stage['max']:.2f}秒")
+        transcribe = stages.get('transcribe', {}).get('total', 0.0)
+        lines.append(f"  音声長: {audio_seconds:.1f}秒 / セグメント: {int(segments)}件")
+        if audio_seconds:
+            lines.append(f"  文字起こしRTF: {transcribe / audio_seconds:.3f}")
+        return lines
+
+    def export_jsonl(self, path):
+        """スパンとファイル別カウンタをJSON Linesで書き出す"""
+        with self._lock:
+            spans = list(self.spans)
+            files = list(self.counters)
+        with open(path, 'w', encoding='utf-8') as f:
+            for span in spans:
+                f.write(json.dumps(span, ensure_ascii=False) + '\n')
+            for file in files:
+                summary = self.file_summary(file)
+                summary['type'] = 'file'
+                f.write(json.dumps(summary, ensure_ascii=False) + '\n')
+        return path
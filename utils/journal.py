@@ -0,0 +1,140 @@
+import os
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# ジョブの状態
+WAITING = 'waiting'    # 書き込み中の可能性があるため安定待ち
+PENDING = 'pending'    # 処理待ち
+RUNNING = 'running'    # 処理中（異常終了した場合は再開時にpendingへ戻す）
+DONE = 'done'          # 完了
+FAILED = 'failed'      # リトライ上限に達した
+
+# 処理中ジョブのステージ
+WRITTEN = 'written'    # SRT/EDLを出力済み（残りはフォルダの結合のみ）
+
+class JobJournal:
+    """フォルダ監視用のジョブ記録（SQLite）
+
+    動画ファイルごとにサイズ・更新時刻と状態を記録します。サイズと更新時刻が
+    stable_seconds以上変わらなかったファイルだけを処理待ちにし、処理に失敗した
+    ジョブはmax_attempts回まで再試行します。クラッシュ後は処理中だったジョブを
+    処理待ちに戻して再開します（文字起こし結果はTranscriptionCacheから再利用されます）。
+    出力まで書き終えていた（stageがwritten）ジョブは文字起こしせず、結合だけをやり直します。
+    """
+
+    def __init__(self, db_path, stable_seconds=10.0, max_attempts=3, retry_delay=60.0):
+        self.db_path = db_path
+        self.stable_seconds = stable_seconds
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as db:
+            db.execute('CREATE TABLE IF NOT EXISTS jobs ('
+                       'path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, state TEXT, '
+                       'stage TEXT, attempts INTEGER DEFAULT 0, error TEXT, '
+                       'seen_at REAL, next_attempt REAL DEFAULT 0, updated_at REAL)')
+            db.execute('CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state)')
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def recover(self):
+        """前回の異常終了で処理中のまま残ったジョブを戻す
+
+        (処理待ちに戻した件数, 出力を書き終えていたジョブのパス) を返します。
+        出力を書き終えていたジョブは処理中のままにし、呼び出し側が結合してcompleteにします。
+        """
+        with self._lock, self._connect() as db:
+            written = [row[0] for row in db.execute('SELECT path FROM jobs WHERE state = ? AND stage = ?',
+                                                    (RUNNING, WRITTEN))]
+            requeued = db.execute('UPDATE jobs SET state = ?, updated_at = ? '
+                                  'WHERE state = ? AND (stage IS NULL OR stage != ?)',
+                                  (PENDING, time.time(), RUNNING, WRITTEN)).rowcount
+        return requeued, written
+
+    def observe(self, files, now=None):
+        """走査結果 [(パス, サイズ, 更新時刻ns)] を記録し、新規・変更のあった件数を返す
+
+        新規または内容が変わったファイルは安定待ちからやり直します。
+        """
+        now = time.time() if now is None else now
+        changed = 0
+        with self._lock, self._connect() as db:
+            known = {row[0]: (row[1], row[2]) for row in db.execute('SELECT path, size, mtime_ns FROM jobs')}
+            for path, size, mtime_ns in files:
+                if known.get(path) == (size, mtime_ns):
+                    continue
+                db.execute('INSERT OR REPLACE INTO jobs (path, size, mtime_ns, state, stage, attempts, error, '
+                           'seen_at, next_attempt, updated_at) VALUES (?, ?, ?, ?, NULL, 0, NULL, ?, 0, ?)',
+                           (path, size, mtime_ns, WAITING, now, now))
+                changed += 1
+            # 削除されたファイルは記録から外す
+            present = {path for path, _, _ in files}
+            removed = [path for path in known if path not in present]
+            db.executemany('DELETE FROM jobs WHERE path = ?', [(path,) for path in removed])
+            # 一定時間変化の無いファイルを処理待ちにする
+            db.execute('UPDATE jobs SET state = ?, updated_at = ? WHERE state = ? AND seen_at <= ?',
+                       (PENDING, now, WAITING, now - self.stable_seconds))
+        return changed
+
+    def claim(self, limit=None, now=None):
+        """処理待ちのジョブを処理中にしてパスのリストを返す"""
+        now = time.time() if now is None else now
+        with self._lock, self._connect() as db:
+            query = 'SELECT path FROM jobs WHERE state = ? AND next_attempt <= ? ORDER BY seen_at'
+            params = [PENDING, now]
+            if limit:
+                query += ' LIMIT ?'
+                params.append(limit)
+            paths = [row[0] for row in db.execute(query, params)]
+            db.executemany('UPDATE jobs SET state = ?, stage = NULL, attempts = attempts + 1, updated_at = ? '
+                           'WHERE path = ?', [(RUNNING, now, path) for path in paths])
+        return paths
+
+    def set_stage(self, path, stage):
+        """処理中ジョブの到達ステージを記録（WRITTENなら再開時に結合だけを行う）"""
+        with self._lock, self._connect() as db:
+            db.execute('UPDATE jobs SET stage = ?, updated_at = ? WHERE path = ?', (stage, time.time(), path))
+
+    def complete(self, path):
+        with self._lock, self._connect() as db:
+            db.execute('UPDATE jobs SET state = ?, stage = ?, error = NULL, updated_at = ? WHERE path = ?',
+                       (DONE, 'done', time.time(), path))
+
+    def fail(self, path, error, retry=True):
+        """失敗を記録（上限未満ならretry_delay後に再試行）。再試行するかを返す
+
+        retry=Falseの場合は再試行せずに失敗とします（音声が無いなど、やり直しても変わらない場合）。
+        """
+        now = time.time()
+        with self._lock, self._connect() as db:
+            row = db.execute('SELECT attempts FROM jobs WHERE path = ?', (path,)).fetchone()
+            if row is None:
+                return False
+            retry = retry and row[0] < self.max_attempts
+            db.execute('UPDATE jobs SET state = ?, error = ?, next_attempt = ?, updated_at = ? WHERE path = ?',
+                       (PENDING if retry else FAILED, str(error),
+                        now + self.retry_delay * row[0] if retry else 0, now, path))
+        return retry
+
+    def release(self, paths):
+        """キャンセルなどで処理しなかったジョブを試行回数を戻して処理待ちにする"""
+        with self._lock, self._connect() as db:
+            db.executemany('UPDATE jobs SET state = ?, attempts = MAX(attempts - 1, 0), updated_at = ? '
+                           'WHERE path = ? AND state = ?',
+                           [(PENDING, time.time(), path, RUNNING) for path in paths])
+
+    def counts(self):
+        """状態ごとの件数"""
+        with self._lock, self._connect() as db:
+            return dict(db.execute('SELECT state, COUNT(*) FROM jobs GROUP BY state').fetchall())
@@ -0,0 +1,191 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+import concurrent.futures
+from contextlib import contextmanager
+import ffmpeg
+from utils.cache import DEFAULT_CACHE_DIR
+from utils.fingerprint import AudioFingerprint
+
+DEFAULT_EXTENSIONS = ('.mp4', '.mov', '.avi')
+
+def walk_media(root, extensions=DEFAULT_EXTENSIONS, recursive=True):
+    """フォルダ以下の動画を (パス, os.stat_result) で返すジェネレータ
+
+    拡張子は大文字小文字を区別せずに比較し、隠しフォルダは走査しません。
+    """
+    extensions = tuple(ext.lower() if ext.startswith('.') else f'.{ext.lower()}' for ext in extensions)
+    pending = [root]
+    while pending:
+        directory = pending.pop()
+        try:
+            entries = sorted(os.scandir(directory), key=lambda entry: entry.name)
+        except OSError:
+            continue
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if recursive and not entry.name.startswith('.'):
+                        pending.append(entry.path)
+                elif entry.is_file() and os.path.splitext(entry.name)[1].lower() in extensions:
+                    yield entry.path, entry.stat()
+            except OSError:
+                continue  # 走査中に移動・削除された
+
+class MediaIndex:
+    """動画のprobe結果をサイズ・更新時刻と共に保存するインデックス（SQLite）
+
+    長さ・音声ストリームの有無・ストリーム情報を記録し、サイズと更新時刻が
+    変わっていないファイルは再びffmpeg.probeしません。probeはAudioLoader.probeと
+    同じ (probe結果, 先頭の音声ストリーム) を返します。音声の指紋（重複検出用）も同様に記録します。
+    """
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or os.path.join(DEFAULT_CACHE_DIR, 'media_index.sqlite3')
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        with self._connect() as db:
+            db.execute('CREATE TABLE IF NOT EXISTS media ('
+                       'path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, duration REAL, '
+                       'has_audio INTEGER, probe TEXT, error TEXT, probed_at REAL)')
+            db.execute('CREATE TABLE IF NOT EXISTS fingerprints ('
+                       'path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, duration REAL, codes BLOB)')
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    @staticmethod
+    def _compact(probe):
+        """保存用にprobe結果から必要な項目だけを残す"""
+        keys = ('index', 'codec_type', 'codec_name', 'sample_rate', 'channels', 'duration', 'start_time')
+        return {
+            'format': {key: probe.get('format', {}).get(key) for key in ('duration', 'format_name', 'start_time')},
+            'streams': [{key: stream[key] for key in keys if key in stream} for stream in probe.get('streams', [])]
+        }
+
+    @staticmethod
+    def _row_to_entry(path, row):
+        size, mtime_ns, duration, has_audio, probe, error = row
+        return {
+            'path': path,
+            'size': size,
+            'mtime_ns': mtime_ns,
+            'duration': duration,
+            'has_audio': bool(has_audio),
+            'probe': json.loads(probe) if probe else None,
+            'error': error
+        }
+
+    def lookup(self, video_path, stat=None):
+        """記録済みのエントリを返す（ファイルが変わっていればNone）"""
+        path = os.path.abspath(video_path)
+        stat = stat or os.stat(path)
+        with self._lock, self._connect() as db:
+            row = db.execute('SELECT size, mtime_ns, duration, has_audio, probe, error FROM media WHERE path = ?',
+                             (path,)).fetchone()
+        if row is None or row[0] != stat.st_size or row[1] != stat.st_mtime_ns:
+            return None
+        return self._row_to_entry(path, row)
+
+    def get(self, video_path, stat=None):
+        """エントリを取得（未記録・変更ありの場合のみprobeして記録）"""
+        path = os.path.abspath(video_path)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"動画ファイルが見つかりません: {video_path}")
+        stat = stat or os.stat(path)
+        entry = self.lookup(path, stat)
+        if entry is not None:
+            return entry
+
+        probe, error = None, None
+        try:
+            probe = self._compact(ffmpeg.probe(path))
+        except ffmpeg.Error as e:
+            error = e.stderr.decode(errors='replace').strip() if e.stderr else str(e)
+        has_audio = bool(probe) and any(stream['codec_type'] == 'audio' for stream in probe['streams'])
+        try:
+            duration = float((probe or {}).get('format', {}).get('duration') or 0)
+        except (TypeError, ValueError):
+            duration = 0.0
+        with self._lock, self._connect() as db:
+            db.execute('INSERT OR REPLACE INTO media VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                       (path, stat.st_size, stat.st_mtime_ns, duration, int(has_audio),
+                        json.dumps(probe) if probe else None, error, time.time()))
+        return {'path': path, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'duration': duration,
+                'has_audio': has_audio, 'probe': probe, 'error': error}
+
+    def probe(self, video_path):
+        """AudioLoader.probeと同じ (probe結果, 先頭の音声ストリーム) を返す（記録済みなら再probeしない）"""
+        entry = self.get(video_path)
+        if entry['error']:
+            raise ValueError(f"probeに失敗しました: {video_path} - {entry['error']}")
+        audio_streams = [stream for stream in entry['probe']['streams'] if stream['codec_type'] == 'audio']
+        if not audio_streams:
+            raise ValueError(f"動画に音声ストリームが含まれていません: {video_path}")
+        return entry['probe'], audio_streams[0]
+
+    def get_all(self, video_files, workers=4):
+        """複数ファイルのエントリを取得（{パス: エントリ}、取得できないファイルは除く）
+
+        記録済みのエントリは1回のクエリでまとめて読み、未記録・変更ありのファイルだけを
+        workers並列でprobeします。
+        """
+        with self._lock, self._connect() as db:
+            known = {row[0]: row[1:] for row in
+                     db.execute('SELECT path, size, mtime_ns, duration, has_audio, probe, error FROM media')}
+        entries = {}
+        misses = []
+        for video in video_files:
+            path = os.path.abspath(str(video))
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            row = known.get(path)
+            if row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+                entries[str(video)] = self._row_to_entry(path, row)
+            else:
+                misses.append((str(video), stat))
+        if not misses:
+            return entries
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(int(workers), 1),
+                                                   thread_name_prefix='probe') as pool:
+            futures = {pool.submit(self.get, video, stat): video for video, stat in misses}
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    entries[futures[future]] = future.result()
+                except OSError:
+                    continue
+        return entries
+
+    def fingerprint(self, video_path, stop_event=None, source=None):
+        """音声の指紋を取得（未記録・変更ありの場合のみ音声をデコードして作成）
+
+        sourceには指紋を作る場合に呼ぶ、音声のブロック列を返す関数を渡せます（省略時はffmpegでストリーミング）。
+        """
+        path = os.path.abspath(video_path)
+        stat = os.stat(path)
+        with self._lock, self._connect() as db:
+            row = db.execute('SELECT size, mtime_ns, duration, codes FROM fingerprints WHERE path = ?',
+                             (path,)).fetchone()
+        if row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+            return AudioFingerprint.from_bytes(row[3], row[2])
+
+        if source is not None:
+            fingerprint = AudioFingerprint.compute(source())
+        else:
+            fingerprint = AudioFingerprint.from_file(path, stop_event=stop_event)
+        with self._lock, self._connect() as db:
+            db.execute('INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?, ?, ?)',
+                       (path, stat.st_size, stat.st_mtime_ns, fingerprint.duration,
+                        sqlite3.Binary(fingerprint.to_bytes())))
+        return fingerprint
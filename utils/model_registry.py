@@ -0,0 +1,77 @@
+import threading
+import logging
+from utils.backends import get_backend
+
+class ModelRegistry:
+    """Whisperモデルをプロセス全体で共有する遅延ロードレジストリ
+
+    バックエンド・モデル名・デバイス・精度の組をキーとし、同じキーを要求する
+    WhisperTranscriberインスタンスは同一の重みを共有します。
+    """
+    _models = {}
+    _locks = {}
+    _registry_lock = threading.Lock()
+
+    @staticmethod
+    def make_key(model_name, device, precision, backend=None):
+        return (get_backend(backend).name, model_name, device, precision)
+
+    @classmethod
+    def _key_lock(cls, key):
+        with cls._registry_lock:
+            if key not in cls._locks:
+                cls._locks[key] = threading.Lock()
+            return cls._locks[key]
+
+    @classmethod
+    def is_loaded(cls, model_name, device, precision, backend=None):
+        return cls.make_key(model_name, device, precision, backend) in cls._models
+
+    @classmethod
+    def get(cls, model_name, device, precision, log=None, backend=None):
+        """モデルを取得（未ロードなら初回のみロード）"""
+        key = cls.make_key(model_name, device, precision, backend)
+        model = cls._models.get(key)
+        if model is not None:
+            return model
+
+        # 同じキーの同時ロードは1回にまとめる
+        with cls._key_lock(key):
+            model = cls._models.get(key)
+            if model is None:
+                if log:
+                    log(f"モデルをロード中: {model_name} ({key[0]}, {device}, {precision})")
+                model = get_backend(backend).load(model_name, device)
+                cls._models[key] = model
+                if log:
+                    log(f"モデルのロードが完了しました: {model_name}")
+        return model
+
+    @classmethod
+    def warm_up(cls, model_name, device, precision, log=None, callback=None, backend=None):
+        """バックグラウンドスレッドでモデルを事前ロード
+
+        callbackは完了時に (成功したか, 例外またはNone) で呼ばれます。
+        """
+        def _worker():
+            try:
+                cls.get(model_name, device, precision, log=log, backend=backend)
+            except Exception as e:
+                if log:
+                    log(f"モデルの事前ロードに失敗しました: {str(e)}", logging.ERROR)
+                if callback:
+                    callback(False, e)
+                return
+            if callback:
+                callback(True, None)
+
+        thread = threading.Thread(target=_worker, daemon=True)
+        thread.start()
+        return thread
+
+    @classmethod
+    def unload(cls, model_name, device, precision, backend=None):
+        """モデルをレジストリから外す（参照が無くなればメモリが解放される）"""
+        key = cls.make_key(model_name, device, precision, backend)
+        with cls._key_lock(key):
+            return cls._models.pop(key, None) is not None
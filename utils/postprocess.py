@@ -0,0 +1,163 @@
+import zlib
+import logging
+import numpy as np
+from utils.word_store import WordStore, normalize
+
+class SegmentPostProcessor:
+    """認識結果のセグメントを字幕として整える後処理（SRT・EDL・MLTの出力で共通）
+
+    セグメントを開始・終了・文字数などの並列の配列にしてから、次の順に処理します。
+
+    - 終了が開始以前・テキストが空のセグメントを除く。max_compression_ratioを指定すると、
+      テキストの圧縮率がそれを超える（同じ語の繰り返しになった）セグメントも除いて警告を出す
+      （Whisperの結果の圧縮率は30秒のウィンドウ全体の値のため使わず、セグメントごとに計算します）
+    - 同じテキストが重なるか間隔repeat_gap秒未満で連続するもの（幻覚による繰り返し）は
+      max_repeats件までにする（離れて同じことを言ったものは残す）
+    - min_duration秒未満の短いセグメントを、間隔がmerge_gap秒以下の隣とまとめる
+    - max_chars文字・max_duration秒を超えるキューを単語のタイムスタンプで分割する
+    - 1秒あたりの文字数がmax_cpsを超えるキューは次のキューの手前まで終了を延ばす
+    - close_gap秒未満の隙間を詰め、次のキューと重ならないよう終了を切り詰める
+      （次と同じ時刻に始まるキューは次のキューにまとめる）
+
+    いずれも先頭から1回ずつ走査するだけで、Noneの項目は行いません。
+    """
+
+    def __init__(self, max_repeats=1, max_compression_ratio=None, min_duration=0.3, merge_gap=0.5,
+                 max_chars=None, max_duration=None, max_cps=None, close_gap=0.1, repeat_gap=0.5, logger=None):
+        self.logger = logger
+        self.max_repeats = max_repeats
+        self.repeat_gap = repeat_gap
+        self.max_compression_ratio = max_compression_ratio
+        self.min_duration = min_duration
+        self.merge_gap = merge_gap
+        self.max_chars = max_chars
+        self.max_duration = max_duration
+        self.max_cps = max_cps
+        self.close_gap = close_gap
+
+    def process(self, segments, file_name=None):
+        """整えたセグメントの新しいリストを返す（元のセグメントは変更しません）"""
+        if not segments:
+            return []
+        starts = np.array([segment['start'] for segment in segments], dtype=np.float64)
+        ends = np.array([segment['end'] for segment in segments], dtype=np.float64)
+        texts = [segment['text'] for segment in segments]
+        chars = np.array([len(text.strip()) for text in texts], dtype=np.int64)
+
+        keep = (ends > starts) & (chars > 0)
+        if self.max_compression_ratio is not None:
+            ratios = np.array([self.compression_ratio(text) for text in texts], dtype=np.float64)
+            repetitive = keep & (ratios > self.max_compression_ratio)
+            if repetitive.any():
+                self._log(f"繰り返しの多いセグメントを{int(repetitive.sum())}件除きました"
+                          f"（圧縮率 > {self.max_compression_ratio}）{': ' + file_name if file_name else ''}",
+                          level=logging.WARNING)
+            keep &= ~repetitive
+        order = np.flatnonzero(keep)
+        order = order[np.argsort(starts[order], kind='stable')]
+        if self.max_repeats is not None:
+            order = order[self._repeat_mask([normalize(texts[i]) for i in order], starts[order], ends[order])]
+
+        groups = self._merge_groups(order, starts, ends, chars)
+        output = []
+        for group in groups:
+            segment = self._join([segments[i] for i in group])
+            if self._too_long(segment['end'] - segment['start'], len(segment['text'].strip())):
+                output += self._split(segment)
+            else:
+                output.append(segment)
+        output = self._retime(output)
+
+        for index, segment in enumerate(output):
+            segment['id'] = index
+            if file_name:
+                segment['file_name'] = file_name
+        return output
+
+    def _log(self, message, level=logging.INFO):
+        if self.logger:
+            self.logger.log(level, message)
+
+    @staticmethod
+    def compression_ratio(text):
+        """テキストのzlib圧縮率（whisperと同じ定義。繰り返しが多いほど大きい）"""
+        data = text.strip().encode('utf-8')
+        return len(data) / max(len(zlib.compress(data)), 1)
+
+    def _repeat_mask(self, normalized, starts, ends):
+        """重なるか間隔repeat_gap秒未満で連続する同じテキストのうち、max_repeats件目までを残すマスク"""
+        codes = {}
+        ids = np.array([codes.setdefault(text, len(codes)) for text in normalized], dtype=np.int64)
+        gaps = starts[1:] - np.maximum.accumulate(ends)[:-1]
+        run_starts = np.r_[True, (ids[1:] != ids[:-1]) | (gaps >= self.repeat_gap)]
+        first = np.maximum.accumulate(np.where(run_starts, np.arange(len(ids)), 0))
+        return np.arange(len(ids)) - first < self.max_repeats
+
+    def _too_long(self, duration, chars):
+        return ((self.max_chars is not None and chars > self.max_chars)
+                or (self.max_duration is not None and duration > self.max_duration))
+
+    def _merge_groups(self, order, starts, ends, chars):
+        """短いセグメントを隣とまとめたインデックスのグループ"""
+        groups = []
+        for i in order:
+            if groups and self.min_duration is not None:
+                group = groups[-1]
+                short = ends[i] - starts[i] < self.min_duration or ends[group[-1]] - starts[group[0]] < self.min_duration
+                close = starts[i] - ends[group[-1]] <= self.merge_gap
+                merged_chars = chars[group].sum() + chars[i]
+                if short and close and not self._too_long(ends[i] - starts[group[0]], merged_chars):
+                    group.append(i)
+                    continue
+            groups.append([i])
+        return groups
+
+    @staticmethod
+    def _join(parts):
+        if len(parts) == 1:
+            return dict(parts[0])
+        segment = dict(parts[0], end=max(part['end'] for part in parts),
+                       text=''.join(part['text'] for part in parts))
+        segment.pop('tokens', None)
+        if any(part.get('words') for part in parts):
+            segment['words'] = [word for part in parts for word in part.get('words') or []]
+        return segment
+
+    def _split(self, segment):
+        """単語のタイムスタンプで上限内のキューに分ける（単語が無ければそのまま）"""
+        if not segment.get('words'):
+            return [segment]
+        pieces = WordStore.from_segments([segment]).resegment(
+            max_chars=self.max_chars, max_duration=self.max_duration, max_gap=None)
+        extra = {key: value for key, value in segment.items()
+                 if key not in ('id', 'start', 'end', 'text', 'words', 'tokens')}
+        return [dict(extra, **piece) for piece in pieces]
+
+    def _retime(self, segments):
+        """読む速さに合わせた延長・隙間の詰め・重なりの切り詰め（配列でまとめて計算）"""
+        if not segments:
+            return segments
+        starts = np.array([segment['start'] for segment in segments], dtype=np.float64)
+        ends = np.array([segment['end'] for segment in segments], dtype=np.float64)
+        next_starts = np.r_[starts[1:], np.inf]
+        if self.max_cps is not None:
+            chars = np.array([len(segment['text'].strip()) for segment in segments], dtype=np.float64)
+            ends = np.maximum(ends, np.minimum(starts + chars / self.max_cps, next_starts))
+        if self.close_gap is not None:
+            gaps = next_starts - ends
+            ends = np.where((gaps > 0) & (gaps < self.close_gap), next_starts, ends)
+        ends = np.minimum(ends, next_starts)
+        for segment, end in zip(segments, ends.tolist()):
+            segment['end'] = end
+        # 次のキューと同じ時刻に始まるもの（長さが0になる）はテキストを失わないよう次のキューにまとめる
+        output = []
+        pending = []
+        for segment, valid in zip(segments, ends > starts):
+            if not valid:
+                pending.append(segment)
+                continue
+            output.append(self._join(pending + [segment]) if pending else segment)
+            pending = []
+        if pending:
+            output.append(self._join(pending))
+        return output
@@ -0,0 +1,398 @@
+import os
+import gzip
+import json
+import time
+import hmac
+import zlib
+import socket
+import secrets
+import logging
+import threading
+import concurrent.futures
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+from utils.audio import SAMPLE_RATE
+
+DEFAULT_PORT = 8765
+TOKEN_HEADER = 'X-Whisper-Token'
+
+def encode_audio(audio):
+    """float32の音声をs16leにしてzlib圧縮したバイト列にする（転送用）"""
+    pcm = (np.clip(audio, -1.0, 32767 / 32768) * 32768.0).astype('<i2')
+    return zlib.compress(pcm.tobytes(), 6)
+
+def decode_audio(data):
+    audio = np.frombuffer(zlib.decompress(data), dtype='<i2').astype(np.float32)
+    audio *= 1.0 / 32768.0
+    return audio
+
+class RemoteCoordinator:
+    """リモートワーカーに文字起こしを分配するコーディネーター（HTTP）
+
+    submitでジョブ（抽出済みの音声を圧縮したPCM）をキューに入れ、結果を
+    concurrent.futures.Futureで返します。ワーカーはHTTPでジョブを取得し、
+    音声をダウンロードして文字起こしした結果を送り返します。取得したジョブは
+    lease_secondsの間だけワーカーに割り当てられ、ハートビートが途切れると
+    別のワーカーに再割り当てされます（max_attempts回まで）。
+    PipelineSchedulerからは文字起こし用のプールとして使います。
+
+    既定では127.0.0.1でのみ待ち受けます（他のマシンのワーカーにはhostで明示的に公開します）。
+    tokenを指定しなければランダムなトークンを生成し、すべてのリクエストで確認します。
+
+    エンドポイント:
+        POST /claim                 次のジョブを取得（無ければ204）
+        GET  /jobs/<id>/audio       圧縮PCM
+        POST /jobs/<id>/heartbeat   割り当ての延長
+        POST /jobs/<id>/result      結果（gzip圧縮したJSON）
+        POST /jobs/<id>/error       失敗の報告
+    """
+
+    def __init__(self, host='127.0.0.1', port=DEFAULT_PORT, slots=4, lease_seconds=120.0, max_attempts=3,
+                 token=None, logger=None):
+        self.host = host
+        self.port = port
+        self.slots = max(int(slots), 1)  # 同時に投入しておくジョブ数（ワーカー数の目安）
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.token_generated = not token  # 生成したトークンは起動時にログに出す
+        self.token = token or secrets.token_urlsafe(16)
+        self.logger = logger
+        self._lock = threading.Lock()
+        self._jobs = {}  # id -> ジョブ
+        self._next_id = 1
+        self._workers = {}  # ワーカー名 -> 最終アクセス時刻
+        self._server = None
+
+    def _log(self, message, level=logging.INFO):
+        if self.logger:
+            self.logger.log(level, message)
+
+    @property
+    def url(self):
+        host = socket.gethostname() if self.host in ('0.0.0.0', '') else self.host
+        return f"http://{host}:{self.port}"
+
+    def start(self):
+        if self._server is not None:
+            return self
+        handler = type('Handler', (_CoordinatorHandler,), {'coordinator': self})
+        self._server = ThreadingHTTPServer((self.host, self.port), handler)
+        self.port = self._server.server_address[1]  # port=0の場合は割り当てられたポート
+        threading.Thread(target=self._server.serve_forever, name='coordinator', daemon=True).start()
+        self._log(f"コーディネーターを起動しました: {self.url}")
+        if self.token_generated:
+            self._log(f"ワーカーは --token {self.token} を指定して接続してください")
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        self.shutdown(cancel_futures=True)
+
+    def submit(self, video_path, audio, chunked=False, model=None, backend=None, language=None, preset=None):
+        """ジョブを投入し、(結果, ワーカーでの所要秒数) を返すFutureを返す
+
+        audioがNone（分割モード）の場合、ワーカーは共有ストレージ上のvideo_pathから抽出します。
+        """
+        future = concurrent.futures.Future()
+        data = encode_audio(audio) if audio is not None else None
+        with self._lock:
+            job_id = str(self._next_id)
+            self._next_id += 1
+            self._jobs[job_id] = {
+                'id': job_id,
+                'path': os.path.abspath(video_path),
+                'audio': data,
+                'samples': len(audio) if audio is not None else None,
+                'chunked': chunked,
+                'model': model,
+                'backend': backend,
+                'language': language,
+                'preset': preset,
+                'worker': None,
+                'lease_until': 0.0,
+                'attempts': 0,
+                'future': future
+            }
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        """未完了のジョブを取り消す（PipelineSchedulerのプールと同じ呼び出し方）"""
+        if not cancel_futures:
+            return
+        with self._lock:
+            jobs = list(self._jobs.values())
+            self._jobs.clear()
+        for job in jobs:
+            if not job['future'].cancel() and not job['future'].done():
+                job['future'].set_exception(RuntimeError("処理がキャンセルされました"))
+
+    def claim(self, worker):
+        """次のジョブをworkerに割り当てる（割り当て切れのジョブも再割り当ての対象）"""
+        now = time.time()
+        with self._lock:
+            self._workers[worker] = now
+            for job_id, job in list(self._jobs.items()):
+                if job['worker'] is not None and job['lease_until'] > now:
+                    continue
+                future = job['future']
+                if not future.running() and not future.set_running_or_notify_cancel():
+                    del self._jobs[job_id]  # 割り当て前に取り消された
+                    continue
+                if job['worker'] is not None:
+                    # 割り当て切れ（ワーカーの停止・切断）
+                    if job['attempts'] >= self.max_attempts:
+                        del self._jobs[job_id]
+                        future.set_exception(RuntimeError(
+                            f"リモートワーカーでの処理が{job['attempts']}回中断されました"))
+                        continue
+                    self._log(f"ワーカー {job['worker']} の応答が無いため再割り当てします: "
+                              f"{os.path.basename(job['path'])}", level=logging.WARNING)
+                job['worker'] = worker
+                job['attempts'] += 1
+                job['lease_until'] = now + self.lease_seconds
+                return {key: job[key] for key in
+                        ('id', 'path', 'samples', 'chunked', 'model', 'backend', 'language', 'preset')}
+        return None
+
+    def _job(self, job_id, worker):
+        job = self._jobs.get(job_id)
+        if job is None or job['worker'] != worker:
+            return None
+        return job
+
+    def audio(self, job_id, worker):
+        with self._lock:
+            job = self._job(job_id, worker)
+            return None if job is None else job['audio']
+
+    def heartbeat(self, job_id, worker):
+        with self._lock:
+            self._workers[worker] = time.time()
+            job = self._job(job_id, worker)
+            if job is None:
+                return False
+            job['lease_until'] = time.time() + self.lease_seconds
+            return True
+
+    def complete(self, job_id, worker, result, elapsed):
+        with self._lock:
+            job = self._job(job_id, worker)
+            if job is None:
+                return False  # 再割り当て済み・取り消し済み
+            del self._jobs[job_id]
+        job['future'].set_result((result, elapsed))
+        return True
+
+    def fail(self, job_id, worker, error, retry=True):
+        """ワーカーからの失敗の報告（再試行できる場合は別のワーカーに回す）"""
+        with self._lock:
+            job = self._job(job_id, worker)
+            if job is None:
+                return False
+            if retry and job['attempts'] < self.max_attempts:
+                job['worker'] = None
+                job['lease_until'] = 0.0
+                self._log(f"ワーカー {worker} での処理に失敗したため再投入します: "
+                          f"{os.path.basename(job['path'])} - {error}", level=logging.WARNING)
+                return True
+            del self._jobs[job_id]
+        job['future'].set_exception(RuntimeError(f"リモートワーカー {worker}: {error}"))
+        return True
+
+    def status(self):
+        """キューとワーカーの状況"""
+        now = time.time()
+        with self._lock:
+            return {
+                'queued': sum(1 for job in self._jobs.values() if job['worker'] is None),
+                'running': sum(1 for job in self._jobs.values() if job['worker'] is not None),
+                'workers': {name: round(now - seen, 1) for name, seen in self._workers.items()}
+            }
+
+class _CoordinatorHandler(BaseHTTPRequestHandler):
+    coordinator = None
+
+    def log_message(self, format, *args):
+        pass  # アクセスログは出さない
+
+    def _reply(self, status, body=b'', content_type='application/json'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _reply_json(self, payload, status=200):
+        self._reply(status, json.dumps(payload, ensure_ascii=False).encode('utf-8'))
+
+    def _read_body(self):
+        data = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if self.headers.get('Content-Encoding') == 'gzip':
+            data = gzip.decompress(data)
+        return json.loads(data.decode('utf-8')) if data else {}
+
+    def _authorized(self):
+        token = self.headers.get(TOKEN_HEADER) or ''
+        if not hmac.compare_digest(token.encode(), self.coordinator.token.encode()):
+            self._reply_json({'error': 'forbidden'}, 403)
+            return False
+        return True
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        parts = self.path.strip('/').split('/')
+        if parts == ['status']:
+            return self._reply_json(self.coordinator.status())
+        if len(parts) == 3 and parts[0] == 'jobs' and parts[2] == 'audio':
+            data = self.coordinator.audio(parts[1], self.headers.get('X-Worker', ''))
+            if data is None:
+                return self._reply_json({'error': 'gone'}, 410)
+            return self._reply(200, data, 'application/octet-stream')
+        self._reply_json({'error': 'not found'}, 404)
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+        parts = self.path.strip('/').split('/')
+        try:
+            body = self._read_body()
+        except (ValueError, OSError) as e:
+            return self._reply_json({'error': str(e)}, 400)
+        worker = self.headers.get('X-Worker', '')
+        if parts == ['claim']:
+            job = self.coordinator.claim(worker)
+            if job is None:
+                return self._reply(204)
+            return self._reply_json(job)
+        if len(parts) == 3 and parts[0] == 'jobs':
+            job_id, action = parts[1], parts[2]
+            if action == 'heartbeat':
+                ok = self.coordinator.heartbeat(job_id, worker)
+            elif action == 'result':
+                ok = self.coordinator.complete(job_id, worker, body['result'], body.get('elapsed'))
+            elif action == 'error':
+                ok = self.coordinator.fail(job_id, worker, body.get('error', ''), body.get('retry', True))
+            else:
+                return self._reply_json({'error': 'not found'}, 404)
+            return self._reply_json({'ok': ok}, 200 if ok else 410)
+        self._reply_json({'error': 'not found'}, 404)
+
+class RemoteWorker:
+    """コーディネーターからジョブを取得して文字起こしするワーカー
+
+    ジョブに音声が含まれない（分割モード）場合は、共有ストレージ上の同じパスから
+    抽出します。ジョブで指定されたモデル・バックエンド・言語・プリセットの
+    トランスクライバをワーカー内で1つずつ保持します。
+    """
+
+    def __init__(self, url, transcriber_factory, name=None, poll_interval=2.0, token=None, logger=None):
+        self.url = url.rstrip('/')
+        # (モデル名, バックエンド, 言語, プリセット) -> WhisperTranscriber
+        self.transcriber_factory = transcriber_factory
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}"
+        self.poll_interval = poll_interval
+        self.token = token
+        self.logger = logger
+        self._transcribers = {}
+        self.stop_event = threading.Event()
+
+    def _log(self, message, level=logging.INFO):
+        if self.logger:
+            self.logger.log(level, message)
+
+    def _request(self, method, path, payload=None, compress=False, timeout=60):
+        data = None
+        headers = {'X-Worker': self.name}
+        if self.token:
+            headers[TOKEN_HEADER] = self.token
+        if payload is not None:
+            data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+            if compress:
+                data = gzip.compress(data, 6)
+                headers['Content-Encoding'] = 'gzip'
+        request = urllib.request.Request(f"{self.url}{path}", data=data, headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+    def transcriber(self, job):
+        key = (job['model'], job['backend'], job.get('language'), job.get('preset'))
+        if key not in self._transcribers:
+            self._transcribers[key] = self.transcriber_factory(*key)
+        return self._transcribers[key]
+
+    def _heartbeat(self, job_id, done, interval):
+        while not done.wait(interval):
+            try:
+                status, _ = self._request('POST', f'/jobs/{job_id}/heartbeat', {})
+            except OSError:
+                continue
+            if status == 410:
+                return  # 再割り当て・取り消し済み
+
+    def run_once(self):
+        """ジョブを1件処理する（ジョブが無ければFalse）"""
+        status, body = self._request('POST', '/claim', {})
+        if status == 204:
+            return False
+        if status != 200:
+            raise RuntimeError(f"ジョブの取得に失敗しました（HTTP {status}）: {body[:200]!r}")
+        job = json.loads(body.decode('utf-8'))
+        name = os.path.basename(job['path'])
+        self._log(f"ジョブ {job['id']} を取得: {name}")
+
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job['id'], done, 20.0), daemon=True)
+        heartbeat.start()
+        try:
+            audio = None
+            if job['samples'] is not None:
+                status, data = self._request('GET', f"/jobs/{job['id']}/audio", timeout=300)
+                if status != 200:
+                    self._log(f"ジョブ {job['id']} は取り消されました: {name}")
+                    return True
+                audio = decode_audio(data)
+            transcriber = self.transcriber(job)
+            started = time.perf_counter()
+            result = transcriber.transcribe(job['path'], audio=audio, chunked=job['chunked'],
+                                            stop_event=self.stop_event)
+            elapsed = time.perf_counter() - started
+        except Exception as e:
+            done.set()
+            self._log(f"ジョブ {job['id']} の処理に失敗しました: {name} - {str(e)}", level=logging.ERROR)
+            # 音声が無いなど、ファイル自体の問題は再試行しない
+            self._request('POST', f"/jobs/{job['id']}/error",
+                          {'error': str(e), 'retry': not isinstance(e, (ValueError, FileNotFoundError))})
+            return True
+        done.set()
+        status, _ = self._request('POST', f"/jobs/{job['id']}/result",
+                                  {'result': result, 'elapsed': elapsed}, compress=True, timeout=300)
+        if status == 200:
+            duration = len(audio) / SAMPLE_RATE if audio is not None else result.get('duration') or 0.0
+            self._log(f"ジョブ {job['id']} 完了: {name}（{duration:.1f}秒の音声を{elapsed:.1f}秒で処理）")
+        else:
+            self._log(f"ジョブ {job['id']} の結果は破棄されました（再割り当て済み）: {name}", level=logging.WARNING)
+        return True
+
+    def run(self):
+        """stopが呼ばれるまでジョブを処理し続ける（コーディネーターに接続できない間は待機）"""
+        self._log(f"ワーカー {self.name} を開始: {self.url}")
+        while not self.stop_event.is_set():
+            try:
+                if self.run_once():
+                    continue
+            except OSError as e:
+                self._log(f"コーディネーターに接続できません: {str(e)}", level=logging.WARNING)
+            self.stop_event.wait(self.poll_interval)
+
+    def stop(self):
+        self.stop_event.set()
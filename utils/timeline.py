@@ -0,0 +1,128 @@
+import os
+import json
+import hashlib
+from utils.formatters import EDLFormatter, SRTFormatter
+
+MANIFEST_VERSION = 1
+
+class CombinedTimelineBuilder:
+    """複数ファイルのセグメントを1本のタイムラインとして結合したSRT/EDLを書き出す
+
+    各ファイルのセグメントは、それより前のクリップの長さの合計だけずらし、
+    番号は全体で振り直します。出力の横に <出力名>.manifest.json を置き、
+    クリップごとの書き出し位置（バイト）と内容のダイジェストを記録します。
+    再実行時は最初に変化したクリップの位置で切り詰め、そこから後ろだけを書き直します。
+    """
+
+    FORMATS = ('srt', 'edl')
+
+    def __init__(self, output_path, fmt, title="Combined Transcription", include_filename=True):
+        if fmt not in self.FORMATS:
+            raise ValueError(f"未対応の結合フォーマットです: {fmt}")
+        self.output_path = output_path
+        self.fmt = fmt
+        self.title = title
+        self.include_filename = include_filename
+        self.manifest_path = f"{output_path}.manifest.json"
+
+    @staticmethod
+    def digest(duration, segments):
+        """クリップ内容のダイジェスト（長さと有効なセグメントの時刻・テキスト）"""
+        h = hashlib.blake2b(digest_size=16)
+        h.update(repr(round(duration, 3)).encode())
+        for segment in segments:
+            if SRTFormatter.is_valid_segment(segment):
+                h.update(f"{segment['start']:.3f}|{segment['end']:.3f}|{segment['text']}\n".encode('utf-8'))
+        return h.hexdigest()
+
+    def _settings(self):
+        return {
+            'version': MANIFEST_VERSION,
+            'format': self.fmt,
+            'title': self.title,
+            'include_filename': self.include_filename
+        }
+
+    def _load_manifest(self):
+        """前回のマニフェストを読み込む（出力と整合しなければNone）"""
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if manifest.get('settings') != self._settings():
+            return None
+        if not os.path.exists(self.output_path) or os.path.getsize(self.output_path) != manifest.get('end_bytes'):
+            return None
+        return manifest
+
+    def _iter_clip(self, clip, first_number, offset, header):
+        if self.fmt == 'srt':
+            return SRTFormatter.iter_entries(
+                clip['segments'], include_filename=self.include_filename,
+                first_number=first_number, offset=offset)
+        return EDLFormatter.iter_entries(
+            clip['segments'], title=self.title,
+            first_number=first_number, offset=offset, header=header)
+
+    def build(self, clips):
+        """clips（順序付きの {'path', 'duration', 'segments'} のリスト）から結合ファイルを書き出す
+
+        書き直した・末尾から取り除いたクリップ数を返します（0なら変更なし）。
+        """
+        entries = []
+        for clip in clips:
+            entries.append({
+                'path': clip['path'],
+                'duration': clip['duration'],
+                'digest': self.digest(clip['duration'], clip['segments']),
+                'cues': sum(1 for segment in clip['segments'] if SRTFormatter.is_valid_segment(segment))
+            })
+
+        # 前回と同じ先頭部分は書き直さない
+        manifest = self._load_manifest()
+        previous = manifest['clips'] if manifest else []
+        first_changed = 0
+        while (first_changed < min(len(previous), len(entries)) and
+               all(previous[first_changed][k] == entries[first_changed][k] for k in ('path', 'duration', 'digest'))):
+            entries[first_changed] = previous[first_changed]
+            first_changed += 1
+        if manifest and first_changed == len(entries) == len(previous):
+            return 0
+
+        if first_changed < len(previous):
+            start_bytes = previous[first_changed]['offset_bytes']
+        elif previous:
+            start_bytes = manifest['end_bytes']
+        else:
+            start_bytes = 0
+
+        if first_changed:
+            last = entries[first_changed - 1]
+            offset = last['timeline_start'] + last['duration']
+            number = last['first_number'] + last['cues']
+        else:
+            offset = 0.0
+            number = 1
+
+        mode = 'r+b' if start_bytes else 'wb'
+        with open(self.output_path, mode) as f:
+            f.seek(start_bytes)
+            f.truncate()
+            for index in range(first_changed, len(clips)):
+                entry = entries[index]
+                entry['offset_bytes'] = f.tell()
+                entry['timeline_start'] = offset
+                entry['first_number'] = number
+                for chunk in self._iter_clip(clips[index], number, offset, header=(index == 0)):
+                    f.write(chunk.encode('utf-8'))
+                offset += entry['duration']
+                number += entry['cues']
+            end_bytes = f.tell()
+
+        temp_path = f"{self.manifest_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'settings': self._settings(), 'end_bytes': end_bytes, 'clips': entries}, f)
+        os.replace(temp_path, self.manifest_path)
+        # 前回より減った場合は切り詰めた末尾のクリップも数える
+        return max(len(clips), len(previous)) - first_changed
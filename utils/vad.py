@@ -0,0 +1,212 @@
+import bisect
+from collections import deque
+import numpy as np
+from utils.audio import SAMPLE_RATE
+
+DIGITAL_SILENCE_DB = -80.0  # これ以下のフレームしか無い音声はデジタル無音とみなす
+
+def fixed_regions(audio, region_seconds=30.0, start=0):
+    """音声をregion_seconds秒ごとに区切った (開始サンプル位置, 音声) のジェネレータ（VADを使わない場合）"""
+    size = max(int(region_seconds * SAMPLE_RATE), 1)
+    for offset in range(0, len(audio), size):
+        yield start + offset, audio[offset:offset + size]
+
+class EnergyVAD:
+    """フレームエネルギーによる簡易VAD（ストリーミング対応）
+
+    AudioLoader.streamのブロックを順に受け取り、発話区間を
+    (元音声での開始サンプル位置, 音声配列) として返します。
+    保持するのは処理中の区間のみなので、入力長に関わらずメモリ使用量は一定です。
+
+    ブロック内のエネルギーの幅（上位10%と下位10%の差）がmin_dynamic_range_db未満の場合は
+    ノイズフロアを推定できない（BGMの上の発話や、ずっと大きい音）ため、threshold_dbを超える
+    フレームをすべて発話とします。fallbackがTrueなら、発話が1つも見つからなかった
+    デジタル無音でない音声はそのまま全体を区間として返します（それまでの音声は保持するため、
+    長い音声をストリーミングする場合はFalseにして、必要なら呼び出し側で読み直します）。
+    """
+
+    def __init__(self, threshold_db=-45.0, margin_db=12.0, frame_seconds=0.03,
+                 min_silence_seconds=0.6, min_speech_seconds=0.25, pad_seconds=0.2,
+                 max_region_seconds=30.0, min_dynamic_range_db=20.0, fallback=True):
+        self.threshold_db = threshold_db
+        self.margin_db = margin_db  # 推定ノイズフロアからの余裕
+        self.min_dynamic_range_db = min_dynamic_range_db
+        self.fallback = fallback
+        self.max_region_seconds = max_region_seconds
+        self.frame_length = int(frame_seconds * SAMPLE_RATE)
+        self.min_silence_frames = max(int(min_silence_seconds / frame_seconds), 1)
+        self.min_speech_frames = max(int(min_speech_seconds / frame_seconds), 1)
+        self.pad_frames = int(pad_seconds / frame_seconds)
+        self.max_region_frames = max(int(max_region_seconds / frame_seconds), 1)
+        self.total_samples = 0
+        self.speech_samples = 0
+        self.peak_db = None  # 最も大きいフレームのエネルギー
+
+    def frame_energies(self, frames):
+        """フレームごとのRMSをdBFSで返す（ベクトル化）"""
+        rms = np.sqrt(np.mean(np.square(frames, dtype=np.float32), axis=1) + 1e-10)
+        return 20.0 * np.log10(rms)
+
+    def regions(self, blocks):
+        """発話区間のジェネレータ"""
+        frame_length = self.frame_length
+        noise_floor = None
+        carry = np.zeros(0, dtype=np.float32)
+        position = 0  # 次に処理するフレームの元音声での開始サンプル
+        pre_roll = deque(maxlen=self.pad_frames or 1)
+        region = []  # 処理中の区間のフレーム
+        region_start = None
+        speech_frames = 0
+        silence_frames = 0
+        found = False
+        retained = []  # 発話が見つかるまでの音声（全体を返す場合に使う）
+
+        def finish(frames, start):
+            # 末尾の無音はpad分だけ残す
+            keep = len(frames) - max(silence_frames - self.pad_frames, 0)
+            frames = frames[:keep]
+            if speech_frames >= self.min_speech_frames and frames:
+                audio = np.concatenate(frames)
+                self.speech_samples += len(audio)
+                return start, audio
+            return None
+
+        for block in blocks:
+            self.total_samples += len(block)
+            if self.fallback and not found:
+                retained.append(block)
+            if len(carry):
+                block = np.concatenate([carry, block])
+            n_frames = len(block) // frame_length
+            carry = block[n_frames * frame_length:].copy()
+            if n_frames == 0:
+                continue
+
+            frames = block[:n_frames * frame_length].reshape(n_frames, frame_length)
+            energies = self.frame_energies(frames)
+            block_peak = float(energies.max())
+            self.peak_db = block_peak if self.peak_db is None else max(self.peak_db, block_peak)
+
+            # ノイズフロアは下方向には即追従し、上方向にはゆっくり追従
+            block_floor, block_high = np.percentile(energies, [10, 90])
+            noise_floor = block_floor if noise_floor is None else min(block_floor, noise_floor + 1.0)
+            if block_high - block_floor < self.min_dynamic_range_db:
+                # 定常的な背景音の上では下限から発話を分けられない
+                threshold = self.threshold_db
+            else:
+                threshold = max(self.threshold_db, noise_floor + self.margin_db)
+            is_speech = energies > threshold
+
+            for frame, speech in zip(frames, is_speech):
+                if region_start is None:
+                    if speech:
+                        region = list(pre_roll) if self.pad_frames else []
+                        region_start = position - len(region) * frame_length
+                        region.append(frame)
+                        speech_frames = 1
+                        silence_frames = 0
+                        pre_roll.clear()
+                    else:
+                        pre_roll.append(frame)
+                else:
+                    region.append(frame)
+                    if speech:
+                        speech_frames += 1
+                        silence_frames = 0
+                    else:
+                        silence_frames += 1
+
+                    if silence_frames >= self.min_silence_frames:
+                        result = finish(region, region_start)
+                        if result:
+                            found = True
+                            retained.clear()
+                            yield result
+                        region, region_start = [], None
+                        speech_frames = silence_frames = 0
+                    elif len(region) >= self.max_region_frames:
+                        # 長すぎる区間は最大長で区切る（次の区間はそのまま続ける）
+                        silence_frames = 0
+                        result = finish(region, region_start)
+                        if result:
+                            found = True
+                            retained.clear()
+                            yield result
+                        region_start += len(region) * frame_length
+                        region = []
+                        speech_frames = 0
+                position += frame_length
+
+        if region_start is not None:
+            if len(carry):
+                region.append(carry)
+            result = finish(region, region_start)
+            if result:
+                found = True
+                yield result
+
+        if not found and retained and not self.is_digital_silence:
+            audio = retained[0] if len(retained) == 1 else np.concatenate(retained)
+            retained.clear()
+            self.speech_samples += len(audio)
+            yield from fixed_regions(audio, self.max_region_seconds)
+
+    @property
+    def is_digital_silence(self):
+        """これまでに処理した音声がデジタル無音か"""
+        return self.peak_db is None or self.peak_db <= DIGITAL_SILENCE_DB
+
+    @property
+    def speech_ratio(self):
+        return self.speech_samples / self.total_samples if self.total_samples else 0.0
+
+class SpeechWindow:
+    """複数の発話区間を詰めた推論用ウィンドウと、元のタイムラインへの対応表"""
+
+    def __init__(self, pieces):
+        self.source_starts = []  # 各区間の元音声での開始時刻（秒）
+        self.window_starts = []  # 各区間のウィンドウ内での開始時刻（秒）
+        offset = 0
+        for start_sample, audio in pieces:
+            self.source_starts.append(start_sample / SAMPLE_RATE)
+            self.window_starts.append(offset / SAMPLE_RATE)
+            offset += len(audio)
+        self.audio = np.concatenate([audio for _, audio in pieces])
+        self.duration = offset / SAMPLE_RATE
+
+    def to_source_time(self, t, is_end=False):
+        """ウィンドウ内の時刻を元音声の時刻に変換
+
+        終了時刻は区間の境界ちょうどの場合に前の区間側で変換します。
+        """
+        find = bisect.bisect_left if is_end else bisect.bisect_right
+        index = max(find(self.window_starts, t) - 1, 0)
+        return self.source_starts[index] + (t - self.window_starts[index])
+
+    def remap_segment(self, segment):
+        """セグメント（と単語）の時刻を元のタイムラインに書き換える"""
+        start = self.to_source_time(segment["start"])
+        end = self.to_source_time(segment["end"], is_end=True)
+        segment["start"], segment["end"] = start, max(end, start)
+        for word in segment.get("words", []) or []:
+            word["start"] = self.to_source_time(word["start"])
+            word["end"] = max(self.to_source_time(word["end"], is_end=True), word["start"])
+        return segment
+
+def pack_windows(regions, window_seconds=30.0):
+    """発話区間をwindow_seconds以内のウィンドウに詰めて返すジェネレータ
+
+    Whisperは30秒単位でエンコードするため、無音を除いた発話を
+    詰めて渡すことで無音の割合に比例して計算量が減ります。
+    """
+    window_samples = int(window_seconds * SAMPLE_RATE)
+    pieces = []
+    length = 0
+    for start, audio in regions:
+        if pieces and length + len(audio) > window_samples:
+            yield SpeechWindow(pieces)
+            pieces, length = [], 0
+        pieces.append((start, audio))
+        length += len(audio)
+    if pieces:
+        yield SpeechWindow(pieces)
@@ -0,0 +1,222 @@
+import os
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+import numpy as np
+
+WORDS_SUFFIX = '.words.npz'
+PHRASE_INDEX_NAME = '.whisper_phrases.sqlite3'
+SENTENCE_ENDINGS = ('。', '！', '？', '!', '?', '.')
+
+def normalize(text):
+    """検索用の正規化（空白を除き小文字化）"""
+    return ''.join(text.split()).lower()
+
+class WordStore:
+    """単語レベルのタイムスタンプを配列で保持するストア
+
+    開始・終了・確率・所属セグメントを並列の配列で持ち、単語の文字列は
+    1本の文字列とオフセット配列に詰めて保存します（pickle不要のnpz）。
+    モデルを再実行せずに字幕の区切り直しやフレーズ検索ができます。
+    """
+
+    def __init__(self, starts, ends, probabilities, segment_ids, texts):
+        self.starts = np.asarray(starts, dtype=np.float64)
+        self.ends = np.asarray(ends, dtype=np.float64)
+        self.probabilities = np.asarray(probabilities, dtype=np.float32)
+        self.segment_ids = np.asarray(segment_ids, dtype=np.int32)
+        self.texts = list(texts)
+        self._search_text = None
+
+    def __len__(self):
+        return len(self.texts)
+
+    @classmethod
+    def from_segments(cls, segments):
+        """Whisperのセグメント（word_timestamps=Trueの"words"）から作成"""
+        starts, ends, probabilities, segment_ids, texts = [], [], [], [], []
+        for index, segment in enumerate(segments):
+            for word in segment.get("words") or []:
+                starts.append(word["start"])
+                ends.append(word["end"])
+                probabilities.append(word.get("probability", 1.0))
+                segment_ids.append(index)
+                texts.append(word["word"])
+        return cls(starts, ends, probabilities, segment_ids, texts)
+
+    @staticmethod
+    def path_for(video_path, output_dir=None):
+        """動画に対応する単語ストアのパス（<出力先>/<動画名>.words.npz）"""
+        base_name = os.path.splitext(os.path.basename(video_path))[0]
+        return os.path.join(output_dir or os.path.dirname(video_path), f"{base_name}{WORDS_SUFFIX}")
+
+    def save(self, path):
+        encoded = [text.encode('utf-8') for text in self.texts]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(data) for data in encoded], out=offsets[1:])
+        temp_path = f"{path}.{threading.get_ident()}.tmp.npz"
+        np.savez_compressed(
+            temp_path,
+            starts=self.starts,
+            ends=self.ends,
+            probabilities=self.probabilities,
+            segment_ids=self.segment_ids,
+            text=np.frombuffer(b''.join(encoded), dtype=np.uint8),
+            offsets=offsets
+        )
+        os.replace(temp_path, path)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            raw = data['text'].tobytes()
+            offsets = data['offsets']
+            texts = [raw[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(len(offsets) - 1)]
+            return cls(data['starts'], data['ends'], data['probabilities'], data['segment_ids'], texts)
+
+    def resegment(self, max_chars=None, max_duration=None, max_gap=1.0, file_name=None):
+        """単語を字幕キューに区切り直す
+
+        文字数（max_chars）・長さ（max_duration秒）の上限を超える前、
+        単語間の無音がmax_gap秒を超える箇所、文末の句読点の後で区切ります。
+        各キューは "words" を含むため、再び単語ストアを作れます。
+        """
+        segments = []
+        current = []
+        chars = 0
+
+        def flush():
+            if not current:
+                return
+            text = ''.join(self.texts[i] for i in current)
+            segment = {
+                "id": len(segments),
+                "start": float(self.starts[current[0]]),
+                "end": float(self.ends[current[-1]]),
+                "text": text,
+                "words": [{"word": self.texts[i], "start": float(self.starts[i]), "end": float(self.ends[i]),
+                           "probability": float(self.probabilities[i])} for i in current]
+            }
+            if file_name:
+                segment["file_name"] = file_name
+            segments.append(segment)
+
+        for i in range(len(self.texts)):
+            word_chars = len(self.texts[i].strip())
+            if current:
+                too_long = max_chars is not None and chars + word_chars > max_chars
+                too_late = max_duration is not None and self.ends[i] - self.starts[current[0]] > max_duration
+                gap = max_gap is not None and self.starts[i] - self.ends[current[-1]] > max_gap
+                if too_long or too_late or gap:
+                    flush()
+                    current, chars = [], 0
+            current.append(i)
+            chars += word_chars
+            if self.texts[i].strip().endswith(SENTENCE_ENDINGS):
+                flush()
+                current, chars = [], 0
+        flush()
+        return segments
+
+    def _search_table(self):
+        """正規化した全文と、各文字が属する単語番号の配列"""
+        if self._search_text is None:
+            normalized = [normalize(text) for text in self.texts]
+            self._search_text = ''.join(normalized)
+            self._char_words = np.repeat(np.arange(len(normalized), dtype=np.int32),
+                                         [len(text) for text in normalized])
+        return self._search_text, self._char_words
+
+    def find(self, phrase):
+        """フレーズの出現箇所を [(開始秒, 終了秒, 一致した文字列)] で返す（単語の境界をまたいで検索）"""
+        query = normalize(phrase)
+        if not query or not self.texts:
+            return []
+        text, char_words = self._search_table()
+        hits = []
+        position = text.find(query)
+        while position >= 0:
+            first = char_words[position]
+            last = char_words[position + len(query) - 1]
+            hits.append((float(self.starts[first]), float(self.ends[last]),
+                         ''.join(self.texts[first:last + 1]).strip()))
+            position = text.find(query, position + 1)
+        return hits
+
+class PhraseIndex:
+    """プロジェクト内の単語ストアに対する転置インデックス（SQLite）
+
+    正規化した文字バイグラムごとに、それを含む動画を記録します。
+    検索時はバイグラムで候補の動画を絞り込み、該当する単語ストアだけを
+    読み込んで時刻付きの一致箇所を返します（日本語でも形態素解析は不要です）。
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        with self._connect() as db:
+            db.execute('CREATE TABLE IF NOT EXISTS documents ('
+                       'path TEXT PRIMARY KEY, words_path TEXT, updated_at REAL)')
+            db.execute('CREATE TABLE IF NOT EXISTS postings (gram TEXT, path TEXT, PRIMARY KEY (gram, path))')
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    @staticmethod
+    def grams(text):
+        """文字バイグラムの集合"""
+        return {text[i:i + 2] for i in range(len(text) - 1)}
+
+    def add(self, video_path, words_path, store):
+        """動画の単語ストアを登録（既存の登録は置き換える）"""
+        path = os.path.abspath(video_path)
+        grams = self.grams(normalize(''.join(store.texts)))
+        with self._lock, self._connect() as db:
+            db.execute('DELETE FROM postings WHERE path = ?', (path,))
+            db.executemany('INSERT OR IGNORE INTO postings VALUES (?, ?)', [(gram, path) for gram in grams])
+            db.execute('INSERT OR REPLACE INTO documents VALUES (?, ?, ?)',
+                       (path, os.path.abspath(words_path), time.time()))
+
+    def remove(self, video_path):
+        path = os.path.abspath(video_path)
+        with self._lock, self._connect() as db:
+            db.execute('DELETE FROM postings WHERE path = ?', (path,))
+            db.execute('DELETE FROM documents WHERE path = ?', (path,))
+
+    def candidates(self, phrase):
+        """フレーズの全バイグラムを含む動画の {パス: 単語ストアのパス}"""
+        query = normalize(phrase)
+        grams = sorted(self.grams(query))
+        if not grams:
+            # 1文字の検索は絞り込めないため全件が候補
+            if not query:
+                return {}
+            with self._lock, self._connect() as db:
+                return dict(db.execute('SELECT path, words_path FROM documents').fetchall())
+        placeholders = ','.join('?' * len(grams))
+        with self._lock, self._connect() as db:
+            rows = db.execute(
+                f'SELECT d.path, d.words_path FROM postings p JOIN documents d ON d.path = p.path '
+                f'WHERE p.gram IN ({placeholders}) GROUP BY p.path HAVING COUNT(*) = ?',
+                (*grams, len(grams))).fetchall()
+        return dict(rows)
+
+    def search(self, phrase):
+        """フレーズの出現箇所を [{'file', 'start', 'end', 'text'}] で返す"""
+        hits = []
+        for path, words_path in sorted(self.candidates(phrase).items()):
+            try:
+                store = WordStore.load(words_path)
+            except OSError:
+                continue  # 単語ストアが削除された
+            for start, end, text in store.find(phrase):
+                hits.append({'file': path, 'start': start, 'end': end, 'text': text})
+        return hits
@@ -1,25 +1,82 @@
 import os
-import whisper
+import time
+import itertools
 import torch
-import tempfile
 import ffmpeg
 import logging
 from utils.formatters import EDLFormatter, SRTFormatter, MLTFormatter
+from utils.model_registry import ModelRegistry
+from utils.backends import get_backend
+from utils.audio import AudioLoader, AudioExtractor, SAMPLE_RATE
+from utils.vad import EnergyVAD, fixed_regions, pack_windows
+from utils.cache import TranscriptionCache
+from utils.instrumentation import Instrumentation
+from utils.word_store import WordStore
+from utils.devices import DeviceManager, CPUDevice
+from utils.fingerprint import AudioFingerprint, plan_retranscription, shift_segment
+from utils.postprocess import SegmentPostProcessor
+
+# デコード設定のプリセット（速い順）。温度が複数あると失敗時に高い温度でやり直す
+DECODE_PRESETS = {
+    'fast': dict(temperature=0.0, best_of=1, beam_size=1),
+    'balanced': dict(temperature=(0.0, 0.2, 0.4), best_of=3, beam_size=3),
+    'accurate': dict(temperature=(0.0, 0.2, 0.4, 0.6, 0.8, 1.0), best_of=5, beam_size=5)
+}
+# 事前判定の言語の確からしさに応じたプリセット（どれにも満たなければaccurate）
+PRESET_CONFIDENCE = (('fast', 0.9), ('balanced', 0.6))
+DETECT_WINDOWS = 3     # 事前判定に使う30秒ウィンドウの数
+NO_SPEECH_EXIT = 0.8   # 判定に使った全ウィンドウの無音確率がこれを超えたら文字起こししない
+INCREMENTAL_MAX_CHANGE = 0.8  # 前回の版からこの割合以上を再文字起こしする場合は全体を文字起こし
 
 class WhisperTranscriber:
-    def __init__(self, model_name="small", use_gpu=True, logger=None):
-        self.device = "cuda" if use_gpu and torch.cuda.is_available() else "cpu"
+    def __init__(self, model_name="small", use_gpu=True, logger=None, cache=None, instrumentation=None,
+                 backend=None, num_threads=None, batch_size=1, media_index=None, device_manager=None,
+                 allow_model_downgrade=False, language=None, preset='auto', extractor=None, postprocessor=None):
         self.logger = logger
-        if self.device == "cuda":
-            torch.cuda.empty_cache()
-        self._log(f"デバイス: {self.device}")
-        self._log(f"選択モデル: {model_name}")
-        self._log("モデルをロード中...")
-        self.model = None
+        if preset != 'auto' and preset not in DECODE_PRESETS:
+            raise ValueError(f"未対応のプリセットです: {preset}（auto, {', '.join(DECODE_PRESETS)}）")
+        # 言語（Noneなら事前判定）とデコード設定のプリセット（autoなら言語の確からしさで選ぶ）
+        self.language = None if language in (None, 'auto') else language
+        self.preset = preset
+        self.backend = get_backend(backend)
+        self.device_manager = device_manager or DeviceManager.detect(use_gpu)
+        if self.device_manager.is_gpu and not self.backend.supports(self.device_manager.torch_device):
+            self._log(f"{self.backend.name} は {self.device_manager.name} に対応していないためCPUで実行します",
+                      level=logging.WARNING)
+            self.device_manager = DeviceManager(CPUDevice())
+        # 空きGPUメモリに収まるモデルとバッチサイズを選ぶ（収まらなければCPU）
+        planned_model, batch_size, fits = self.device_manager.plan(
+            model_name, max(int(batch_size), 1), allow_downgrade=allow_model_downgrade)
+        if self.device_manager.is_gpu:
+            self._log(f"GPUメモリ: {self.device_manager.memory_report()}")
+            if not fits:
+                self._log(f"GPUメモリが不足しているため {model_name} をCPUで実行します", level=logging.WARNING)
+                self.device_manager = DeviceManager(CPUDevice())
+            elif planned_model != model_name:
+                self._log(f"GPUメモリに合わせてモデルを {model_name} から {planned_model} に変更します",
+                          level=logging.WARNING)
+                model_name = planned_model
+        self.device = self.device_manager.torch_device
+        # CPUではfp16が使えないため、精度はバックエンドとデバイスから決定
+        self.precision = self.backend.precision(self.device)
         self.model_name = model_name
-        self.model_loaded = False
-        self._load_model()
-        self._log("モデルのロードが完了しました")
+        self._cpu_transcriber = None  # GPUメモリ不足時に使うCPU版
+        self.cache = cache  # TranscriptionCache（Noneならキャッシュしない）
+        self.media_index = media_index  # MediaIndex（Noneなら毎回probeする）
+        # 音声の取り出し方（ローカルへのストリームコピー・ボリュームごとの同時読み込み数）
+        self.extractor = extractor or AudioExtractor()
+        # 出力前のセグメントの後処理（繰り返しの除去・短いキューの結合・分割・重なりの調整）
+        self.postprocessor = postprocessor or SegmentPostProcessor(logger=logger)
+        self.instrumentation = instrumentation or Instrumentation()
+        # 1回のエンコーダ/デコーダで処理する30秒ウィンドウ数（1なら逐次のwhisper.transcribe）
+        self.batch_size = batch_size
+        # CPU推論のスレッド数（Noneならtorchの既定値）
+        self.num_threads = num_threads
+        if num_threads and self.device == "cpu":
+            torch.set_num_threads(num_threads)
+        self._log(f"デバイス: {self.device_manager.name}")
+        self._log(f"バックエンド: {self.backend.name} ({self.precision}, スレッド数: {torch.get_num_threads()})")
+        self._log(f"選択モデル: {model_name}")
 
     def _log(self, message, level=logging.INFO):
         """ログメッセージをGUIとコンソールの両方に出力"""
@@ -28,203 +85,734 @@ class WhisperTranscriber:
         else:
             print(message)
 
+    def _log_memory(self, label):
+        if self.device_manager.is_gpu:
+            self._log(f"GPUメモリ（{label}）: {self.device_manager.memory_report()}")
+
+    @property
+    def model(self):
+        """共有モデルを取得（初回アクセス時にロード）"""
+        return self._load_model()
+
+    @property
+    def model_loaded(self):
+        return ModelRegistry.is_loaded(self.model_name, self.device, self.precision, self.backend.name)
+
     def _load_model(self):
         try:
-            if self.device == "cuda":
-                self._log(f"GPUメモリ使用量（ロード前）: {torch.cuda.memory_allocated() / 1024**2:.2f}MB")
-            self.model = whisper.load_model(self.model_name).to(self.device)
-            self.model_loaded = True
-            if self.device == "cuda":
-                self._log(f"GPUメモリ使用量（ロード後）: {torch.cuda.memory_allocated() / 1024**2:.2f}MB")
+            already_loaded = self.model_loaded
+            if not already_loaded:
+                self._log_memory("ロード前")
+            if already_loaded:
+                model = ModelRegistry.get(self.model_name, self.device, self.precision,
+                                          log=self._log, backend=self.backend.name)
+            else:
+                with self.instrumentation.span('model_load', model=self.model_name, device=self.device,
+                                               backend=self.backend.name):
+                    model = ModelRegistry.get(self.model_name, self.device, self.precision,
+                                              log=self._log, backend=self.backend.name)
+            if not already_loaded:
+                self._log_memory("ロード後")
+            return model
         except Exception as e:
+            if self.device_manager.is_gpu and self.device_manager.is_oom(e):
+                # ロードできない場合はこのトランスクライバごとCPUに切り替える
+                self._log(f"GPUメモリ不足のためモデルをCPUにロードします: {str(e)}", level=logging.WARNING)
+                self.device_manager.empty_cache()
+                self.device_manager = DeviceManager(CPUDevice())
+                self.device = self.device_manager.torch_device
+                self.precision = self.backend.precision(self.device)
+                return self._load_model()
             self._log(f"モデルのロードに失敗しました: {str(e)}", level=logging.ERROR)
-            self.model_loaded = False
             raise
 
+    def cpu_fallback(self):
+        """GPUメモリ不足時に1ファイルだけ再実行するためのCPU版トランスクライバ"""
+        if not self.device_manager.is_gpu:
+            return self
+        if self._cpu_transcriber is None:
+            self._cpu_transcriber = WhisperTranscriber(
+                model_name=self.model_name, use_gpu=False, logger=self.logger,
+                instrumentation=self.instrumentation, backend=self.backend.name,
+                num_threads=self.num_threads, media_index=self.media_index,
+                device_manager=DeviceManager(CPUDevice()), language=self.language, preset=self.preset,
+                extractor=self.extractor
+            )
+        return self._cpu_transcriber
+
     def is_model_ready(self):
-        return self.model_loaded and self.model is not None
+        return self.model_loaded
 
     def wait_for_model(self):
         if not self.is_model_ready():
             self._load_model()
 
-    def extract_audio(self, video_path, output_path=None):
-        """音声を抽出し、Whisper用に適切なフォーマットに変換します"""
-        if output_path is None:
-            # デバッグ用に一時ファイルを固定パスに保存
-            temp_dir = os.path.dirname(video_path)
-            output_path = os.path.join(temp_dir, f"debug_{os.path.basename(video_path)}.wav")
-        
+    def warm_up(self, callback=None):
+        """バックグラウンドでモデルを事前ロード（GUI起動を待たせない）"""
+        return ModelRegistry.warm_up(
+            self.model_name, self.device, self.precision,
+            log=self._log, callback=callback, backend=self.backend.name
+        )
+
+    def _log_stream_info(self, video_path, probe, audio_stream):
+        self._log(f"\n入力ファイル情報 - {video_path}:")
+        for stream in probe['streams']:
+            self._log(f"ストリーム: {stream['codec_type']}, コーデック: {stream.get('codec_name', 'N/A')}")
+
+        self._log(f"\n音声ストリーム情報:")
+        self._log(f"サンプルレート: {audio_stream.get('sample_rate', 'N/A')}")
+        self._log(f"チャンネル数: {audio_stream.get('channels', 'N/A')}")
+        self._log(f"コーデック: {audio_stream.get('codec_name', 'N/A')}")
+
+    def probe(self, video_path):
+        """(probe結果, 先頭の音声ストリーム) を返す（MediaIndexがあれば記録済みの値を使う）"""
+        if self.media_index is not None:
+            return self.media_index.probe(video_path)
+        return AudioLoader.probe(video_path)
+
+    def load_audio(self, video_path, stop_event=None, start=None, duration=None):
+        """音声をffmpegのパイプ経由で16kHzモノラルのfloat32配列として読み込みます（ディスク書き込みなし）
+
+        start/duration（秒）を指定すると、その範囲だけをシークして読み込みます。
+        """
         try:
-            if not os.path.exists(video_path):
-                raise FileNotFoundError(f"動画ファイルが見つかりません: {video_path}")
-
-            # 入力ファイルの情報を取得
-            probe = ffmpeg.probe(video_path)
-            self._log(f"\n入力ファイル情報 - {video_path}:")
-            for stream in probe['streams']:
-                self._log(f"ストリーム: {stream['codec_type']}, コーデック: {stream.get('codec_name', 'N/A')}")
-
-            audio_streams = [stream for stream in probe['streams'] if stream['codec_type'] == 'audio']
-            if not audio_streams:
-                raise ValueError(f"動画に音声ストリームが含まれていません: {video_path}")
-
-            self._log(f"\n音声ストリーム情報:")
-            self._log(f"サンプルレート: {audio_streams[0].get('sample_rate', 'N/A')}")
-            self._log(f"チャンネル数: {audio_streams[0].get('channels', 'N/A')}")
-            self._log(f"コーデック: {audio_streams[0].get('codec_name', 'N/A')}")
-
-            # 音声抽出とフォーマット変換
-            stream = ffmpeg.input(video_path)
-            stream = ffmpeg.output(stream, output_path,
-                                acodec='pcm_s16le',  # 16ビットPCM
-                                ac=1,                # モノラル
-                                ar='16k',           # 16kHz
-                                loglevel='error',   # エラーのみ表示
-                                threads=0)          # 自動スレッド数
-            
-            self._log(f"\n音声抽出開始: {output_path}")
-            ffmpeg.run(stream, capture_stdout=True, capture_stderr=True, overwrite_output=True)
-
-            # 出力ファイルの検証
-            if not os.path.exists(output_path):
-                raise FileNotFoundError(f"音声ファイルの生成に失敗しました: {output_path}")
-            
-            file_size = os.path.getsize(output_path)
-            if file_size < 1024:  # 1KB未満は異常と判断
-                raise ValueError(f"生成された音声ファイルが不正です（サイズ: {file_size}バイト）: {output_path}")
-
-            # 出力ファイルの情報を確認
-            output_probe = ffmpeg.probe(output_path)
-            self._log(f"\n出力音声ファイル情報:")
-            self._log(f"サイズ: {file_size / 1024:.2f}KB")
-            self._log(f"フォーマット: {output_probe['format']['format_name']}")
-            self._log(f"デュレーション: {output_probe['format']['duration']}秒")
-            self._log(f"ビットレート: {output_probe['format'].get('bit_rate', 'N/A')}bps")
-
-            # デバッグ用に音声ファイルを保持
-            self._log(f"音声ファイルを保存: {output_path}（手動確認用）")
-            return output_path
+            # 入力ファイルの情報を取得（probeは1回のみ）
+            with self.instrumentation.span('probe', file=video_path):
+                probe, audio_stream = self.probe(video_path)
+            self._log_stream_info(video_path, probe, audio_stream)
+
+            self._log(f"\n音声抽出開始（メモリ内）: {video_path}")
+            with self.instrumentation.span('extract', file=video_path):
+                audio = self.extractor.load(video_path, audio_stream, start, duration,
+                                            expected_duration=AudioLoader.get_duration(probe), stop_event=stop_event)
+            if len(audio) < SAMPLE_RATE // 10:  # 0.1秒未満は異常と判断
+                raise ValueError(f"抽出された音声が不正です（サンプル数: {len(audio)}）: {video_path}")
+
+            self._log(f"\n抽出音声情報:")
+            self._log(f"デュレーション: {len(audio) / SAMPLE_RATE:.2f}秒")
+            self._log(f"メモリ使用量: {audio.nbytes / 1024**2:.2f}MB")
+            return audio
 
         except ffmpeg.Error as e:
             error_message = e.stderr.decode() if e.stderr else str(e)
             self._log(f"FFmpeg エラー: {error_message}", level=logging.ERROR)
-            if os.path.exists(output_path):
-                os.remove(output_path)
             raise
         except Exception as e:
             self._log(f"音声抽出エラー: {str(e)}", level=logging.ERROR)
+            raise
+
+    def extract_audio(self, video_path, output_path=None, audio=None):
+        """音声を抽出し、確認用のWAVファイルとして保存します（オプトイン）"""
+        if output_path is None:
+            # デバッグ用に動画と同じフォルダへ保存
+            temp_dir = os.path.dirname(video_path)
+            output_path = os.path.join(temp_dir, f"debug_{os.path.basename(video_path)}.wav")
+
+        if audio is None:
+            audio = self.load_audio(video_path)
+        try:
+            AudioLoader.write_wav(audio, output_path)
+        except Exception as e:
+            self._log(f"音声ファイルの保存エラー: {str(e)}", level=logging.ERROR)
             if os.path.exists(output_path):
                 os.remove(output_path)
             raise
 
-    def process_video(self, video_path, output_dir=None, generate_edl=True, generate_srt=True, generate_mlt=False):
-        """動画を処理し、EDL、SRT、MLTファイルを生成します"""
+        self._log(f"音声ファイルを保存: {output_path}（手動確認用、{os.path.getsize(output_path) / 1024:.2f}KB）")
+        return output_path
+
+    def _transcribe_options(self, language=None, preset=None):
+        """Whisperのデコード設定
+
+        言語・プリセットを省略すると設定値を使います（言語がNoneならWhisperが判定し、
+        プリセットがautoならfast）。
+        """
+        if preset is None:
+            preset = 'fast' if self.preset == 'auto' else self.preset
+        options = dict(
+            language=language or self.language,
+            task="transcribe",
+            initial_prompt=None,
+            condition_on_previous_text=False,
+            word_timestamps=True,
+            fp16=self.precision == "fp16"
+        )
+        options.update(DECODE_PRESETS[preset])
+        return options
+
+    @staticmethod
+    def sample_windows(audio, count=DETECT_WINDOWS, window_seconds=30.0):
+        """事前判定用に、発話区間の先頭から始まるwindow_seconds秒の音声をファイル全体から均等にcount個選ぶ
+
+        VADで発話が見つからない場合（BGMの上の発話やずっと大きい音など）はファイル全体から
+        均等な位置を選び、モデルの無音確率で判定させます。空のリストを返すのはデジタル無音の場合のみです。
+        """
+        size = int(window_seconds * SAMPLE_RATE)
+        blocks = (audio[i:i + size] for i in range(0, len(audio), size))
+        vad = EnergyVAD(fallback=False)
+        starts = [start for start, _ in vad.regions(blocks)]
+        if not starts:
+            if vad.is_digital_silence:
+                return []
+            starts = list(range(0, max(len(audio) - size, 0) + 1, max(size, 1)))
+        picks = sorted({starts[round(i * (len(starts) - 1) / max(count - 1, 1))] for i in range(count)})
+        return [audio[start:start + size] for start in picks]
+
+    def analyze(self, audios):
+        """事前判定：数個の音声（30秒以下）から発話の有無と言語を判定し、プリセットを決める
+
+        {'speech', 'language', 'language_probability', 'preset', 'no_speech_prob'} を返します。
+        audiosが空（デジタル無音）の場合はモデルを使わずに発話なしとします。
+        """
+        if not audios:
+            return {'speech': False, 'language': self.language, 'language_probability': None,
+                    'preset': None, 'no_speech_prob': 1.0}
+        self.device_manager.reserve(self.model_name, len(audios))
+        detections = self.backend.detect(self.model, audios, self._transcribe_options())
+        no_speech_prob = min(p for _, p in detections)
+        speech = [probabilities for probabilities, p in detections if p <= NO_SPEECH_EXIT]
+        if not speech:
+            return {'speech': False, 'language': self.language, 'language_probability': None,
+                    'preset': None, 'no_speech_prob': no_speech_prob}
+
+        totals = {}
+        for probabilities in speech:
+            for code, p in probabilities.items():
+                totals[code] = totals.get(code, 0.0) + p / len(speech)
+        language = self.language or max(totals, key=totals.get)
+        probability = totals.get(language, 0.0)
+        preset = self.preset
+        if preset == 'auto':
+            preset = next((name for name, threshold in PRESET_CONFIDENCE if probability >= threshold), 'accurate')
+        self._log(f"事前判定: 言語 {language}（{probability:.2f}）、無音確率 {no_speech_prob:.2f} → {preset}")
+        return {'speech': True, 'language': language, 'language_probability': round(probability, 4),
+                'preset': preset, 'no_speech_prob': no_speech_prob}
+
+    def _no_speech_result(self, video_path, duration, analysis):
+        self._log(f"発話が無いため文字起こしをスキップします: {video_path}")
+        return {'text': '', 'segments': [], 'language': analysis['language'], 'duration': duration,
+                'no_speech': True}
+
+    def cache_key(self, video_path, chunked=False):
+        """音声内容・モデル・デコード設定からキャッシュキーを生成（キャッシュ無効時はNone）"""
+        if self.cache is None:
+            return None
+        try:
+            audio_hash = self.cache.audio_hash(video_path, self.extractor)
+        except Exception as e:
+            self._log(f"音声ハッシュの計算に失敗しました（キャッシュを使用しません）: {video_path} - {str(e)}",
+                      level=logging.WARNING)
+            return None
+        return TranscriptionCache.make_key(audio_hash, self.model_name, self._cache_options(chunked))
+
+    def _cache_options(self, chunked=False):
+        # 量子化などで結果が変わるため、バックエンドもキーに含める
+        return dict(self._transcribe_options(), language=self.language or 'auto', preset=self.preset,
+                    chunked=chunked, backend=self.backend.name, batched=self.batch_size > 1)
+
+    def settings_key(self, chunked=False):
+        """音声によらないモデル・デコード設定だけのキー（前回の版の記録に使用）"""
+        return TranscriptionCache.make_key(None, self.model_name, self._cache_options(chunked))
+
+    def load_cached(self, key):
+        """キャッシュ済みの認識結果を返す（無ければNone）"""
+        if key is None:
+            return None
+        result = self.cache.get(key)
+        if result is not None:
+            self._log(f"キャッシュから認識結果を読み込みました（{len(result['segments'])}セグメント）")
+        return result
+
+    def store_cached(self, key, result):
+        if key is None:
+            return
+        try:
+            self.cache.put(key, result)
+        except Exception as e:
+            self._log(f"キャッシュの保存に失敗しました: {str(e)}", level=logging.WARNING)
+
+    def incremental_plan(self, video_path, key, audio):
+        """前回文字起こしした版と音声を比べ、(今回の音声の指紋, 再文字起こしの計画) を返します
+
+        前回の版が無い・結果がキャッシュから消えている・同じ音声・大半が変わっている場合の
+        計画はNoneです（全体を文字起こし）。指紋は文字起こし後にstore_versionで記録します。
+        """
+        block = 30 * SAMPLE_RATE
+        with self.instrumentation.span('fingerprint', file=video_path):
+            fingerprint = AudioFingerprint.compute(audio[start:start + block] for start in range(0, len(audio), block))
+        if key is None:
+            return fingerprint, None
+        version = self.cache.get_version(video_path, self.settings_key())
+        if version is None or version[0] == key:
+            return fingerprint, None
+        previous = self.cache.get(version[0])
+        if previous is None:
+            return fingerprint, None
+
+        with self.instrumentation.span('diff', file=video_path):
+            plan = plan_retranscription(version[1], fingerprint, previous['segments'])
+        if plan['transcribe_seconds'] > fingerprint.duration * INCREMENTAL_MAX_CHANGE:
+            self._log(f"前回の版から大きく変わっているため全体を文字起こしします: {video_path}")
+            return fingerprint, None
+        plan.update(language=previous.get('language'), preset=previous.get('preset'))
+        self._log(f"前回の版から再利用: {plan['reused_seconds']:.1f}秒 / 再文字起こし: "
+                  f"{plan['transcribe_seconds']:.1f}秒（{len(plan['regions'])}区間）: {video_path}")
+        return fingerprint, plan
+
+    def store_version(self, video_path, key, fingerprint):
+        """文字起こしした版を記録（次回の差分の再文字起こし用）"""
+        if key is None:
+            return
+        try:
+            self.cache.put_version(video_path, self.settings_key(), key, fingerprint)
+        except Exception as e:
+            self._log(f"版の記録に失敗しました: {str(e)}", level=logging.WARNING)
+
+    def transcribe_incremental(self, video_path, audio, plan, stop_event=None):
+        """planの区間だけを文字起こしし、前回のセグメントとつなげた結果を返します"""
+        segments = [dict(segment) for segment in plan['segments']]
+        language = plan.get('language')
+        for start, end in plan['regions']:
+            if stop_event is not None and stop_event.is_set():
+                raise RuntimeError("処理がキャンセルされました")
+            part = audio[int(start * SAMPLE_RATE):int(end * SAMPLE_RATE)]
+            if len(part) < SAMPLE_RATE // 10:
+                continue
+            result = self.transcribe(video_path, audio=part, stop_event=stop_event)
+            segments += [shift_segment(segment, start) for segment in result['segments']]
+            language = language or result.get('language')
+
+        segments.sort(key=lambda segment: segment['start'])
+        for index, segment in enumerate(segments):
+            segment['id'] = index
+        return {
+            'text': ''.join(segment['text'] for segment in segments),
+            'segments': segments,
+            'language': language,
+            'preset': plan.get('preset'),
+            'duration': len(audio) / SAMPLE_RATE,
+            'incremental': {
+                'regions': len(plan['regions']),
+                'reused_seconds': round(plan['reused_seconds'], 3),
+                'transcribed_seconds': round(plan['transcribe_seconds'], 3)
+            }
+        }
+
+    def transcribe_chunked(self, video_path, window_seconds=30.0, vad=None, stop_event=None, audio=None):
+        """VADで無音を除き、発話区間を固定長ウィンドウに詰めて認識します
+
+        音声はブロック単位でストリーミング処理するため、入力の長さに関わらず
+        保持する音声は数ウィンドウ分のみです。タイムスタンプは元の時間軸に戻します。
+        言語とプリセットは発話のある最初のウィンドウで決め、Whisperが無音と判定した
+        ウィンドウ（冒頭の音楽など）は読み飛ばします。最後まで発話が無ければ文字起こししません。
+        VADで発話が見つからない（一様な環境音など）場合は、もう一度読み込んで固定長のウィンドウで判定します。
+        audio（共有バッファのメモリマップなど）を渡すと、元ファイルは読まずにその音声を使います。
+        """
+        vad = vad or EnergyVAD(max_region_seconds=window_seconds, fallback=False)
+        self._log(f"\n分割認識開始（ウィンドウ: {window_seconds:.0f}秒）: {video_path}")
+        if audio is not None:
+            size = int(window_seconds * SAMPLE_RATE)
+            duration = len(audio) / SAMPLE_RATE
+
+            def open_blocks():
+                return (audio[i:i + size] for i in range(0, len(audio), size))
+        else:
+            probe, audio_stream = self.probe(video_path)
+            self._log_stream_info(video_path, probe, audio_stream)
+            duration = AudioLoader.get_duration(probe)
+
+            def open_blocks():
+                return self.extractor.stream(video_path, audio_stream, stop_event=stop_event)
+
+        blocks = open_blocks()
+        windows = pack_windows(vad.regions(blocks), window_seconds)
+        analysis, head = self._detect_speech_windows(windows)
+        speech_seconds = vad.speech_samples / SAMPLE_RATE
+        stopped = stop_event is not None and stop_event.is_set()
+        if not head and vad.speech_samples == 0 and not vad.is_digital_silence and not stopped:
+            # 発話を区切れない音声は全体を保持せず、もう一度読み込んでモデルに判定させる
+            self._log("VADで発話区間が見つからないため、固定長のウィンドウで判定します")
+            blocks = open_blocks()
+            windows = pack_windows(self._fixed_regions(blocks, window_seconds), window_seconds)
+            analysis, head = self._detect_speech_windows(windows)
+            speech_seconds = vad.total_samples / SAMPLE_RATE
+        if not head:
+            blocks.close()  # ffmpegを止める
+            return self._no_speech_result(video_path, duration, analysis)
+        windows = itertools.chain(head, windows)
+        options = self._transcribe_options(analysis['language'], analysis['preset'])
+        if self.batch_size > 1:
+            # 同じファイルの複数ウィンドウをまとめてデコード（保持するのはbatch_size分のみ）
+            outputs = (output for batch in self._batched_windows(windows, stop_event)
+                       for output in self._decode_windows_safely(batch, options))
+        else:
+            outputs = self._transcribe_windows(windows, stop_event, options)
+        result = self._collect_windows(outputs)
+
+        total = vad.total_samples / SAMPLE_RATE
+        self._log(f"発話区間: {speech_seconds:.2f}秒 / {total:.2f}秒"
+                  f"（発話率 {speech_seconds / total * 100 if total else 0.0:.1f}%）")
+        result.update(duration=total, language=analysis['language'], preset=analysis['preset'],
+                      language_probability=analysis['language_probability'])
+        return result
+
+    def _detect_speech_windows(self, windows):
+        """DETECT_WINDOWS個ずつ事前判定し、発話のある最初のグループまで読み進める
+
+        (判定結果, 発話のあったグループのウィンドウ) を返します。無音と判定したグループは
+        認識せずに捨て、最後まで発話が無ければウィンドウは空のリストです。
+        """
+        analysis = self.analyze([])
+        skipped = 0
+        while True:
+            head = list(itertools.islice(windows, DETECT_WINDOWS))
+            if not head:
+                return analysis, head
+            analysis = self.analyze([window.audio for window in head])
+            if analysis['speech']:
+                if skipped:
+                    self._log(f"発話の無いウィンドウを{skipped}個読み飛ばしました")
+                return analysis, head
+            skipped += len(head)
+
+    @staticmethod
+    def _fixed_regions(blocks, window_seconds):
+        """ブロックをwindow_seconds秒ごとに区切った (開始サンプル位置, 音声)（VADを使わない場合）"""
+        offset = 0
+        for block in blocks:
+            yield from fixed_regions(block, window_seconds, offset)
+            offset += len(block)
+
+    def _transcribe_windows(self, windows, stop_event=None, options=None):
+        """ウィンドウを1つずつwhisper.transcribeで認識し (ウィンドウ, 結果) を返す"""
+        options = options or self._transcribe_options()
+        for window in windows:
+            if stop_event is not None and stop_event.is_set():
+                break
+            self.device_manager.reserve(self.model_name, 1)
+            yield window, self.backend.transcribe(self.model, window.audio, verbose=None, **options)
+
+    def _batched_windows(self, windows, stop_event=None):
+        batch = []
+        for window in windows:
+            if stop_event is not None and stop_event.is_set():
+                return
+            batch.append(window)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _decode_windows(self, windows, options=None):
+        """ウィンドウのリストを1バッチでデコードし (ウィンドウ, 結果) のリストを返す
+
+        バッチデコードは温度0の貪欲法のみです（プリセットのビーム幅は使いません）。
+        """
+        outputs = self.backend.decode_batch(self.model, [window.audio for window in windows],
+                                            options or self._transcribe_options())
+        return list(zip(windows, outputs))
+
+    def _decode_windows_safely(self, windows, options=None):
+        """_decode_windowsのメモリ不足対策版
+
+        GPUメモリが足りなければバッチを半分に分けて再試行し（以降のbatch_sizeも下げる）、
+        1ウィンドウでも足りなければCPUでデコードします。
+        """
+        try:
+            self.device_manager.reserve(self.model_name, len(windows))
+            return self._decode_windows(windows, options)
+        except Exception as e:
+            if not self.device_manager.is_oom(e):
+                raise
+            self.device_manager.empty_cache()
+            if len(windows) > 1:
+                half = len(windows) // 2
+                self.batch_size = max(min(self.batch_size, half), 1)
+                self._log(f"GPUメモリ不足のためバッチサイズを{self.batch_size}に下げて再試行します",
+                          level=logging.WARNING)
+                return (self._decode_windows_safely(windows[:half], options)
+                        + self._decode_windows_safely(windows[half:], options))
+            self._log("GPUメモリ不足のためCPUでデコードします", level=logging.WARNING)
+            return self.cpu_fallback()._decode_windows(windows, options)
+
+    @staticmethod
+    def _collect_windows(outputs):
+        """(ウィンドウ, 結果) の列から元のタイムラインでの認識結果を組み立てる"""
+        segments = []
+        texts = []
+        language = None
+        for window, result in outputs:
+            language = language or result.get("language")
+            for segment in result.get("segments", []):
+                segment = window.remap_segment(segment)
+                segment["id"] = len(segments)
+                segments.append(segment)
+                texts.append(segment["text"])
+        return {"text": "".join(texts), "segments": segments, "language": language}
+
+    def transcribe_batch(self, items, stop_event=None):
+        """複数ファイルの発話ウィンドウをまとめてデコード（短いクリップ向け）
+
+        itemsは (動画パス, 音声) のリストです。各ファイルをVADで発話ウィンドウに分け、
+        ファイルをまたいでbatch_size個ずつ1回のエンコーダ/デコーダに通し、
+        結果を元のファイルと時間軸に戻します。ファイルごとに結果または例外を返します。
+        """
         if not self.is_model_ready():
             self.wait_for_model()
 
+        windows = []  # (ファイル番号, SpeechWindow)
+        outcomes = [None] * len(items)
+        silent = [False] * len(items)
+        for index, (video_path, audio) in enumerate(items):
+            try:
+                # VADで発話が見つからなくても、デジタル無音でなければ全体をデコードしてモデルに判定させる
+                vad = EnergyVAD(fallback=True)
+                for window in pack_windows(vad.regions([audio])):
+                    windows.append((index, window))
+                silent[index] = vad.is_digital_silence
+            except Exception as e:
+                outcomes[index] = e
+
+        self._log(f"\nバッチ処理開始: {len(items)}ファイル / {len(windows)}ウィンドウ"
+                  f"（バッチサイズ {self.batch_size}）")
+        per_file = [[] for _ in items]
+        started = time.perf_counter()
+        offset = 0
+        while offset < len(windows):
+            if stop_event is not None and stop_event.is_set():
+                raise RuntimeError("処理がキャンセルされました")
+            # メモリ不足でbatch_sizeが下がった場合は以降のバッチも小さくする
+            batch = windows[offset:offset + self.batch_size]
+            offset += len(batch)
+            try:
+                decoded = self._decode_windows_safely([window for _, window in batch])
+            except Exception as e:
+                self._log(f"バッチ処理エラー: {str(e)}", level=logging.ERROR)
+                for index, _ in batch:
+                    outcomes[index] = e
+                continue
+            for (index, _), output in zip(batch, decoded):
+                per_file[index].append(output)
+        elapsed = time.perf_counter() - started
+
+        # バッチ全体の所要時間を音声長で按分してファイルごとのスパンとして記録
+        total_audio = sum(len(audio) for _, audio in items) or 1
+        for index, (video_path, audio) in enumerate(items):
+            if outcomes[index] is not None:
+                continue
+            result = self._collect_windows(per_file[index])
+            result["duration"] = len(audio) / SAMPLE_RATE
+            if silent[index]:
+                result["no_speech"] = True  # デジタル無音のためデコードしていない
+            outcomes[index] = result
+            self.instrumentation.record('transcribe', elapsed * len(audio) / total_audio,
+                                        file=video_path, batched=True)
+        return outcomes
+
+    def transcribe(self, video_path, audio=None, chunked=False, stop_event=None):
+        """音声認識のみを実行し、Whisperの結果を返します
+
+        audioが渡されない場合は抽出から行います（分割モードではストリーミング抽出）。
+        """
+        if not self.is_model_ready():
+            self.wait_for_model()
+
+        if not chunked and audio is None:
+            audio = self.load_audio(video_path, stop_event=stop_event)
+
+        try:
+            return self._transcribe_on_device(video_path, audio, chunked, stop_event)
+        except Exception as e:
+            if not self.device_manager.is_oom(e):
+                raise
+            # メモリ不足はファイルを失敗にせず、バッチを下げるかCPUで再実行
+            self.device_manager.empty_cache()
+            self._log_memory("メモリ不足時")
+            if self.batch_size > 1:
+                self.batch_size = max(self.batch_size // 2, 1)
+                self._log(f"GPUメモリ不足のためバッチサイズを{self.batch_size}に下げて再実行します: {video_path}",
+                          level=logging.WARNING)
+                return self.transcribe(video_path, audio, chunked, stop_event)
+            self._log(f"GPUメモリ不足のためCPUで再実行します: {video_path}", level=logging.WARNING)
+            return self.cpu_fallback().transcribe(video_path, audio, chunked, stop_event)
+
+    def _transcribe_on_device(self, video_path, audio, chunked, stop_event):
+        if not chunked and self.batch_size > 1:
+            # バッチモードでは1ファイルでも発話ウィンドウ単位でまとめてデコード
+            outcome = self.transcribe_batch([(video_path, audio)], stop_event=stop_event)[0]
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        model = self.model
+        self._log("\nWhisper処理開始...")
+        try:
+            # Whisperで音声認識
+            if chunked:
+                with self.instrumentation.span('transcribe', file=video_path, chunked=chunked):
+                    result = self.transcribe_chunked(video_path, stop_event=stop_event, audio=audio)
+            else:
+                # 発話の無いファイルはここで終わる（デジタル無音ならモデルも使わない）
+                with self.instrumentation.span('detect', file=video_path):
+                    analysis = self.analyze(self.sample_windows(audio))
+                if not analysis['speech']:
+                    return self._no_speech_result(video_path, len(audio) / SAMPLE_RATE, analysis)
+                with self.instrumentation.span('transcribe', file=video_path, chunked=chunked,
+                                               preset=analysis['preset']):
+                    self.device_manager.reserve(self.model_name, 1)
+                    result = self.backend.transcribe(
+                        model, audio, verbose=True,
+                        **self._transcribe_options(analysis['language'], analysis['preset']))
+                result.update(duration=len(audio) / SAMPLE_RATE, preset=analysis['preset'],
+                              language_probability=analysis['language_probability'])
+        except Exception as e:
+            self._log(f"Whisper処理エラー: {str(e)}", level=logging.ERROR)
+            self._log_memory("エラー時")
+            raise
+
+        self._log_memory("Whisper処理後")
+
+        if not result or 'segments' not in result:
+            raise ValueError(f"音声認識結果が不正です: {video_path}")
+        return result
+
+    def write_outputs(self, video_path, result, output_dir=None, generate_edl=True, generate_srt=True,
+                      generate_mlt=False):
+        """認識結果のセグメントを整理し、EDL、SRT、MLTファイルを生成します
+
+        セグメントはpostprocessorで1回だけ整え、すべてのフォーマットで同じものを使います。
+        単語タイムスタンプがあれば <動画名>.words.npz として保存します（字幕の区切り直し・検索用）。
+        """
         if output_dir is None:
             output_dir = os.path.dirname(video_path)
-            
-        audio_path = None
+
+        # デバッグ用にセグメント情報を出力（1件ずつではなく1回のログにまとめる）
+        self._log(f"\n認識結果 - {video_path}:\n" + "\n".join(
+            f"Start: {seg['start']:.2f}, End: {seg['end']:.2f}, Text: {seg['text']}"
+            for seg in result.get("segments", [])
+        ), level=logging.DEBUG)
+
+        # セグメントの後処理（全フォーマット共通）
+        with self.instrumentation.span('postprocess', file=video_path):
+            valid_segments = self.postprocessor.process(result["segments"], file_name=os.path.basename(video_path))
+
+        self._log(f"\n有効なセグメント数: {len(valid_segments)}/{len(result['segments'])}")
+        self.instrumentation.count(video_path, 'segments', len(valid_segments))
+        self.instrumentation.count(video_path, 'audio_seconds', result.get("duration") or 0.0)
+
+        base_name = os.path.splitext(os.path.basename(video_path))[0]
+        edl_path = None
+        srt_path = None
+        mlt_path = None
+        words_path = None
+
+        # 単語ストアの保存
+        store = WordStore.from_segments(valid_segments)
+        if len(store):
+            words_path = WordStore.path_for(video_path, output_dir)
+            with self.instrumentation.span('format.words', file=video_path):
+                store.save(words_path)
+
+        # EDLファイルの生成
+        if generate_edl:
+            edl_path = os.path.join(output_dir, f"{base_name}.edl")
+            with self.instrumentation.span('format.edl', file=video_path), \
+                    open(edl_path, "w", encoding="utf-8") as f:
+                EDLFormatter.write(valid_segments, f, title=f"Transcription - {base_name}")
+            self._log(f"EDLファイル生成完了: {edl_path}")
+
+        # SRTファイルの生成
+        if generate_srt:
+            srt_path = os.path.join(output_dir, f"{base_name}.srt")
+            with self.instrumentation.span('format.srt', file=video_path), \
+                    open(srt_path, "w", encoding="utf-8") as f:
+                SRTFormatter.write(valid_segments, f, include_filename=True)
+            self._log(f"SRTファイル生成完了: {srt_path}")
+
+        # MLTファイルの生成（単一ファイルの場合）
+        if generate_mlt:
+            mlt_path = os.path.join(output_dir, f"{base_name}.mlt")
+            with self.instrumentation.span('format.mlt', file=video_path), \
+                    open(mlt_path, "w", encoding="utf-8") as f:
+                MLTFormatter.write({video_path: valid_segments}, f, title=f"Transcription - {base_name}")
+            self._log(f"MLTファイル生成完了: {mlt_path}")
+
+        return {
+            "edl_path": edl_path,
+            "srt_path": srt_path,
+            "mlt_path": mlt_path,
+            "words_path": words_path,
+            "segments": valid_segments,
+            "text": result["text"],
+            "duration": result.get("duration"),
+            "language": result.get("language"),
+            "preset": result.get("preset"),
+            "no_speech": result.get("no_speech", False),
+            "incremental": result.get("incremental"),
+            "file_path": video_path
+        }
+
+    def process_video(self, video_path, output_dir=None, generate_edl=True, generate_srt=True, generate_mlt=False,
+                      save_audio=False, chunked=False, force_transcribe=False, incremental=False):
+        """動画を処理し、EDL、SRT、MLTファイルを生成します
+
+        save_audio=Trueの場合のみ、抽出した音声をdebug_<name>.wavとして保存します。
+        chunked=Trueの場合は無音を除いた発話区間のみを分割して認識します（長時間収録向け）。
+        キャッシュに同じ音声・設定の結果があれば、force_transcribe=Trueでない限り再認識しません。
+        incremental=Trueの場合は前回文字起こしした版と比べて変わった区間だけを文字起こしします
+        （分割モードとキャッシュ無効時は全体を文字起こしします）。
+        """
+        key = self.cache_key(video_path, chunked)
+        cached = None if force_transcribe else self.load_cached(key)
+        if cached is not None:
+            self.extractor.discard(video_path)
+            return self.write_outputs(
+                video_path, cached, output_dir,
+                generate_edl=generate_edl,
+                generate_srt=generate_srt,
+                generate_mlt=generate_mlt
+            )
+
+        if not self.is_model_ready():
+            self.wait_for_model()
+
         try:
             # GPUメモリをクリア
-            if self.device == "cuda":
-                torch.cuda.empty_cache()
-                self._log(f"\nGPUメモリ使用量（処理前）: {torch.cuda.memory_allocated() / 1024**2:.2f}MB")
-
-            # 音声抽出
-            audio_path = self.extract_audio(video_path)
-            
-            self._log("\nWhisper処理開始...")
-            try:
-                # Whisperで音声認識
-                result = self.model.transcribe(
-                    audio_path,
-                    language="ja",
-                    task="transcribe",
-                    verbose=True,
-                    initial_prompt=None,
-                    condition_on_previous_text=False,
-                    temperature=0.0,
-                    best_of=1,
-                    beam_size=1,
-                    word_timestamps=True,
-                    fp16=True
-                )
-            except Exception as e:
-                self._log(f"Whisper処理エラー: {str(e)}", level=logging.ERROR)
-                if self.device == "cuda":
-                    self._log(f"GPUメモリ使用量（エラー時）: {torch.cuda.memory_allocated() / 1024**2:.2f}MB")
-                raise
-            
-            if self.device == "cuda":
-                self._log(f"GPUメモリ使用量（Whisper処理後）: {torch.cuda.memory_allocated() / 1024**2:.2f}MB")
-            
-            # デバッグ用にセグメント情報を出力
-            self._log(f"\n認識結果 - {video_path}:")
-            for seg in result.get("segments", []):
-                self._log(f"Start: {seg['start']:.2f}, End: {seg['end']:.2f}, Text: {seg['text']}")
-            
-            if not result or 'segments' not in result:
-                raise ValueError(f"音声認識結果が不正です: {video_path}")
-
-            # セグメントの前処理
-            valid_segments = []
-            file_name = os.path.basename(video_path)
-            for segment in result["segments"]:
-                if segment["end"] > segment["start"] and segment["text"].strip():
-                    segment["file_name"] = file_name
-                    valid_segments.append(segment)
-
-            self._log(f"\n有効なセグメント数: {len(valid_segments)}/{len(result['segments'])}")
-
-            base_name = os.path.splitext(os.path.basename(video_path))[0]
-            edl_path = None
-            srt_path = None
-            mlt_path = None
-            
-            # EDLファイルの生成
-            if generate_edl:
-                edl_path = os.path.join(output_dir, f"{base_name}.edl")
-                edl_content = EDLFormatter.generate(valid_segments, title=f"Transcription - {base_name}")
-                with open(edl_path, "w", encoding="utf-8") as f:
-                    f.write(edl_content)
-                self._log(f"EDLファイル生成完了: {edl_path}")
-                
-            # SRTファイルの生成
-            if generate_srt:
-                srt_path = os.path.join(output_dir, f"{base_name}.srt")
-                srt_content = SRTFormatter.generate(valid_segments, include_filename=True)
-                with open(srt_path, "w", encoding="utf-8") as f:
-                    f.write(srt_content)
-                self._log(f"SRTファイル生成完了: {srt_path}")
-                
-            # MLTファイルの生成（単一ファイルの場合）
-            if generate_mlt:
-                mlt_path = os.path.join(output_dir, f"{base_name}.mlt")
-                mlt_content = MLTFormatter.generate({video_path: valid_segments})
-                with open(mlt_path, "w", encoding="utf-8") as f:
-                    f.write(mlt_content)
-                self._log(f"MLTファイル生成完了: {mlt_path}")
-                
-            return {
-                "edl_path": edl_path,
-                "srt_path": srt_path,
-                "mlt_path": mlt_path,
-                "segments": valid_segments,
-                "text": result["text"],
-                "file_path": video_path
-            }
-            
+            self.device_manager.empty_cache()
+            self._log_memory("処理前")
+
+            # 音声抽出（メモリ内で完結し、Whisperに配列を直接渡す）
+            audio = None
+            if not chunked:
+                audio = self.load_audio(video_path)
+                if save_audio:
+                    self.extract_audio(video_path, audio=audio)
+            elif save_audio:
+                self._log("分割モードでは音声ファイルの保存をスキップします", level=logging.WARNING)
+
+            fingerprint = plan = None
+            if incremental and audio is not None and key is not None:
+                fingerprint, plan = self.incremental_plan(video_path, key, audio)
+            if plan is not None:
+                result = self.transcribe_incremental(video_path, audio, plan)
+            else:
+                result = self.transcribe(video_path, audio=audio, chunked=chunked)
+            self.store_cached(key, result)
+            if fingerprint is not None:
+                self.store_version(video_path, key, fingerprint)
+            return self.write_outputs(
+                video_path, result, output_dir,
+                generate_edl=generate_edl,
+                generate_srt=generate_srt,
+                generate_mlt=generate_mlt
+            )
+
         except Exception as e:
             self._log(f"処理エラー - {video_path}: {str(e)}", level=logging.ERROR)
             raise
-            
-        finally:
-            if self.device == "cuda":
-                torch.cuda.empty_cache()
-                self._log(f"GPUメモリ使用量（終了時）: {torch.cuda.memory_allocated() / 1024**2:.2f}MB")
 
-# インスタンス生成（GPUモードをデフォルトに）
-transcriber = WhisperTranscriber(model_name="medium", use_gpu=True) 
\ No newline at end of file
+        finally:
+            self.extractor.discard(video_path)
+            self.device_manager.empty_cache()
+            self._log_memory("終了時")